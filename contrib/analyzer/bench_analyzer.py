@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+#
+# Benchmark sssctl analyze on a set of log files
+#
+# Every command is run several times in a fresh interpreter. The best wall
+# clock time, the rate of log lines read per second and the peak resident
+# set size are printed, so that performance regressions show up in review.
+# Without --logdir, synthetic logs are generated by gen_logs.py first:
+#
+#   contrib/analyzer/bench_analyzer.py --size 200M
+#   contrib/analyzer/bench_analyzer.py --logdir /var/log/sssd -- --jobs 1
+#
+# Arguments after '--' are passed to every analyzer command.
+#
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+import subprocess
+
+CONTRIB_DIR = os.path.dirname(os.path.abspath(__file__))
+ANALYZER_DIR = os.path.join(os.path.dirname(os.path.dirname(CONTRIB_DIR)),
+                            'src', 'tools', 'analyzer')
+
+RUN = 'from sssd import sss_analyze; sss_analyze.run()'
+
+RESPONDERS = ['ifp', 'nss', 'pam', 'sudo', 'autofs', 'ssh', 'pac', 'kcm']
+
+
+def count_lines(path):
+    """ Count the lines of a log file """
+    lines = 0
+    with open(path, 'rb') as file:
+        while True:
+            data = file.read(16 * 1024 * 1024)
+            if not data:
+                return lines
+            lines += data.count(b'\n')
+
+
+def find_cid(path):
+    """ Find a client ID logged in the middle of the log file """
+    with open(path, 'rb') as file:
+        file.seek(os.fstat(file.fileno()).st_size // 2)
+        for line in file:
+            start = line.find(b'[CID#')
+            if start >= 0:
+                end = line.find(b']', start)
+                return int(line[start + 5:end])
+    return 1
+
+
+def run(argv, env):
+    """
+    Run the analyzer once
+
+    Returns:
+        (seconds, peak RSS in KiB) tuple
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', RUN] + argv, env=env,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"sssctl analyze {' '.join(argv)} failed with "
+                           f"{proc.returncode}")
+    return elapsed, rusage.ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sssctl analyze')
+    parser.add_argument('--logdir', default=None,
+                        help='Log directory to benchmark with, synthetic '
+                        'logs are generated if not given')
+    parser.add_argument('--size', default='100M',
+                        help='Size of the generated logs (default 100M)')
+    parser.add_argument('--cid', type=int, default=None,
+                        help='Client ID to track (default: one logged in '
+                        'the middle of sssd_nss.log)')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Number of runs per command (default 3)')
+    parser.add_argument('--installed', action='store_true',
+                        help='Benchmark the installed sssd python package '
+                        'instead of the source tree')
+    parser.add_argument('extra', nargs='*',
+                        help='Arguments passed to every analyzer command')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = dict(os.environ)
+        if not args.installed:
+            # the analyzer sources are installed as the 'sssd' package
+            os.symlink(ANALYZER_DIR, os.path.join(tmpdir, 'sssd'))
+            env['PYTHONPATH'] = tmpdir
+
+        logdir = args.logdir
+        if logdir is None:
+            logdir = os.path.join(tmpdir, 'logs')
+            subprocess.run([sys.executable,
+                            os.path.join(CONTRIB_DIR, 'gen_logs.py'),
+                            '--size', args.size, logdir], check=True)
+
+        nss_log = os.path.join(logdir, 'sssd_nss.log')
+        backend_logs = [path for path in glob.glob(os.path.join(logdir,
+                                                                'sssd_*.log'))
+                        if not any(resp in path for resp in RESPONDERS)]
+        nss_lines = count_lines(nss_log)
+        all_lines = nss_lines + sum(count_lines(path)
+                                    for path in backend_logs)
+        cid = find_cid(nss_log) if args.cid is None else args.cid
+
+        base = ['--logdir', logdir] + args.extra
+        commands = [
+            (['request', 'list'], nss_lines),
+            (['request', 'list', '--verbose'], nss_lines),
+            (['request', 'show', str(cid)], all_lines),
+            (['request', 'show', str(cid), '--merge'], all_lines),
+        ]
+
+        print(f'{all_lines} lines, CID {cid}, {args.runs} runs\n')
+        print(f'{"seconds":>8}  {"lines/s":>10}  {"RSS MiB":>8}  command')
+        for command, lines in commands:
+            results = [run(base + command, env) for _ in range(args.runs)]
+            elapsed = min(result[0] for result in results)
+            rss = max(result[1] for result in results)
+            print(f'{elapsed:>8.3f}  {lines / elapsed:>10.0f}  '
+                  f'{rss / 1024:>8.1f}  {" ".join(command)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+#
+# Measure the startup time of the sssctl analyze tool
+#
+# Every command is run in a fresh interpreter several times, the minimum
+# and median wall clock times are printed. Run from the source tree:
+#
+#   contrib/analyzer/bench_startup.py
+#
+# or against the installed tool:
+#
+#   contrib/analyzer/bench_startup.py --installed
+#
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+SRCDIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+ANALYZER_DIR = os.path.join(SRCDIR, 'src', 'tools', 'analyzer')
+
+RUN = 'from sssd import sss_analyze; sss_analyze.run()'
+
+# Arguments of the measured commands, '{logdir}' is replaced by an empty
+# log directory
+COMMANDS = [
+    [],
+    ['--help'],
+    ['request', '--help'],
+    ['--logdir', '{logdir}', 'request', 'list'],
+    ['--logdir', '{logdir}', 'request', 'show', '1'],
+]
+
+
+def measure(argv, env, runs, code=RUN):
+    """
+    Run the analyzer repeatedly
+
+    Returns:
+        List of wall clock times in seconds
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code] + argv, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=False)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def import_times(env, count):
+    """
+    Print the slowest imports of 'sssctl analyze --help'
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', RUN,
+                           '--help'], env=env, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, text=True, check=False)
+    imports = []
+    for line in proc.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        imports.append((int(fields[1]), fields[2].rstrip()))
+
+    print('\nSlowest imports (cumulative, ms)')
+    for usec, name in sorted(imports, reverse=True)[:count]:
+        print(f'{usec / 1000:>8.1f}  {name}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup time '
+                                     'of sssctl analyze')
+    parser.add_argument('--runs', type=int, default=20,
+                        help='Number of runs per command (default 20)')
+    parser.add_argument('--installed', action='store_true',
+                        help='Measure the installed sssd python package '
+                        'instead of the source tree')
+    parser.add_argument('--imports', type=int, default=15, metavar='N',
+                        help='Print the N slowest imports (default 15)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = dict(os.environ)
+        if not args.installed:
+            # the analyzer sources are installed as the 'sssd' package
+            os.symlink(ANALYZER_DIR, os.path.join(tmpdir, 'sssd'))
+            env['PYTHONPATH'] = tmpdir
+        logdir = os.path.join(tmpdir, 'logs')
+        os.mkdir(logdir)
+        for name in ('sssd_nss.log', 'sssd_pam.log', 'sssd_test.log'):
+            open(os.path.join(logdir, name), 'w').close()
+
+        baseline = min(measure([], env, args.runs, 'pass'))
+        print(f'{"min":>8}  {"median":>8}  command (ms)')
+        for command in COMMANDS:
+            argv = [arg.format(logdir=logdir) for arg in command]
+            times = measure(argv, env, args.runs)
+            print(f'{min(times) * 1000:>8.1f}  '
+                  f'{statistics.median(times) * 1000:>8.1f}  '
+                  f'sssctl analyze {" ".join(command)}')
+        print(f'\nInterpreter startup without the analyzer: '
+              f'{baseline * 1000:.1f} ms')
+
+        if args.imports:
+            import_times(env, args.imports)
+
+
+if __name__ == '__main__':
+    main()
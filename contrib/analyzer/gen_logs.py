@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+#
+# Generate synthetic SSSD debug logs for benchmarking sssctl analyze
+#
+# The logs are written in the format of sss_vdebug_fn() with microsecond
+# timestamps and chain IDs: sssd_nss.log, sssd_pam.log and one
+# sssd_<domain>.log per domain. Client requests arrive at a configurable
+# rate and overlap in time, so that the lines of concurrent requests are
+# interleaved as in a busy deployment. Lines are streamed to the files,
+# memory use does not depend on the size of the logs.
+#
+#   contrib/analyzer/gen_logs.py --size 1G /tmp/sssd-logs
+#
+import os
+import sys
+import time
+import heapq
+import random
+import calendar
+import argparse
+
+SUFFIXES = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+# debug levels
+OP_FAILURE = 0x0040
+CONF_SETTINGS = 0x0100
+TRACE_FUNC = 0x0400
+TRACE_INTERNAL = 0x2000
+TRACE_ALL = 0x4000
+PERF_STAT = 0x20000
+TRACE_LDB = 0x10000
+
+BT_START = ('********************** PREVIOUS MESSAGE WAS TRIGGERED BY THE '
+            'FOLLOWING BACKTRACE:\n')
+BT_END = ('********************** BACKTRACE DUMP ENDS HERE '
+          '*********************************\n\n')
+
+NSS_PLUGINS = [
+    ('User by name', 'getpwnam', 'id'),
+    ('Initgroups by name', 'initgroups', 'id'),
+    ('Group by name', 'getgrnam', 'getent'),
+    ('User by ID', 'getpwuid', 'ls'),
+]
+PAM_COMMANDS = ['pam_cmd_authenticate', 'pam_cmd_acct_mgmt',
+                'pam_cmd_open_session']
+
+
+def parse_size(text):
+    """ Parse a size with an optional K, M, G or T suffix """
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in SUFFIXES:
+        return int(float(text[:-1]) * SUFFIXES[text[-1]])
+    return int(text)
+
+
+class LogWriter:
+    """
+    Write debug lines to a single log file
+    """
+    def __init__(self, path, program):
+        self.file = open(path, 'w', buffering=1024 * 1024)
+        self.program = program
+        self.second = None
+        self.stamp = None
+        self.size = 0
+
+    def line(self, timestamp, function, level, chain, msg):
+        """ Format a line as sss_vdebug_fn() does """
+        second = timestamp // 1000000
+        if second != self.second:
+            self.second = second
+            tm = time.gmtime(second)
+            self.stamp = (f'({tm.tm_year}-{tm.tm_mon:02d}-{tm.tm_mday:02d} '
+                          f'{tm.tm_hour:2d}:{tm.tm_min:02d}:{tm.tm_sec:02d}')
+        return (f'{self.stamp}:{timestamp % 1000000:06d}): [{self.program}] '
+                f'[{function}] ({level:#06x}): {chain}{msg}\n')
+
+    def write(self, text):
+        self.file.write(text)
+        self.size += len(text)
+
+    def close(self):
+        self.file.close()
+
+
+class Generator:
+    """
+    Simulate client requests and write the log lines they produce
+    """
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        # timestamps are local time of the simulated host, no time zone
+        self.now = calendar.timegm(time.strptime(args.start,
+                                                 '%Y-%m-%d %H:%M:%S')) \
+            * 1000000
+        os.makedirs(args.output, exist_ok=True)
+        self.nss = LogWriter(os.path.join(args.output, 'sssd_nss.log'),
+                             'nss')
+        self.pam = LogWriter(os.path.join(args.output, 'sssd_pam.log'),
+                             'pam')
+        self.domains = []
+        for domain in args.domains:
+            path = os.path.join(args.output, f'sssd_{domain}.log')
+            self.domains.append((domain, LogWriter(path, f'be[{domain}]')))
+        self.writers = [self.nss, self.pam] + [w for _, w in self.domains]
+        self.events = []
+        self.seq = 0
+        self.cid = 0
+        self.cr = 0
+        self.rid = {domain: 0 for domain in args.domains}
+        self.msgid = 0
+
+    def emit(self, writer, timestamp, function, level, chain, msg,
+             history=None):
+        """ Queue a line to be written in timestamp order """
+        text = writer.line(timestamp, function, level, chain, msg)
+        self.seq += 1
+        heapq.heappush(self.events, (timestamp, self.seq, writer, text))
+        if history is not None:
+            history.append(text)
+
+    def flush(self, until=None):
+        """ Write the queued lines logged before until """
+        while self.events and (until is None or self.events[0][0] < until):
+            _, _, writer, text = heapq.heappop(self.events)
+            writer.write(text)
+
+    def size(self):
+        return sum(writer.size for writer in self.writers)
+
+    def duration(self, median):
+        """ Random duration in microseconds around the median """
+        return max(1, int(self.random.lognormvariate(0, 0.6) * median))
+
+    def backend(self, start, resp, cid, name):
+        """
+        Simulate a data provider request linked to a responder request
+
+        Returns:
+            Timestamp of the end of the request
+        """
+        args = self.args
+        domain, writer = self.random.choice(self.domains)
+        self.rid[domain] += 1
+        rid = self.rid[domain]
+        chain = f'[RID#{rid}] '
+        target = 'Account' if resp == 'nss' else 'PAM Authenticate'
+        req = f'DP Request [{target} #{rid}]'
+        ts = start
+        self.emit(writer, ts, 'dp_attach_req', TRACE_FUNC, chain,
+                  f'{req}: REQ_TRACE: New request. [sssd.{resp} CID #{cid}] '
+                  f'Flags [0x0001].')
+        self.emit(writer, ts, 'dp_attach_req', TRACE_FUNC, chain,
+                  'Number of active DP request: 1')
+        for _ in range(self.random.randint(1, args.searches)):
+            ts += 20
+            self.msgid += 1
+            self.emit(writer, ts, 'sdap_get_generic_ext_step', TRACE_FUNC,
+                      chain, f'calling ldap_search_ext with '
+                      f'[(&(uid={name})(objectclass=posixAccount))]'
+                      f'[dc=example,dc=com].')
+            self.emit(writer, ts + 5, 'sdap_get_generic_ext_step',
+                      TRACE_INTERNAL, chain,
+                      f'ldap_search_ext called, msgid = {self.msgid}')
+            ts += self.duration(args.ldap_latency)
+            self.emit(writer, ts, 'sdap_get_generic_op_finished', TRACE_FUNC,
+                      chain, 'Search result: Success(0), no errmsg set')
+            self.emit(writer, ts + 10, 'ldb', TRACE_LDB, chain,
+                      'start ldb transaction (nesting: 0)')
+            ts += self.duration(200)
+            self.emit(writer, ts, 'ldb', TRACE_LDB, chain,
+                      'commit ldb transaction (nesting: 0)')
+        for _ in range(args.noise):
+            self.emit(writer, ts, 'sbus_dispatch', TRACE_ALL, '',
+                      'Dispatching.')
+        ts += 50
+        self.emit(writer, ts, 'dp_req_done', TRACE_FUNC, chain,
+                  f'{req}: Request handler finished [0]: Success')
+        self.emit(writer, ts, 'dp_req_done', PERF_STAT, chain,
+                  f'{req}: Handling request took {ts - start} microseconds.')
+        self.emit(writer, ts + 20, 'dp_req_destructor', TRACE_FUNC, chain,
+                  f'{req}: Request removed.')
+        return ts + 20
+
+    def backtrace(self, writer, ts, function, chain, msg, history):
+        """ Log an error message followed by a backtrace dump """
+        text = writer.line(ts, function, OP_FAILURE, chain, msg)
+        history.append(text)
+        dump = text + BT_START
+        for line in history[-self.args.backtrace_lines:]:
+            dump += '   *  ' + line
+        dump += BT_END
+        self.seq += 1
+        heapq.heappush(self.events, (ts, self.seq, writer, dump))
+
+    def nss_request(self, start):
+        args = self.args
+        self.cid += 1
+        cid = self.cid
+        chain = f'[CID#{cid}] '
+        history = []
+        plugin, _, cmd = self.random.choice(NSS_PLUGINS)
+        name = f'user{self.random.randint(1, args.users)}'
+        domain = self.random.choice(args.domains)
+        ts = start
+        self.emit(self.nss, ts, 'accept_fd_handler', TRACE_FUNC, '',
+                  f'[CID#{cid}] Client [cmd {cmd}][uid 0][0x55d1][22] '
+                  f'connected!', history)
+        for _ in range(self.random.randint(1, args.fanout)):
+            self.cr += 1
+            cr = f'CR #{self.cr}: '
+            ts += 100
+            self.emit(self.nss, ts, 'cache_req_set_plugin', TRACE_INTERNAL,
+                      chain, f'{cr}Setting "{plugin}" plugin', history)
+            self.emit(self.nss, ts, 'cache_req_send', TRACE_FUNC, chain,
+                      f"{cr}REQ_TRACE: New request [CID #{cid}] '{plugin}'",
+                      history)
+            self.emit(self.nss, ts + 10, 'cache_req_process_input',
+                      TRACE_FUNC, chain,
+                      f'{cr}Parsing input name [{name}@{domain}]', history)
+            self.emit(self.nss, ts + 20, 'cache_req_set_domain', TRACE_FUNC,
+                      chain, f'{cr}Using domain [{domain}]', history)
+            self.emit(self.nss, ts + 30, 'cache_req_search_send', TRACE_FUNC,
+                      chain, f'{cr}Looking up {name}@{domain}', history)
+            ts += 40
+            if self.random.random() < args.hit_ratio:
+                ts += self.duration(100)
+                self.emit(self.nss, ts, 'cache_req_search_send', TRACE_FUNC,
+                          chain, f'{cr}Returning [{name}@{domain}] from '
+                          f'cache', history)
+            else:
+                self.emit(self.nss, ts, 'cache_req_search_dp', TRACE_FUNC,
+                          chain, f'{cr}Looking up [{name}@{domain}] in data '
+                          f'provider', history)
+                ts = self.backend(ts + 50, 'nss', cid, name) + 50
+            ts += 20
+            # failures and misses end in cache_req_process_result, only
+            # found objects go through the overlay to cache_req_done
+            outcome = self.random.random()
+            if outcome < args.error_rate:
+                self.backtrace(self.nss, ts, 'cache_req_process_result',
+                               chain,
+                               f'{cr}Finished: Error 5: Input/output error',
+                               history)
+            elif outcome < args.error_rate + args.not_found_ratio:
+                self.emit(self.nss, ts, 'cache_req_process_result',
+                          TRACE_FUNC, chain, f'{cr}Finished: Not found',
+                          history)
+            else:
+                self.emit(self.nss, ts, 'cache_req_done', TRACE_FUNC, chain,
+                          f'{cr}Finished: Success', history)
+
+    def pam_request(self, start):
+        args = self.args
+        self.cid += 1
+        cid = self.cid
+        chain = f'[CID#{cid}] '
+        name = f'user{self.random.randint(1, args.users)}'
+        ts = start
+        self.emit(self.pam, ts, 'accept_fd_handler', TRACE_FUNC, '',
+                  f'[CID#{cid}] Client [cmd sshd][uid 0][0x55e1][23] '
+                  f'connected to privileged pipe!')
+        command = self.random.choice(PAM_COMMANDS)
+        self.emit(self.pam, ts + 50, command, CONF_SETTINGS, chain,
+                  f'entering {command}')
+        self.emit(self.pam, ts + 100, 'pam_dp_send_req', CONF_SETTINGS,
+                  chain, 'Sending request with the following data:')
+        self.emit(self.pam, ts + 100, 'pam_print_data', CONF_SETTINGS,
+                  chain, f'user: {name}')
+        ts = self.backend(ts + 150, 'pam', cid, name) + 50
+        self.emit(self.pam, ts, 'pam_reply', TRACE_ALL, chain,
+                  'pam_reply initially called with result [0]: Success. '
+                  'this result might be changed during processing')
+
+    def run(self):
+        args = self.args
+        requests = 0
+        rate = args.rate / 1000000
+        while True:
+            if args.requests is not None and requests >= args.requests:
+                break
+            if args.size is not None and requests % 64 == 0 \
+               and self.size() >= args.size:
+                break
+            # everything queued before the next arrival is final
+            self.now += max(1, int(self.random.expovariate(rate)))
+            self.flush(self.now)
+            if self.random.random() < args.pam_ratio:
+                self.pam_request(self.now)
+            else:
+                self.nss_request(self.now)
+            requests += 1
+        self.flush()
+        for writer in self.writers:
+            writer.close()
+        return requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic SSSD '
+                                     'debug logs')
+    parser.add_argument('output', help='Directory to write the logs to')
+    parser.add_argument('--size', type=parse_size, default=None,
+                        help='Approximate total size of the logs, e.g. 100M '
+                        'or 20G (default 10M if --requests is not given)')
+    parser.add_argument('--requests', type=int, default=None,
+                        help='Number of client requests to generate')
+    parser.add_argument('--rate', type=float, default=200,
+                        help='Client requests per second (default 200)')
+    parser.add_argument('--domains', nargs='+', default=['LDAP'],
+                        help='Domain names, one backend log each '
+                        '(default LDAP)')
+    parser.add_argument('--fanout', type=int, default=2,
+                        help='Maximum cache_req requests per client '
+                        'connection (default 2)')
+    parser.add_argument('--searches', type=int, default=3,
+                        help='Maximum LDAP searches per data provider '
+                        'request (default 3)')
+    parser.add_argument('--hit-ratio', type=float, default=0.6,
+                        help='Share of requests answered from the cache '
+                        '(default 0.6)')
+    parser.add_argument('--pam-ratio', type=float, default=0.1,
+                        help='Share of PAM requests (default 0.1)')
+    parser.add_argument('--error-rate', type=float, default=0.002,
+                        help='Share of failing requests, logged with a '
+                        'backtrace dump (default 0.002)')
+    parser.add_argument('--not-found-ratio', type=float, default=0.05,
+                        help='Share of requests for objects which do not '
+                        'exist (default 0.05)')
+    parser.add_argument('--backtrace-lines', type=int, default=10,
+                        help='Lines per backtrace dump (default 10)')
+    parser.add_argument('--ldap-latency', type=int, default=5000,
+                        help='Median LDAP search time in microseconds '
+                        '(default 5000)')
+    parser.add_argument('--noise', type=int, default=2,
+                        help='Unrelated backend lines per data provider '
+                        'request (default 2)')
+    parser.add_argument('--users', type=int, default=10000,
+                        help='Number of distinct user names (default 10000)')
+    parser.add_argument('--start', default='2022-07-08 10:00:00',
+                        help='Time of the first request, '
+                        'YYYY-MM-DD HH:MM:SS')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed (default 0)')
+    args = parser.parse_args()
+    if args.size is None and args.requests is None:
+        args.size = 10 * SUFFIXES['M']
+
+    start = time.perf_counter()
+    generator = Generator(args)
+    requests = generator.run()
+    elapsed = time.perf_counter() - start
+    print(f'Generated {requests} requests, {generator.size() / 1024 ** 2:.1f} '
+          f'MiB in {elapsed:.1f} s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
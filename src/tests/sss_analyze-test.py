@@ -0,0 +1,1381 @@
+#!/usr/bin/env python3
+#  SSSD
+#
+#  Unit tests for the sss_analyze log analyzer
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import sys
+import gzip
+import atexit
+import argparse
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import unittest
+
+from collections import deque
+from unittest import mock
+
+SRC_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__),
+                                        '..', 'tools', 'analyzer'))
+TEST_DIR = os.path.realpath(os.getenv('SSS_TEST_DIR') or ".")
+# the analyzer is installed as the sssd python package, import the in-tree
+# sources under that name
+MODPATH = tempfile.mkdtemp(prefix="tp_sss_analyze_", dir=TEST_DIR)
+os.symlink(SRC_DIR, os.path.join(MODPATH, 'sssd'))
+atexit.register(shutil.rmtree, MODPATH)
+sys.path.insert(0, MODPATH)
+
+from sssd.matcher import Matcher  # noqa: E402
+from sssd.log_record import LogRecord  # noqa: E402
+from sssd.log_record import parse_time, parse_timestamp  # noqa: E402
+from sssd.source_files import bisect_timestamp  # noqa: E402
+from sssd.source_files import filter_window  # noqa: E402
+from sssd.source_files import rotated_logfiles  # noqa: E402
+from sssd.log_index import LogIndex  # noqa: E402
+from sssd.log_follow import FollowedFile  # noqa: E402
+from sssd.source_reader import Reader  # noqa: E402
+from sssd.source_archives import select_logfiles, tag_host  # noqa: E402
+from sssd.source_archives import Archives, Tarball  # noqa: E402
+from sssd.child_processes import ChildProcesses  # noqa: E402
+from sssd.child_processes import child_program  # noqa: E402
+from sssd.trace_export import Span, TraceExporter  # noqa: E402
+from sssd.modules import request  # noqa: E402
+from sssd.modules.clients import SpaceSaving  # noqa: E402
+from sssd.modules.ldap import LdapAnalyzer, filter_template  # noqa: E402
+from sssd.modules import cache  # noqa: E402
+from sssd.modules.dp import DataProviderAnalyzer, DpRequest  # noqa: E402
+from sssd.modules.backtrace import BacktraceAnalyzer  # noqa: E402
+from sssd.modules.backtrace import message_template  # noqa: E402
+from sssd.modules.diff import DiffAnalyzer, mann_whitney  # noqa: E402
+from sssd.modules.failover import FailoverAnalyzer  # noqa: E402
+from sssd.modules.failover import parse_event  # noqa: E402
+from sssd.modules.latency import CacheRequest  # noqa: E402
+from sssd.modules.latency import RunningRequests  # noqa: E402
+from sssd.modules import db  # noqa: E402
+
+
+class MatcherTest(unittest.TestCase):
+    def test_search_any_pattern(self):
+        matcher = Matcher([r'CID #[0-9]+', r'Finished: '])
+        self.assertIsNotNone(matcher.search('New request [CID #1]'))
+        self.assertIsNotNone(matcher.search('CR #1: Finished: Success'))
+        self.assertIsNone(matcher.search('Looking up user1@LDAP'))
+
+    def test_literals_prefilter(self):
+        matcher = Matcher([r'CID #[0-9]+'], ['REQ_TRACE'])
+        # the pattern matches, but none of the literals is present
+        self.assertFalse(matcher.prefilter('New request [CID #1]'))
+        self.assertIsNone(matcher.search('New request [CID #1]'))
+        self.assertIsNotNone(matcher.search('REQ_TRACE: New request '
+                                            '[CID #1]'))
+        # the literal alone is not enough
+        self.assertIsNone(matcher.search('REQ_TRACE: Finished'))
+
+    def test_no_patterns(self):
+        matcher = Matcher([])
+        self.assertIsNone(matcher.search('anything'))
+        self.assertEqual(list(matcher.scan(b'anything\n')), [])
+
+    def test_scan_bytes(self):
+        buf = (b'(1) [nss] [a] (0x0400): [CID#1] connected!\n'
+               b'(2) [nss] [b] (0x0400): [CID#1] REQ_TRACE: CID #1\n'
+               b'(3) [nss] [c] (0x0400): REQ_TRACE: nothing\n'
+               b'(4) [nss] [d] (0x0400): [CID#2] REQ_TRACE: CID #2')
+        matcher = Matcher([r'REQ_TRACE: CID #[0-9]+'], ['REQ_TRACE'])
+        # lines are returned with their newline, the last line has none
+        self.assertEqual(list(matcher.scan(buf)),
+                         [b'(2) [nss] [b] (0x0400): [CID#1] REQ_TRACE: '
+                          b'CID #1\n',
+                          b'(4) [nss] [d] (0x0400): [CID#2] REQ_TRACE: '
+                          b'CID #2'])
+
+    def test_scan_range(self):
+        buf = b'match 1\nother\nmatch 2\nmatch 3\n'
+        matcher = Matcher([r'match [0-9]'], ['match'])
+        start = buf.index(b'other')
+        end = buf.index(b'match 3')
+        self.assertEqual(list(matcher.scan(buf, start, end)),
+                         [b'match 2\n'])
+
+    def test_scan_without_literals(self):
+        buf = b'a CID #1\nb\nc CID #22\n'
+        matcher = Matcher([r'CID #[0-9]+'])
+        self.assertEqual(list(matcher.scan(buf)),
+                         [b'a CID #1\n', b'c CID #22\n'])
+
+    def test_scan_same_as_search(self):
+        lines = ['[CID#1] Client [cmd id] connected!\n',
+                 'CR #1: Finished: Success\n',
+                 'Finished without CR\n',
+                 'CR #2: Using domain [LDAP]\n']
+        matcher = Matcher([r'CR #[0-9]+: Finished: ', r'\[cmd '],
+                          ['Finished: ', '[cmd'])
+        expected = [line for line in lines if matcher.search(line)]
+        found = [line.decode() for line in
+                 matcher.scan(''.join(lines).encode())]
+        self.assertEqual(found, expected)
+
+
+def log_line(second, msg='msg'):
+    """ Debug log line logged at the given second of 2022-07-08 10:00 """
+    return f'(2022-07-08 10:00:{second:02}:000100): [nss] ' \
+           f'[cache_req_send] (0x0400): {msg}\n'
+
+
+class LogRecordTest(unittest.TestCase):
+    def test_responder(self):
+        record = LogRecord('(2022-07-08 10:05:01:000123): [nss] '
+                           '[cache_req_send] (0x0400): [CID#5] CR #3: New '
+                           'request [CID #5] \'User by name\'\n')
+        self.assertTrue(record.valid)
+        self.assertFalse(record.backtrace)
+        self.assertEqual(record.stamp, '2022-07-08 10:05:01:000123')
+        self.assertEqual(record.timestamp,
+                         parse_time('2022-07-08 10:05:01') + 123)
+        self.assertEqual(record.component, 'nss')
+        self.assertIsNone(record.host)
+        self.assertEqual(record.function, 'cache_req_send')
+        self.assertEqual(record.level, 0x400)
+        self.assertEqual(record.cid, 5)
+        self.assertIsNone(record.rid)
+        self.assertEqual(record.message,
+                         "CR #3: New request [CID #5] 'User by name'")
+
+    def test_backend(self):
+        record = LogRecord('(2022-07-08 10:05:01:000123): [be[LDAP]@host1] '
+                           '[dp_attach_req] (0x2000): [RID#7] DP Request '
+                           '[Account #7]: New request.\n')
+        self.assertEqual(record.component, 'be[LDAP]@host1')
+        self.assertEqual(record.host, 'host1')
+        self.assertEqual(record.level, 0x2000)
+        self.assertIsNone(record.cid)
+        self.assertEqual(record.rid, 7)
+        self.assertEqual(record.message,
+                         'DP Request [Account #7]: New request.')
+
+    def test_space_padded_hour(self):
+        # older versions pad the hour with a space
+        record = LogRecord('(2022-07-08  9:05:01:000123): [pam] '
+                           '[pam_cmd_authenticate] (0x0100): entering\n')
+        self.assertTrue(record.valid)
+        self.assertEqual(record.stamp, '2022-07-08  9:05:01:000123')
+        self.assertEqual(record.timestamp,
+                         parse_time('2022-07-08 09:05:01') + 123)
+        self.assertEqual(record.function, 'pam_cmd_authenticate')
+        self.assertIsNone(record.cid)
+        self.assertEqual(record.message, 'entering')
+
+    def test_no_usec(self):
+        record = LogRecord('(2022-07-08 10:05:01): [sssd] [main] '
+                           '(0x0010): Starting\n')
+        self.assertEqual(record.timestamp, parse_time('2022-07-08 10:05:01'))
+        self.assertEqual(record.message, 'Starting')
+
+    def test_journal(self):
+        record = LogRecord('2022-07-08 10:05:01.500000: CR #3: Finished: '
+                           'Success\n')
+        self.assertTrue(record.valid)
+        self.assertEqual(record.timestamp,
+                         parse_time('2022-07-08 10:05:01') + 500000)
+        self.assertIsNone(record.component)
+        self.assertEqual(record.message, 'CR #3: Finished: Success')
+
+    def test_invalid(self):
+        for line in ['   *  (2022-07-08 10:05:01:000123): [nss] [f] '
+                     '(0x0400): backtrace\n', 'garbage\n', '']:
+            with self.subTest(line=line):
+                record = LogRecord(line)
+                self.assertFalse(record.valid)
+                self.assertIsNone(record.timestamp)
+                self.assertIsNone(record.cid)
+                self.assertEqual(record.message, line.rstrip('\n'))
+        self.assertTrue(LogRecord('   *  backtrace').backtrace)
+
+    def test_parse_timestamp(self):
+        base = parse_time('2022-07-08 10:05:01')
+        self.assertEqual(parse_timestamp('(2022-07-08 10:05:01:500000): x'),
+                         base + 500000)
+        self.assertEqual(parse_timestamp('2022-07-08 10:05:01.000001: x'),
+                         base + 1)
+        self.assertIsNone(parse_timestamp('(2022-07-08'))
+        self.assertIsNone(parse_timestamp('(2022/07/08 10:05:01): x'))
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time('2022-07-08'),
+                         parse_time('2022-07-08 00:00:00'))
+        self.assertEqual(parse_time('2022-07-08T10:05'),
+                         parse_time('2022-07-08 10:05:00'))
+        self.assertEqual(parse_time('2022-07-09') - parse_time('2022-07-08'),
+                         86400 * 1000000)
+        for text in ['2022-07-08 10', '08.07.2022', 'yesterday']:
+            with self.subTest(text=text):
+                self.assertRaises(ValueError, parse_time, text)
+
+
+class TimeWindowTest(unittest.TestCase):
+    def setUp(self):
+        # continuation lines of multi-line messages have no timestamp
+        self.lines = [log_line(0), log_line(10), '   *  continued\n',
+                      log_line(10), log_line(20), '   *  continued\n',
+                      log_line(30)]
+        self.buf = ''.join(self.lines).encode()
+
+    def offset(self, index):
+        return len(''.join(self.lines[:index]).encode())
+
+    def test_bisect(self):
+        cases = [('2022-07-08 09:00', 0),
+                 ('2022-07-08 10:00', 0),
+                 ('2022-07-08 10:00:05', 1),
+                 # the first of the lines with the same timestamp
+                 ('2022-07-08 10:00:10', 1),
+                 ('2022-07-08 10:00:11', 4),
+                 ('2022-07-08 10:00:30', 6),
+                 ('2022-07-08 11:00', len(self.buf))]
+        for text, index in cases:
+            with self.subTest(time=text):
+                self.assertEqual(bisect_timestamp(self.buf, parse_time(text)),
+                                 self.offset(index))
+
+    def test_bisect_end(self):
+        end = self.offset(4)
+        self.assertEqual(bisect_timestamp(self.buf,
+                                          parse_time('2022-07-08 10:00:15'),
+                                          end), end)
+        self.assertEqual(bisect_timestamp(b'', 0), 0)
+
+    def test_bisect_continuation(self):
+        # a window bisected on both ends has the same lines as
+        # filter_window(), continuation lines stay with their first line
+        since = parse_time('2022-07-08 10:00:15')
+        until = parse_time('2022-07-08 10:00:25')
+        start = bisect_timestamp(self.buf, since)
+        end = bisect_timestamp(self.buf, until)
+        self.assertEqual(self.buf[start:end].decode(),
+                         ''.join(filter_window(self.lines, since, until)))
+        self.assertEqual(self.buf[start:end].decode(),
+                         ''.join(self.lines[4:6]))
+
+    def test_bisect_usec(self):
+        # the lines are logged 100 usec after the full second
+        target = parse_time('2022-07-08 10:00:20')
+        self.assertEqual(bisect_timestamp(self.buf, target + 100),
+                         self.offset(4))
+        self.assertEqual(bisect_timestamp(self.buf, target + 101),
+                         self.offset(6))
+
+    def test_filter_window(self):
+        since = parse_time('2022-07-08 10:00:05')
+        until = parse_time('2022-07-08 10:00:30')
+        self.assertEqual(list(filter_window(self.lines, since, until)),
+                         self.lines[1:6])
+
+    def test_filter_window_open(self):
+        until = parse_time('2022-07-08 10:00:20')
+        self.assertEqual(list(filter_window(self.lines)), self.lines)
+        self.assertEqual(list(filter_window(self.lines, until=until)),
+                         self.lines[:4])
+        self.assertEqual(list(filter_window(self.lines, since=until)),
+                         self.lines[4:])
+
+    def test_filter_window_continuation(self):
+        # continuation lines follow their first line out of the window
+        since = parse_time('2022-07-08 10:00:15')
+        lines = [log_line(10), '   *  continued\n', log_line(20)]
+        self.assertEqual(list(filter_window(lines, since)), lines[2:])
+
+
+class RotatedLogfilesTest(unittest.TestCase):
+    def test_order(self):
+        names = ['sssd_nss.log', 'sssd_nss.log.1', 'sssd_nss.log.2.gz',
+                 'sssd_nss.log.10.xz', 'sssd_nss.log-20220708.bz2',
+                 'sssd_nss.log-20220701', 'sssd_nss.log.gz']
+        # dated files first, then numbered ones from the highest number,
+        # the compressed current log file is the newest
+        self.assertEqual(rotated_logfiles('sssd_nss.log', names),
+                         ['sssd_nss.log-20220701',
+                          'sssd_nss.log-20220708.bz2',
+                          'sssd_nss.log.10.xz', 'sssd_nss.log.2.gz',
+                          'sssd_nss.log.1', 'sssd_nss.log.gz'])
+
+    def test_other_files(self):
+        names = ['sssd_nss.log.1', 'sssd_pam.log.1', 'sssd_nss.log.old',
+                 'sssd_nss.log.1.tmp', 'xsssd_nss.log.1', 'sssd_nss.log']
+        self.assertEqual(rotated_logfiles('sssd_nss.log', names),
+                         ['sssd_nss.log.1'])
+        self.assertEqual(rotated_logfiles('sssd_nss.log', []), [])
+
+
+def be_line(rid, msg):
+    """ Backend log line of the request ID """
+    return f'(2022-07-08 10:00:00:000100): [be[LDAP]] [dp_attach_req] ' \
+           f'(0x0400): [RID#{rid}] {msg}\n'
+
+
+class CorrelatedLinesTest(unittest.TestCase):
+    def setUp(self):
+        # the line linking a backend request to client ID 1 of nss
+        self.matcher = Matcher([r'REQ_TRACE: New request\. '
+                                r'\[sssd\.nss CID #1\]'])
+        self.link = 'REQ_TRACE: New request. [sssd.nss CID #1]'
+
+    def correlate(self, lines):
+        return list(request.RequestAnalyzer().correlated_lines(lines,
+                                                               self.matcher))
+
+    def test_buffered_until_linked(self):
+        lines = [be_line(1, 'before 1'), be_line(2, 'other'),
+                 be_line(1, 'before 2'), be_line(1, self.link),
+                 be_line(2, 'REQ_TRACE: New request. [sssd.nss CID #2]'),
+                 be_line(1, 'after')]
+        self.assertEqual(self.correlate(lines),
+                         [lines[0], lines[2], lines[3], lines[5]])
+
+    def test_unlinked(self):
+        lines = [be_line(1, 'one'), be_line(2, 'two'),
+                 '(2022-07-08 10:00:00:000100): [be[LDAP]] [dp_attach_req] '
+                 '(0x0400): no request ID\n']
+        self.assertEqual(self.correlate(lines), [])
+
+    def test_backtrace(self):
+        lines = [be_line(1, self.link), '   *  [RID#1] backtrace\n',
+                 be_line(1, 'after')]
+        self.assertEqual(self.correlate(lines), [lines[0], lines[2]])
+
+    def test_bounded_lines(self):
+        # only the last lines of a request are kept before it is linked
+        lines = [be_line(1, f'line {i}') for i in range(10)]
+        lines.append(be_line(1, self.link))
+        with mock.patch.object(request, 'CORRELATION_MAX_LINES', 3):
+            self.assertEqual(self.correlate(lines), lines[7:])
+
+    def test_bounded_requests(self):
+        # the least recently logged requests are dropped first
+        lines = [be_line(1, 'one'), be_line(2, 'two'), be_line(1, 'three'),
+                 be_line(3, 'four'), be_line(1, self.link),
+                 be_line(2, self.link)]
+        with mock.patch.object(request, 'CORRELATION_MAX_RIDS', 2):
+            self.assertEqual(self.correlate(lines),
+                             [lines[0], lines[2], lines[4], lines[5]])
+
+
+class LogIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="tp_sss_analyze_",
+                                       dir=TEST_DIR)
+        self.path = os.path.join(self.tmpdir, 'sssd_LDAP.log')
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.lines = [be_line(rid, f'line {rid}') for rid in range(1, 11)]
+        self.write(self.lines)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, lines, mode='w'):
+        with open(self.path, mode) as file:
+            file.write(''.join(lines))
+
+    def update(self):
+        """
+        Update a freshly loaded index
+
+        Returns:
+            (index, reset, scan) tuple, whether the index was rebuilt and
+            whether the log file was scanned
+        """
+        index = LogIndex(self.path, self.cache_dir)
+        with mock.patch.object(index, 'reset', wraps=index.reset) as reset, \
+             mock.patch.object(index, 'scan', wraps=index.scan) as scan:
+            index.update()
+        return index, reset.called, scan.called
+
+    def test_lookup(self):
+        self.write(['(2022-07-08 10:00:00:000100): [be[LDAP]] [sdap_search] '
+                    '(0x0400): [RID#3] REQ_TRACE: New request. '
+                    '[sssd.nss CID #7]\n',
+                    be_line(42, 'partially written')[:-1]], 'a')
+        index, reset, scan = self.update()
+        self.assertTrue(reset)
+        self.assertTrue(scan)
+        self.assertEqual(index.lookup(['RID#3']), [(0, index.scanned)])
+        self.assertEqual(index.lookup(functions=['sdap_search']),
+                         [(0, index.scanned)])
+        self.assertEqual(index.lookup(['RID#11', 'CID#1']), [])
+        self.assertEqual(index.linked_ids('nss', 7), ['RID#3'])
+        self.assertEqual(index.linked_ids('pam', 7), [])
+        # the partially written line is indexed once it is complete
+        self.assertLess(index.scanned, os.path.getsize(self.path))
+        self.assertEqual(index.lookup(['RID#42']), [])
+        self.write(['\n'], 'a')
+        index, reset, scan = self.update()
+        self.assertFalse(reset)
+        self.assertEqual(index.lookup(['RID#42']), [(0, index.scanned)])
+
+    def test_blocks(self):
+        with mock.patch.object(LogIndex, 'BLOCK_SIZE', len(self.lines[0])):
+            index, _, _ = self.update()
+        # every line is a block of its own
+        self.assertEqual(len(index.blocks), len(self.lines))
+        start = index.blocks[4]
+        self.assertEqual(index.lookup(['RID#5', 'RID#6', 'RID#9']),
+                         [(start, index.blocks[6]),
+                          (index.blocks[8], index.blocks[9])])
+        self.assertEqual(index.lookup(['RID#10']),
+                         [(index.blocks[9], index.scanned)])
+
+    def test_unchanged(self):
+        self.update()
+        index, reset, scan = self.update()
+        self.assertFalse(reset)
+        self.assertFalse(scan)
+        self.assertEqual(index.scanned, os.path.getsize(self.path))
+
+    def test_appended(self):
+        self.update()
+        self.write([be_line(11, 'appended')], 'a')
+        index, reset, scan = self.update()
+        self.assertFalse(reset)
+        self.assertTrue(scan)
+        self.assertEqual(index.lookup(['RID#1']), [(0, index.scanned)])
+        self.assertEqual(index.lookup(['RID#11']), [(0, index.scanned)])
+
+    def test_inode_changed(self):
+        self.update()
+        # rotated, the new file has the same start and is larger
+        os.rename(self.path, self.path + '.1')
+        self.write(self.lines + [be_line(11, 'new file')])
+        index, reset, _ = self.update()
+        self.assertTrue(reset)
+        self.assertEqual(index.scanned, os.path.getsize(self.path))
+
+    def test_truncated(self):
+        self.update()
+        # copytruncate, the start of the file is the same but it shrunk
+        self.write(self.lines[:5])
+        self.assertGreater(len(''.join(self.lines[:5])), 256)
+        index, reset, _ = self.update()
+        self.assertTrue(reset)
+        self.assertEqual(index.lookup(['RID#9']), [])
+
+    def test_head_changed(self):
+        self.update()
+        # rewritten in place with the same size
+        self.write([be_line(99, 'line 1')] + self.lines[1:])
+        index, reset, _ = self.update()
+        self.assertTrue(reset)
+        self.assertEqual(index.lookup(['RID#1']), [])
+        self.assertEqual(index.lookup(['RID#99']), [(0, index.scanned)])
+
+
+class SpaceSavingTest(unittest.TestCase):
+    def test_exact(self):
+        counter = SpaceSaving(3)
+        for key in 'abacab':
+            counter.add(key)
+        self.assertEqual(counter.total, 6)
+        self.assertEqual({k: (c.count, c.error)
+                          for k, c in counter.counters.items()},
+                         {'a': (3, 0), 'b': (2, 0), 'c': (1, 0)})
+        self.assertEqual([c.key for c in counter.top(2)], ['a', 'b'])
+        self.assertEqual(len(counter.top(10)), 3)
+
+    def test_details(self):
+        counter = SpaceSaving(3)
+        counter.add('a', miss=True, backend=100)
+        counter.add('a', failed=True)
+        counter.add('a', miss=True, failed=True, backend=50)
+        hitter = counter.top(1)[0]
+        self.assertEqual((hitter.count, hitter.misses, hitter.failed,
+                          hitter.backend), (3, 2, 2, 150))
+
+    def test_evict(self):
+        counter = SpaceSaving(2)
+        for key in 'aaabc':
+            counter.add(key, miss=True)
+        # c replaced b, the key with the lowest count, and took its count
+        self.assertEqual(sorted(counter.counters), ['a', 'c'])
+        c = counter.counters['c']
+        self.assertEqual((c.count, c.error, c.misses), (2, 1, 1))
+        # the lowest count is the current one, not the one at insertion
+        for key in 'cccd':
+            counter.add(key)
+        self.assertEqual(sorted(counter.counters), ['c', 'd'])
+        d = counter.counters['d']
+        self.assertEqual((d.count, d.error), (4, 3))
+        self.assertEqual(counter.total, 9)
+
+    def test_heavy_hitters(self):
+        counter = SpaceSaving(10)
+        exact = {}
+        # two keys above 1/capacity of the stream among many rare ones
+        stream = []
+        for i in range(1000):
+            stream.append(f'rare{i}')
+            if i % 3 == 0:
+                stream.append('hot')
+            if i % 5 == 0:
+                stream.append('warm')
+        for key in stream:
+            counter.add(key)
+            exact[key] = exact.get(key, 0) + 1
+
+        self.assertEqual(len(counter.counters), 10)
+        self.assertEqual([c.key for c in counter.top(2)], ['hot', 'warm'])
+        for hitter in counter.counters.values():
+            # never underestimated, overestimated by at most the error
+            self.assertGreaterEqual(hitter.count, exact[hitter.key])
+            self.assertLessEqual(hitter.count - hitter.error,
+                                 exact[hitter.key])
+            self.assertLessEqual(hitter.error, len(stream) // 10)
+
+
+class MannWhitneyTest(unittest.TestCase):
+    def test_separated(self):
+        # U = 0, z = (4.5 - 0.5) / sqrt(5.25)
+        self.assertAlmostEqual(mann_whitney([1, 2, 3], [4, 5, 6]),
+                               0.080856, places=6)
+        self.assertAlmostEqual(mann_whitney([4, 5, 6], [1, 2, 3]),
+                               0.080856, places=6)
+
+    def test_ties(self):
+        # tied values get their average rank, U = 7, and the variance is
+        # reduced by the two groups of three ties
+        self.assertAlmostEqual(mann_whitney([1, 2, 2, 3, 5],
+                                            [2, 3, 3, 4, 6, 7]),
+                               0.163045, places=6)
+
+    def test_same(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(mann_whitney(values, list(values)), 1.0)
+        self.assertEqual(mann_whitney([1, 1, 1], [1, 1]), 1.0)
+        self.assertEqual(mann_whitney([1], [1]), 1.0)
+
+    def test_shifted(self):
+        before = list(range(50))
+        self.assertLess(mann_whitney(before, list(range(25, 75))), 1e-6)
+        self.assertGreater(mann_whitney(before, list(range(1, 51))), 0.5)
+
+    def test_empty(self):
+        self.assertIsNone(mann_whitney([], [1, 2]))
+        self.assertIsNone(mann_whitney([1, 2], []))
+
+
+class DiffSourceArgsTest(unittest.TestCase):
+    def source_args(self, since=None, until=None, after_logdir=None,
+                    after_since=None, after_until=None):
+        args = argparse.Namespace(logdir='/var/log/sssd/', since=since,
+                                  until=until, after_logdir=after_logdir,
+                                  after_since=after_since,
+                                  after_until=after_until)
+        return DiffAnalyzer().source_args(args)
+
+    def test_logdir(self):
+        before, after = self.source_args(until=10, after_logdir='/tmp/a/')
+        self.assertEqual((before.logdir, before.since, before.until),
+                         ('/var/log/sssd/', None, 10))
+        self.assertEqual((after.logdir, after.since, after.until),
+                         ('/tmp/a/', None, 10))
+
+    def test_window(self):
+        start = parse_time('2022-07-08')
+        end = parse_time('2022-07-10')
+        # the end of the window is inherited from --until
+        before, after = self.source_args(until=end, after_since='2022-07-09')
+        self.assertEqual((before.since, before.until), (None, end))
+        self.assertEqual((after.since, after.until),
+                         (parse_time('2022-07-09'), end))
+        before, after = self.source_args(since=start,
+                                         after_until='2022-07-09')
+        self.assertEqual((after.since, after.until),
+                         (start, parse_time('2022-07-09')))
+
+    def test_invalid(self):
+        end = parse_time('2022-07-09')
+        with self.assertLogs(level='ERROR'):
+            self.assertIsNone(self.source_args(after_since='yesterday'))
+        # an empty second window
+        with self.assertLogs(level='ERROR'):
+            self.assertIsNone(self.source_args(until=end,
+                                               after_since='2022-07-09'))
+        self.assertIsNotNone(self.source_args(until=end,
+                                              after_since='2022-07-09',
+                                              after_until='2022-07-10'))
+
+
+class ArchivesTest(unittest.TestCase):
+    def setUp(self):
+        self.names = ['sssd.log', 'sssd_nss.log', 'sssd_nss.log.1',
+                      'sssd_nss.log.2.gz', 'sssd_pam.log', 'sssd_ifp.log',
+                      'sssd_LDAP.log', 'sssd_LDAP.log-20220708.xz',
+                      'sssd_AD.log', 'krb5_child.log', 'ldap_child.log.1',
+                      'ldap_child.log', 'sssd_nss.log.tmp']
+
+    def test_select_responders(self):
+        self.assertEqual(select_logfiles(self.names, Reader.Component.NSS,
+                                         False, False),
+                         ['sssd_nss.log'])
+        self.assertEqual(select_logfiles(self.names, Reader.Component.NSS,
+                                         False, True),
+                         ['sssd_nss.log.2.gz', 'sssd_nss.log.1',
+                          'sssd_nss.log'])
+        self.assertEqual(select_logfiles(self.names, Reader.Component.PAM,
+                                         False, True),
+                         ['sssd_pam.log'])
+
+    def test_select_backends(self):
+        self.assertEqual(select_logfiles(self.names, Reader.Component.BE,
+                                         False, False),
+                         ['sssd_AD.log', 'sssd_LDAP.log'])
+        self.assertEqual(select_logfiles(self.names, Reader.Component.BE,
+                                         False, True),
+                         ['sssd_AD.log', 'sssd_LDAP.log-20220708.xz',
+                          'sssd_LDAP.log'])
+        # with the child logs, the same as the files reader
+        self.assertEqual(select_logfiles(self.names, Reader.Component.BE,
+                                         True, False),
+                         ['krb5_child.log', 'ldap_child.log', 'sssd.log',
+                          'sssd_AD.log', 'sssd_LDAP.log'])
+
+    def test_select_children(self):
+        self.assertEqual(select_logfiles(self.names, Reader.Component.CHILD,
+                                         False, True),
+                         ['krb5_child.log', 'ldap_child.log.1',
+                          'ldap_child.log'])
+        self.assertEqual(select_logfiles([], Reader.Component.CHILD,
+                                         False, True), [])
+
+    def test_tag_host(self):
+        line = '(2022-07-08 10:05:01:000123): [nss] [cache_req_send] ' \
+               '(0x0400): [CID#5] Looking up [user] [x] (0x1)\n'
+        self.assertEqual(tag_host(line, 'client1'),
+                         '(2022-07-08 10:05:01:000123): [nss@client1] '
+                         '[cache_req_send] (0x0400): [CID#5] Looking up '
+                         '[user] [x] (0x1)\n')
+        # program names containing brackets
+        line = '(2022-07-08 10:05:01:000123): [be[LDAP]] [dp_attach_req] ' \
+               '(0x0400): [RID#1] msg\n'
+        record = LogRecord(tag_host(line, 'client1'))
+        self.assertEqual(record.component, 'be[LDAP]@client1')
+        self.assertEqual(record.host, 'client1')
+        self.assertEqual(record.function, 'dp_attach_req')
+        self.assertEqual(record.rid, 1)
+
+    def test_tag_host_untouched(self):
+        for line in ['   *  backtrace line\n', 'garbage\n',
+                     '(2022-07-08 10:05:01:000123): [nss] truncated']:
+            with self.subTest(line=line):
+                self.assertEqual(tag_host(line, 'client1'), line)
+
+
+class DatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.analyzer = db.DatabaseAnalyzer()
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute(db.SCHEMA)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def ingest(self, lines):
+        newest = self.analyzer.newest(self.conn)
+        return self.analyzer.insert(self.conn, db.line_rows(lines), newest)
+
+    def messages(self):
+        return [row[0] for row in self.conn.execute(
+            'SELECT message FROM lines ORDER BY rowid')]
+
+    def test_line_rows(self):
+        lines = ['(2022-07-08 10:00:00): [nss] [f] (0x0400): [CID#1] one\n',
+                 'continued\n',
+                 '********************** PREVIOUS MESSAGE WAS TRIGGERED BY '
+                 'THE FOLLOWING BACKTRACE:\n',
+                 '   *  (2022-07-08 10:00:00): [nss] [g] (0x1000): [CID#1] '
+                 'traced\n',
+                 '********************** BACKTRACE DUMP ENDS HERE '
+                 '*********************************\n',
+                 '(2022-07-08 10:00:01): [be[LDAP]@host1] [h] (0x0010): '
+                 '[RID#2] two\n']
+        self.assertEqual(list(db.line_rows(['orphan\n'] + lines)), [
+            (parse_time('2022-07-08 10:00:00'), None, 'nss', 'f', 0x400, 1,
+             None, 0, 'one\ncontinued'),
+            (parse_time('2022-07-08 10:00:00'), None, 'nss', 'g', 0x1000, 1,
+             None, 1, 'traced'),
+            (parse_time('2022-07-08 10:00:01'), 'host1', 'be[LDAP]', 'h',
+             0x10, None, 2, 0, 'two')])
+
+    def test_reingest(self):
+        lines = ['(2022-07-08 10:00:00): [nss] [f] (0x0400): [CID#1] one\n',
+                 '(2022-07-08 10:00:00): [pam] [f] (0x0400): [CID#1] one\n']
+        self.assertEqual(self.ingest(lines), 2)
+        self.assertEqual(self.ingest(lines), 0)
+        # appended within the same second as the newest stored line
+        lines += ['(2022-07-08 10:00:00): [nss] [f] (0x0400): [CID#2] two\n',
+                  '(2022-07-08 10:00:00): [nss] [f] (0x0400): [CID#2] two\n',
+                  '(2022-07-08 10:00:01): [pam] [f] (0x0400): [CID#2] two\n']
+        self.assertEqual(self.ingest(lines), 3)
+        self.assertEqual(self.ingest(lines), 0)
+        self.assertEqual(self.messages(),
+                         ['one', 'one', 'two', 'two', 'two'])
+        self.assertEqual(self.analyzer.newest(self.conn),
+                         {(None, 'nss'): (parse_time('2022-07-08 10:00:00'),
+                                          3),
+                          (None, 'pam'): (parse_time('2022-07-08 10:00:01'),
+                                          1)})
+
+
+class FollowedFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="tp_sss_analyze_",
+                                       dir=TEST_DIR)
+        self.path = os.path.join(self.tmpdir, 'sssd_nss.log')
+        self.write('old 1\nold 2\n')
+        self.followed = FollowedFile(self.path)
+
+    def tearDown(self):
+        self.followed.close()
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, data, mode='w'):
+        with open(self.path, mode) as file:
+            file.write(data)
+
+    def test_append(self):
+        # followed from the end, partially written lines are kept back
+        self.assertEqual(self.followed.read(), [])
+        self.write('new 1\nnew', 'a')
+        self.assertEqual(self.followed.read(), ['new 1\n'])
+        self.write(' 2\n', 'a')
+        self.assertEqual(self.followed.read(), ['new 2\n'])
+        self.assertEqual(self.followed.read(), [])
+
+    def test_rotated(self):
+        self.write('before rotation\n', 'a')
+        os.rename(self.path, self.path + '.1')
+        # not recreated yet
+        self.assertEqual(self.followed.read(), ['before rotation\n'])
+        self.write('after rotation\n')
+        self.assertEqual(self.followed.read(), ['after rotation\n'])
+        self.write('last\n', 'a')
+        self.assertEqual(self.followed.read(), ['last\n'])
+
+    def test_rotated_between_reads(self):
+        self.write('before rotation\n', 'a')
+        os.rename(self.path, self.path + '.1')
+        self.write('after rotation\n')
+        # the rest of the old file first, then the new file from its start
+        self.assertEqual(self.followed.read(), ['before rotation\n',
+                                                'after rotation\n'])
+
+    def test_truncated(self):
+        inode = os.stat(self.path).st_ino
+        # copytruncate, the same file starts over
+        self.write('new\n')
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+        self.assertEqual(self.followed.read(), ['new\n'])
+        self.write('next\n', 'a')
+        self.assertEqual(self.followed.read(), ['next\n'])
+
+    def test_created(self):
+        os.unlink(self.path)
+        followed = FollowedFile(self.path + '.new')
+        self.assertEqual(followed.read(), [])
+        with open(self.path + '.new', 'w') as file:
+            file.write('first\n')
+        self.assertEqual(followed.read(), ['first\n'])
+        followed.close()
+
+
+class FollowStateTest(unittest.TestCase):
+    def test_drop_stale(self):
+        second = 1000000
+        now = 10000 * second
+        old = now - (request.FOLLOW_STALE + 1) * second
+        clients = {1: ['id', '0', old], 2: ['ls', '0', now]}
+        active = {('nss', '1'): [1, 'User by name', '', old],
+                  ('nss', '2'): [2, 'User by name', '', now]}
+        backend = {('be[LDAP]', 1): (1, old), ('be[LDAP]', 2): (2, now)}
+        linked = {1: deque([(old, old)]),
+                  2: deque([(old, old), (now, now)])}
+        request.RequestAnalyzer().drop_stale(now, clients, active, backend,
+                                             linked)
+        self.assertEqual(list(clients), [2])
+        self.assertEqual(list(active), [('nss', '2')])
+        self.assertEqual(list(backend), [('be[LDAP]', 2)])
+        self.assertEqual(linked, {2: deque([(now, now)])})
+
+
+def cache_request(cid, start, end, host=None):
+    """ Finished CacheRequest of the client ID """
+    request = CacheRequest(host, cid, 'User by name', start)
+    request.end = end
+    return request
+
+
+class RunningRequestsTest(unittest.TestCase):
+    def test_find(self):
+        requests = [cache_request(1, 30, 40), cache_request(1, 0, 25),
+                    cache_request(2, 10, 20), cache_request(1, 50, 60),
+                    cache_request(1, 50, 60, 'host1')]
+        running = RunningRequests(requests)
+        for key, timestamp, index in [((None, 1), 0, 1),
+                                      ((None, 1), 25, 1),
+                                      ((None, 1), 35, 0),
+                                      ((None, 1), 55, 3),
+                                      ((None, 2), 15, 2),
+                                      (('host1', 1), 50, 4)]:
+            with self.subTest(key=key, timestamp=timestamp):
+                self.assertIs(running.find(key, timestamp),
+                              requests[index])
+        for key, timestamp in [((None, 1), 27), ((None, 1), 61),
+                               ((None, 1), -1), ((None, 3), 15),
+                               (('host1', 1), 35)]:
+            with self.subTest(key=key, timestamp=timestamp):
+                self.assertIsNone(running.find(key, timestamp))
+
+    def test_overlapping(self):
+        # the long request started first is found, even though a later
+        # one starts closer to the time
+        requests = [cache_request(1, 0, 100), cache_request(1, 10, 20)]
+        running = RunningRequests(requests)
+        self.assertIs(running.find((None, 1), 15), requests[0])
+        self.assertIs(running.find((None, 1), 50), requests[0])
+
+
+def debug_line(usec, component, function, msg, chain=''):
+    """ Debug log line logged usec microseconds after 2022-07-08 10:00 """
+    seconds, usec = divmod(usec, 1000000)
+    return f'(2022-07-08 10:00:{seconds:02}:{usec:06}): [{component}] ' \
+           f'[{function}] (0x0400): {chain + " " if chain else ""}{msg}\n'
+
+
+class LinesReader(Reader):
+    """
+    Reader of log lines given by component, for the modules reading
+    their lines from a source
+    """
+    def __init__(self, lines):
+        super().__init__()
+        self.lines = lines
+        self.selected = []
+
+    def __iter__(self):
+        return iter(self.selected)
+
+    def set_component(self, component, child):
+        self.selected = self.lines.get(component, [])
+        if component == self.Component.BE and not self.selected:
+            raise IOError
+
+
+class TraceExporterTest(unittest.TestCase):
+    def test_spans(self):
+        trace = TraceExporter()
+        lines = []
+        for host, cmd in (('client1', 'id'), ('client2', 'ls')):
+            nss = f'nss@{host}'
+            lines += [
+                debug_line(0, nss, 'accept_fd_handler',
+                           f'Client [cmd {cmd}][uid 0][0x1][22] connected!',
+                           '[CID#1]'),
+                debug_line(100, nss, 'cache_req_send', "CR #1: REQ_TRACE: "
+                           "New request [CID #1] 'User by name'", '[CID#1]'),
+                debug_line(900, nss, 'cache_req_done', 'CR #1: Finished: '
+                           'Success', '[CID#1]')]
+        lines += [
+            debug_line(200, 'be[LDAP]', 'dp_req_new', 'DP Request [Account '
+                       '#3]: REQ_TRACE: New request. [sssd.nss CID #1] '
+                       'Flags [0x0001].', '[RID#3]'),
+            debug_line(300, 'be[LDAP]', 'sdap_get_generic_ext_step',
+                       'calling ldap_search_ext with [(uid=foo)]'
+                       '[dc=example,dc=com].', '[RID#3]'),
+            debug_line(700, 'be[LDAP]', 'sdap_get_generic_op_finished',
+                       'Search result: Success(0), no errmsg set',
+                       '[RID#3]'),
+            debug_line(800, 'be[LDAP]', 'dp_req_done', 'DP Request [Account '
+                       '#3]: Request handler finished [0]: Success',
+                       '[RID#3]'),
+            # never finished
+            debug_line(850, 'be[LDAP]', 'dp_req_new', 'DP Request [Account '
+                       '#4]: REQ_TRACE: New request.', '[RID#4]')]
+        matcher = TraceExporter.matcher()
+        for line in lines:
+            if matcher.search(line):
+                trace.add(line)
+
+        spans = sorted(trace.spans, key=lambda s: (s.process, s.start))
+        self.assertEqual([(s.process, s.name, s.cat, s.start % 1000000,
+                           s.end % 1000000) for s in spans],
+                         [('be[LDAP]', 'DP Request [Account #3]', 'dp',
+                           200, 800),
+                          ('be[LDAP]', 'ldap search', 'ldap', 300, 700),
+                          ('nss@client1', 'User by name', 'cache_req',
+                           100, 900),
+                          ('nss@client2', 'User by name', 'cache_req',
+                           100, 900)])
+        # command names of the same client ID on different hosts
+        self.assertEqual([s.args for s in spans[2:]],
+                         [{'cid': 1, 'cr': 1, 'command': 'id',
+                           'result': 'Success'},
+                          {'cid': 1, 'cr': 1, 'command': 'ls',
+                           'result': 'Success'}])
+        self.assertEqual(spans[0].args, {'rid': 3, 'client': 'sssd.nss '
+                                         'CID #1', 'result': 'Success'})
+        self.assertEqual(spans[1].args['filter'], '(uid=foo)')
+
+    def test_layout(self):
+        spans = []
+        for name, start, end in (('outer', 0, 100), ('inner', 10, 20),
+                                 ('overlapping', 50, 150),
+                                 ('after', 150, 160)):
+            spans.append(Span('nss', name, 'cache_req', start))
+            spans[-1].end = end
+        placed = TraceExporter().layout(spans)
+        # nested spans share a row, overlapping ones do not
+        self.assertEqual([(row, span.name) for row, span in placed],
+                         [(0, 'outer'), (0, 'inner'), (1, 'overlapping'),
+                          (0, 'after')])
+
+
+class TarballTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="tp_sss_analyze_",
+                                       dir=TEST_DIR)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def tarball(self, name, members):
+        """ Write a tarball of the (name, data) members to the tempdir """
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+            for member, data in members:
+                info = tarfile.TarInfo(member)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as file:
+            file.write(buf.getvalue())
+        return path
+
+    def sosreport(self, name, host):
+        nss = f'{name}/var/log/sssd/sssd_nss.log'
+        return self.tarball(f'{name}.tar.gz', [
+            (f'{name}/hostname', f'{host}\n'.encode()),
+            (nss + '.1.gz', gzip.compress(
+                log_line(1, '[CID#1] rotated').encode())),
+            (nss, (log_line(2, '[CID#1] current')
+                   + log_line(3, '[CID#2] other')).encode()),
+            (f'{name}/var/log/sssd/sssd_LDAP.log',
+             be_line(1, 'backend').encode()),
+            # not a log directory of SSSD
+            (f'{name}/var/log/other/sssd_nss.log',
+             log_line(4, '[CID#1] ignored').encode())])
+
+    def test_search(self):
+        path = self.sosreport('sosreport-c1-2022', 'client1.example.com')
+        matcher = Matcher([r'\[CID#1\]'])
+        tarball = Tarball(path, rotated=True)
+        self.assertEqual(tarball.host, 'client1.example.com')
+        tarball.set_component(Reader.Component.NSS, False)
+        # rotated and compressed members first
+        self.assertEqual(list(tarball.search(matcher)),
+                         [log_line(1, '[CID#1] rotated'),
+                          log_line(2, '[CID#1] current')])
+        tarball.set_component(Reader.Component.BE, False)
+        self.assertEqual(list(tarball), [be_line(1, 'backend')])
+
+        tarball = Tarball(path)
+        tarball.set_component(Reader.Component.NSS, False)
+        tarball.set_window(parse_time('2022-07-08 10:00:03'))
+        self.assertEqual(list(tarball.search(Matcher([r'CID#']))),
+                         [log_line(3, '[CID#2] other')])
+
+    def test_archives(self):
+        self.sosreport('sosreport-c1-2022', 'client1')
+        self.tarball('client2.tar.gz', [
+            ('sssd/sssd_nss.log', log_line(5, '[CID#1] two').encode())])
+        archives = Archives(self.tmpdir)
+        self.assertEqual(sorted(archives.readers), ['client1', 'client2'])
+        archives.set_component(Reader.Component.NSS, False)
+        hosts = [LogRecord(line).host
+                 for line in archives.search(Matcher([r'\[CID#1\]']))]
+        self.assertEqual(sorted(hosts), ['client1', 'client2'])
+
+        archives = Archives(self.tmpdir, hosts=['client2'])
+        archives.set_component(Reader.Component.NSS, False)
+        self.assertEqual(list(archives.search(Matcher([r'\[CID#1\]']))),
+                         [tag_host(log_line(5, '[CID#1] two'), 'client2')])
+        # a single host has no backend logs
+        self.assertRaises(IOError, archives.set_component,
+                          Reader.Component.BE, False)
+
+
+class LdapTest(unittest.TestCase):
+    def search_line(self, usec, rid, ldap_filter, component='be[LDAP]'):
+        return debug_line(usec, component, 'sdap_get_generic_ext_step',
+                          f'calling ldap_search_ext with [{ldap_filter}]'
+                          f'[dc=example,dc=com].', f'[RID#{rid}]')
+
+    def result_line(self, usec, rid, result, component='be[LDAP]'):
+        return debug_line(usec, component, 'sdap_get_generic_op_finished',
+                          f'Search result: {result}, no errmsg set',
+                          f'[RID#{rid}]')
+
+    def test_searches(self):
+        lines = [self.search_line(0, 1, '(uid=foo)'),
+                 self.search_line(100, 1, '(gidNumber=10)'),
+                 # the same RID in another backend
+                 self.search_line(150, 1, '(uid=bar)', 'be[AD]'),
+                 self.search_line(200, 2, '(uid=baz)'),
+                 self.result_line(300, 1, 'Success(0)'),
+                 self.result_line(400, 2, 'Size limit exceeded(4)'),
+                 self.result_line(500, 1, 'Success(0)'),
+                 self.result_line(600, 1, 'No such object(32)', 'be[AD]'),
+                 # never finished, and a result without search
+                 self.search_line(700, 3, '(uid=lost)'),
+                 self.result_line(800, 4, 'Success(0)')]
+        source = LinesReader({Reader.Component.BE: lines})
+        source.set_component(Reader.Component.BE, False)
+        searches = list(LdapAnalyzer().searches(source))
+        # concurrent searches of a request are paired in issue order
+        self.assertEqual([(s.component, s.rid, s.ldap_filter, s.duration,
+                           s.result) for s in searches],
+                         [('be[LDAP]', 1, '(uid=foo)', 300, 'Success'),
+                          ('be[LDAP]', 2, '(uid=baz)', 200,
+                           'Size limit exceeded'),
+                          ('be[LDAP]', 1, '(gidNumber=10)', 400, 'Success'),
+                          ('be[AD]', 1, '(uid=bar)', 450,
+                           'No such object')])
+        self.assertEqual(searches[0].base, 'dc=example,dc=com')
+
+    def test_filter_template(self):
+        self.assertEqual(filter_template('(&(uid=foo)(objectclass=posix'
+                                         'Account))'),
+                         '(&(uid=*)(objectclass=*))')
+        self.assertEqual(filter_template('(&(gidNumber>=10)(!(cn~=a b)))'),
+                         '(&(gidNumber>=*)(!(cn~=*)))')
+
+
+class CacheClassifyTest(unittest.TestCase):
+    def cr_line(self, usec, cr, msg, component='nss'):
+        return debug_line(usec, component, 'cache_req_search_send',
+                          f'CR #{cr}: {msg}', '[CID#1]')
+
+    def test_classify(self):
+        lines = [
+            self.cr_line(0, 1, 'Using domain [LDAP]'),
+            self.cr_line(10, 1, 'Returning [foo@ldap] from cache'),
+            self.cr_line(20, 1, 'Finished: Success'),
+            # searched in two domains, classified by the most expensive
+            self.cr_line(30, 2, 'Using domain [LDAP]'),
+            self.cr_line(40, 2, 'Looking up [bar@ldap] in data provider'),
+            self.cr_line(50, 2, 'Using domain [AD]'),
+            self.cr_line(60, 2, '[bar@ad] does not exist (negative cache)'),
+            # the same CR number in another responder process
+            self.cr_line(65, 2, 'Using domain [LDAP]', 'nss@client2'),
+            self.cr_line(66, 2, 'Performing midpoint cache update of '
+                         '[baz@ldap]', 'nss@client2'),
+            self.cr_line(67, 2, 'Finished: Success', 'nss@client2'),
+            self.cr_line(70, 2, 'Finished: Not found'),
+            # never looked anything up
+            self.cr_line(80, 3, 'Finished: Error'),
+            # still running at the end of the logs
+            self.cr_line(90, 4, 'Using domain [AD]'),
+            self.cr_line(95, 4, '[qux@ad] does not exist (negative cache)')]
+        source = LinesReader({Reader.Component.NSS: lines})
+        source.set_component(Reader.Component.NSS, False)
+        start = parse_time('2022-07-08 10:00')
+        self.assertEqual([(timestamp - start, domain, cls) for
+                          timestamp, domain, cls in
+                          cache.CacheAnalyzer().classify(source)],
+                         [(20, 'LDAP', cache.CACHE),
+                          (67, 'LDAP', cache.MIDPOINT),
+                          (70, 'LDAP', cache.DP),
+                          (95, 'AD', cache.NEGATIVE)])
+
+
+class ChildProcessesTest(unittest.TestCase):
+    def fork_line(self, usec, rid, pid, component='be[LDAP]'):
+        return debug_line(usec, component, 'child_handler_setup',
+                          f'Setting up signal handler up for pid [{pid}]',
+                          f'[RID#{rid}]')
+
+    def child_line(self, usec, pid, msg, component='krb5_child'):
+        return debug_line(usec, f'{component}[{pid}]', 'main', msg)
+
+    def test_child_program(self):
+        self.assertEqual(child_program('krb5_child[1234]'),
+                         ('krb5_child', 1234))
+        self.assertEqual(child_program('ldap_child[99]@client1'),
+                         ('ldap_child', 99))
+        self.assertIsNone(child_program('be[LDAP]'))
+        self.assertIsNone(child_program(None))
+
+    def test_fork_map(self):
+        children = ChildProcesses()
+        self.assertFalse(children)
+        # the request of RID#1 logs until be_line() time, 100 usec, a child
+        # line belongs to it until then
+        for line in [self.fork_line(0, 1, 100),
+                     self.fork_line(10, 2, 200),
+                     debug_line(30, 'be[LDAP]', 'krb5_child_done', 'done',
+                                '[RID#2]'),
+                     debug_line(50, 'be[LDAP]', 'dp_req_done', 'finished',
+                                '[RID#1]'),
+                     be_line(1, 'last line')]:
+            children.add_parent(line)
+        # the PID reused later by another request
+        children.add_parent(self.fork_line(1000, 3, 100))
+        self.assertTrue(children)
+
+        cases = [(self.child_line(20, 100, 'kinit'), ('be[LDAP]', 1)),
+                 (self.child_line(20, 200, 'kinit'), ('be[LDAP]', 2)),
+                 (self.child_line(1000, 100, 'reused'), ('be[LDAP]', 3)),
+                 # between the requests, after the end of the first one
+                 (self.child_line(500, 100, 'late'), None),
+                 (self.child_line(20, 300, 'unknown'), None),
+                 (be_line(1, 'not a child'), None)]
+        for line, parent in cases:
+            with self.subTest(line=line):
+                self.assertEqual(children.parent(LogRecord(line)), parent)
+
+        source = LinesReader({Reader.Component.CHILD:
+                              [line for line, _ in cases]})
+        source.set_component(Reader.Component.CHILD, False)
+        self.assertEqual(list(children.lines(source)),
+                         [line for line, parent in cases[:3]])
+
+    def test_hosts(self):
+        # PIDs of different hosts are kept apart
+        children = ChildProcesses()
+        children.add_parent(self.fork_line(0, 1, 100, 'be[LDAP]@client1'))
+        for host, parent in (('client1', ('be[LDAP]@client1', 1)),
+                             ('client2', None)):
+            record = LogRecord(debug_line(0, f'krb5_child[100]@{host}',
+                                          'main', 'kinit'))
+            self.assertEqual(children.parent(record), parent)
+
+
+class DataProviderTest(unittest.TestCase):
+    def dp_line(self, usec, num, msg, component='be[LDAP]'):
+        return debug_line(usec, component, 'dp_req_done',
+                          f'DP Request [Account #{num}]: {msg}',
+                          f'[RID#{num}]')
+
+    def test_dp_requests(self):
+        lines = [
+            self.dp_line(0, 1, 'REQ_TRACE: New request. [sssd.nss CID #5] '
+                         'Flags [0x0001].'),
+            debug_line(10, 'be[LDAP]', 'dp_req_new',
+                       'Number of active DP request: 1', '[RID#1]'),
+            self.dp_line(20, 2, 'REQ_TRACE: New request. Flags [0x0001].'),
+            # the same request number in another backend
+            self.dp_line(30, 1, 'REQ_TRACE: New request. Flags [0x0001].',
+                         'be[AD]'),
+            self.dp_line(40, 1, 'Request handler finished [0]: Success'),
+            self.dp_line(50, 1, 'Request handler finished [1432158212]: '
+                         'SSSD is offline', 'be[AD]'),
+            # finished twice, or never started
+            self.dp_line(60, 1, 'Request handler finished [0]: Success'),
+            self.dp_line(70, 3, 'Request handler finished [0]: Success')]
+        source = LinesReader({Reader.Component.BE: lines})
+        source.set_component(Reader.Component.BE, False)
+        requests, active = DataProviderAnalyzer().dp_requests(source)
+        start = parse_time('2022-07-08 10:00')
+        self.assertEqual([(r.backend, r.method, r.num, r.client,
+                           r.start - start,
+                           None if r.end is None else r.end - start, r.ret,
+                           r.result) for r in requests],
+                         [('be[LDAP]', 'Account', 1, 'sssd.nss CID #5', 0,
+                           40, 0, 'Success'),
+                          ('be[LDAP]', 'Account', 2, None, 20, None, None,
+                           None),
+                          ('be[AD]', 'Account', 1, None, 30, 50, 1432158212,
+                           'SSSD is offline')])
+        self.assertEqual(active, {'be[LDAP]': [(start + 10, 1)]})
+
+    def test_concurrency(self):
+        requests = []
+        for num, (start, end) in enumerate(((0, 150), (50, 100), (100, 120),
+                                            (180, None))):
+            requests.append(DpRequest('be[LDAP]', 'Account', num, None,
+                                      start))
+            requests[-1].end = end
+        buckets = DataProviderAnalyzer().concurrency(requests, [(130, 3)],
+                                                     100, 200)
+        # [started, finished, in-flight time, peak, logged peak, covered],
+        # back to back requests are not concurrent, the request which
+        # never finished counts until the last timestamp
+        self.assertEqual(buckets, {0: [2, 0, 150, 2, 0, 100],
+                                   100: [2, 3, 90, 2, 3, 100],
+                                   200: [0, 1, 0, 0, 0, 0]})
+
+
+class BacktraceTest(unittest.TestCase):
+    def dump(self, component, user, cr, usec=0):
+        """ Backtrace dump of a failed lookup of the user """
+        lines = [
+            debug_line(usec, component, 'cache_req_send',
+                       f"CR #{cr}: New request 'User by name'", '[CID#1]'),
+            # another request of the same process
+            debug_line(usec + 10, component, 'cache_req_send',
+                       "CR #99: New request 'Group by name'", '[CID#2]'),
+            debug_line(usec + 20, component, 'cache_req_search_send',
+                       f'CR #{cr}: Looking up [{user}@ldap]', '[CID#1]'),
+            debug_line(usec + 20, component, 'cache_req_search_send',
+                       f'CR #{cr}: Looking up [{user}@ldap]', '[CID#1]'),
+            # an earlier request of the same client
+            debug_line(usec + 25, component, 'cache_req_done',
+                       f'CR #{cr - 1}: Finished: Success', '[CID#1]'),
+            debug_line(usec + 30, component, 'cache_req_search_done',
+                       f'CR #{cr}: Unable to look up [{user}]: '
+                       f'[1432158212]', '[CID#1]')]
+        return [lines[-1],
+                '********************** PREVIOUS MESSAGE WAS TRIGGERED BY '
+                'THE FOLLOWING BACKTRACE:\n'] \
+            + ['   *  ' + line for line in lines] \
+            + ['   *  ... skipping repetitive backtrace ...\n',
+               '********************** BACKTRACE DUMP ENDS HERE '
+               '*********************************\n']
+
+    def source(self, lines):
+        source = LinesReader({Reader.Component.NSS: lines})
+        source.set_component(Reader.Component.NSS, False)
+        return source
+
+    def collect(self, lines):
+        source = self.source(lines)
+        hotspots = {}
+        BacktraceAnalyzer().collect(source, hotspots)
+        return hotspots
+
+    def test_message_template(self):
+        self.assertEqual(message_template("CR #3: Looking up [foo@ldap] in "
+                                          "'LDAP' for 0x1f: 42 user@host"),
+                         "CR #N: Looking up [*] in '*' for N: N *")
+
+    def test_error_path(self):
+        lines = self.dump('nss', 'foo', 5)
+        blocks = list(BacktraceAnalyzer().blocks(self.source(lines * 2)))
+        # the trigger line before the dump is not part of it
+        self.assertEqual(len(blocks), 2)
+        block = blocks[0]
+        self.assertEqual(len(block), 6)
+        path, duration = BacktraceAnalyzer().error_path(block)
+        # lines of other requests are left out, repeats logged once
+        self.assertEqual(path,
+                         (('cache_req_send', "CR #N: New request '*'"),
+                          ('cache_req_search_send',
+                           'CR #N: Looking up [*]'),
+                          ('cache_req_search_done',
+                           'CR #N: Unable to look up [*]: [*]')))
+        self.assertEqual(duration, 30)
+
+    def test_fingerprint(self):
+        hotspots = self.collect(self.dump('nss', 'foo', 5)
+                                + self.dump('nss@client2', 'bar', 7, 1000)
+                                + self.dump('pam', 'foo', 5, 2000))
+        # the same error path of nss on two hosts, and the one of pam
+        self.assertEqual(sorted((h.component, h.count, h.time)
+                                for h in hotspots.values()),
+                         [('nss', 2, 60), ('pam', 1, 30)])
+        hotspot = [h for h in hotspots.values() if h.component == 'nss'][0]
+        self.assertEqual(hotspot.trigger, ('cache_req_search_done',
+                                           'CR #N: Unable to look up [*]: '
+                                           '[*]'))
+        self.assertEqual(hotspot.example,
+                         'CR #5: Unable to look up [foo]: [1432158212]')
+        self.assertEqual((hotspot.first.component, hotspot.last.component),
+                         ('nss', 'nss@client2'))
+
+
+class FailoverTest(unittest.TestCase):
+    def be_event(self, usec, msg, component='be[LDAP]'):
+        return debug_line(usec, component, 'fo_set_port_status', msg)
+
+    def test_parse_event(self):
+        for line, event in (
+                (self.be_event(0, "Marking port 389 of server "
+                               "'ldap.example.com' as 'not working'"),
+                 ('LDAP', 'connect', 'down')),
+                (self.be_event(0, "Marking server 'ldap.example.com' as "
+                               "'name resolved'"),
+                 ('LDAP', 'connect', None)),
+                (self.be_event(0, "Marking SRV lookup of service 'AD' as "
+                               "'not resolved'", 'be[ad.test]@client1'),
+                 ('ad.test', 'resolve', 'down')),
+                (self.be_event(0, 'Going offline!'),
+                 ('LDAP', 'offline', 'offline')),
+                (self.be_event(0, 'Marking subdomain child.ad.test offline'),
+                 ('child.ad.test', 'subdomain', 'offline')),
+                (self.be_event(0, 'Resetting all subdomains'),
+                 (None, 'subdomain', 'online')),
+                (self.be_event(0, 'Task [Check if online (LDAP)]: '
+                               'scheduling task 30 seconds from now'),
+                 ('LDAP', 'task', None))):
+            result = parse_event(LogRecord(line))
+            self.assertEqual((result.domain, result.cause, result.change),
+                             event, line)
+        # lines of other tasks or of the responders are no events
+        for line in (self.be_event(0, 'Task [Refresh Records]: scheduling '
+                                   'task 300 seconds from now'),
+                     self.be_event(0, 'Going offline!', 'nss')):
+            self.assertIsNone(parse_event(LogRecord(line)), line)
+
+    def test_periods(self):
+        lines = [
+            self.be_event(0, "Marking port 389 of server 'ldap1' as "
+                          "'not working'"),
+            self.be_event(100, "Failed to resolve server 'ldap2': "
+                          "Timeout"),
+            self.be_event(200, 'Going offline!'),
+            self.be_event(300, 'Task [Check if online (LDAP)]: scheduling '
+                          'task 30 seconds from now'),
+            # a working server does not end an offline period
+            self.be_event(400, "Marking port 389 of server 'ldap1' as "
+                          "'working'"),
+            self.be_event(500, 'Backend is online'),
+            self.be_event(600, "Marking port 389 of server 'ldap1' as "
+                          "'not working'"),
+            self.be_event(700, "Marking port 389 of server 'ldap1' as "
+                          "'working'"),
+            self.be_event(800, 'Marking subdomain child.ad.test offline',
+                          'be[ad.test]'),
+            self.be_event(900, 'Backend is offline', 'be[ad.test]')]
+        source = LinesReader({Reader.Component.BE: lines})
+        source.set_component(Reader.Component.BE, False)
+        failover = FailoverAnalyzer()
+        events, last = failover.events(source)
+        self.assertEqual(len(events), 10)
+        periods = failover.periods(events, last)
+        start = parse_time('2022-07-08 10:00')
+        self.assertEqual([(p.domain, p.kind, p.start - start,
+                           p.end - start) for p in periods],
+                         [('LDAP', 'offline', 0, 500),
+                          ('LDAP', 'failover', 600, 700),
+                          # still offline at the end of the logs
+                          ('child.ad.test', 'subdomain offline', 800,
+                           900)])
+        self.assertEqual(periods[0].causes,
+                         {'connect': 2, 'resolve': 1, 'offline': 1})
+        self.assertEqual(periods[0].hint(), 'failover list')
+
+
+if __name__ == "__main__":
+    unittest.main()
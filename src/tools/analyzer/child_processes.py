@@ -0,0 +1,131 @@
+import re
+
+from sssd.log_record import LogRecord, BACKTRACE_PREFIX
+
+# child_handler_setup() in util/child_common.c, logged by the parent with
+# the chain ID of the request which forked the child
+_FORK_RE = re.compile(r'(?:Setting up signal handler up|Signal handler set '
+                      r'up) for pid \[([0-9]+)\]')
+# Program name of the child helpers, e.g. krb5_child[1234], tagged with
+# the host name by the archives reader
+_CHILD_RE = re.compile(r'^(\w+_child)\[([0-9]+)\](?:@.*)?$')
+
+
+def child_program(component):
+    """
+    Split the program name of a child helper
+
+    Args:
+        component (str): program name, e.g. krb5_child[1234]
+
+    Returns:
+        (name, pid) tuple, None if the program is not a child helper
+    """
+    match = _CHILD_RE.match(component or '')
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def child_partition(partition, children):
+    """
+    Select the child lines of a single reader partition, executed in a
+    worker process.
+
+    Returns:
+        List of child lines belonging to the known parent requests
+    """
+    return list(children.lines(partition))
+
+
+class ChildProcesses:
+    """
+    Map the PIDs of child helper processes, e.g. krb5_child, ldap_child or
+    p11_child, to the requests which forked them.
+
+    Children log under their own program name and PID, not all of them
+    log the chain ID of their parent. The parent logs the PID of every
+    forked child with its own chain ID when it sets up the child signal
+    handler. A child line belongs to the request which forked a child with
+    the same PID and was still logging when the child line was written.
+    This keeps PIDs reused later by other requests apart.
+    """
+    def __init__(self):
+        # (host, pid) -> list of [start, end, component, chain]
+        self.forks = {}
+        # (component, chain) -> list of the fork entries of the request
+        self.requests = {}
+
+    def __bool__(self):
+        return bool(self.forks)
+
+    def add_parent(self, line):
+        """
+        Process a line of a parent process, lines forking a child add a
+        PID mapping, all other lines of a request with children extend the
+        time its children are attributed to it.
+
+        Args:
+            line (str): log line of a responder or backend process
+        """
+        if 'pid [' not in line and not self.requests:
+            return
+        record = LogRecord(line)
+        if record.backtrace or not record.valid:
+            return
+        chain = record.rid if record.rid is not None else record.cid
+        key = (record.component, chain)
+        match = _FORK_RE.search(record.message) if 'pid [' in line else None
+        if match:
+            pid = (record.host, int(match.group(1)))
+            for fork in self.forks.get(pid, ()):
+                if fork[2:] == [record.component, chain]:
+                    fork[1] = record.timestamp
+                    return
+            fork = [record.timestamp, record.timestamp, record.component,
+                    chain]
+            self.forks.setdefault(pid, []).append(fork)
+            self.requests.setdefault(key, []).append(fork)
+            return
+
+        for fork in self.requests.get(key, ()):
+            fork[1] = max(fork[1], record.timestamp)
+
+    def parent(self, record):
+        """
+        Look up the request which forked the process of a child line
+
+        Args:
+            record (LogRecord): line of a child process
+
+        Returns:
+            (component, chain ID) tuple of the parent request, None if the
+            line does not belong to any known request
+        """
+        program = child_program(record.component)
+        if program is None:
+            return None
+        timestamp = record.timestamp
+        pid = (record.host, program[1])
+        for start, end, component, chain in self.forks.get(pid, ()):
+            if start <= timestamp <= end:
+                return component, chain
+        return None
+
+    def lines(self, source):
+        """
+        Select the lines of the known child processes
+
+        Args:
+            source (Reader): source Reader object, set to the children
+
+        Yields:
+            str: child lines belonging to the known parent requests
+        """
+        if not self.forks:
+            return
+        for line in source:
+            if line.startswith(BACKTRACE_PREFIX) or '_child[' not in line:
+                continue
+            if self.parent(LogRecord(line)) is not None:
+                yield line
@@ -0,0 +1,181 @@
+import os
+import time
+import select
+import logging
+
+logger = logging.getLogger()
+
+# <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+# Seconds to wait for changes before checking the files for rotation
+DEFAULT_INTERVAL = 1.0
+
+
+def inotify_init(directories):
+    """
+    Watch directories for files being written, created or moved in
+
+    Args:
+        directories (iterable of str): directories to watch
+
+    Returns:
+        inotify file descriptor, None if inotify is not available
+    """
+    try:
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        init = libc.inotify_init1
+        add_watch = libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    fd = init(_IN_NONBLOCK | _IN_CLOEXEC)
+    if fd < 0:
+        return None
+    mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+    for directory in directories:
+        if add_watch(fd, os.fsencode(directory), mask) < 0:
+            logger.debug(f"Could not watch {directory}: "
+                         f"{os.strerror(ctypes.get_errno())}")
+            os.close(fd)
+            return None
+    return fd
+
+
+class FollowedFile:
+    """
+    A log file followed from its current end, reopened when logrotate
+    moves it away and a new file with the same name shows up or when it
+    is truncated.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.inode = None
+        self.rest = b''
+        self.open(at_end=True)
+
+    def open(self, at_end=False):
+        """ Open the file, True if it exists """
+        try:
+            self.file = open(self.path, 'rb')
+        except FileNotFoundError:
+            self.file = None
+            return False
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        self.rest = b''
+        if at_end:
+            self.file.seek(0, os.SEEK_END)
+        return True
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def read(self):
+        """
+        Read the complete lines written since the last call
+
+        Returns:
+            List of lines
+        """
+        if self.file is None:
+            if not self.open():
+                return []
+        lines = self.read_lines()
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            # rotated away, the new file is not there yet
+            return lines
+        if stat.st_ino != self.inode:
+            # lines written to the old file before it was rotated were
+            # read above, continue with the new file from its start
+            self.close()
+            self.open()
+            lines.extend(self.read_lines())
+        elif stat.st_size < self.file.tell():
+            # truncated, e.g. by logrotate copytruncate
+            self.file.seek(0)
+            self.rest = b''
+            lines.extend(self.read_lines())
+        return lines
+
+    def read_lines(self):
+        """ Read the complete lines available in the open file """
+        data = self.file.read()
+        if not data:
+            return []
+        data = self.rest + data
+        end = data.rfind(b'\n') + 1
+        self.rest = data[end:]
+        return [line.decode(errors='replace')
+                for line in data[:end].splitlines(keepends=True)]
+
+
+class LogFollower:
+    """
+    Follow growing log files like 'tail -F'. Changes are waited for with
+    inotify, the files are polled if inotify is not available.
+
+    Args:
+        paths -- log files to follow, the order in which the lines of
+           every round are returned
+        interval -- seconds to wait for changes before the files are
+           checked anyway
+    """
+    def __init__(self, paths, interval=DEFAULT_INTERVAL):
+        self.files = [FollowedFile(path) for path in paths]
+        self.interval = interval
+        directories = {os.path.dirname(os.path.abspath(path))
+                       for path in paths}
+        self.inotify = inotify_init(sorted(directories))
+        if self.inotify is None:
+            logger.info("inotify is not available, polling the log files")
+
+    def close(self):
+        for followed in self.files:
+            followed.close()
+        if self.inotify is not None:
+            os.close(self.inotify)
+            self.inotify = None
+
+    def wait(self):
+        """ Wait for any of the watched directories to change """
+        if self.inotify is None:
+            time.sleep(self.interval)
+            return
+        ready, _, _ = select.select([self.inotify], [], [], self.interval)
+        if ready:
+            # the events themselves do not matter, all files are read
+            try:
+                while os.read(self.inotify, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def __iter__(self):
+        """
+        Yields:
+            (path, line) tuple of every line written to the files, until
+            the iteration is stopped
+        """
+        try:
+            while True:
+                for followed in self.files:
+                    for line in followed.read():
+                        yield followed.path, line
+                self.wait()
+        finally:
+            self.close()
@@ -0,0 +1,239 @@
+import os
+import re
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger()
+
+_CACHE_HOME = os.environ.get('XDG_CACHE_HOME',
+                             os.path.expanduser('~/.cache'))
+DEFAULT_CACHE_DIR = os.path.join(_CACHE_HOME, 'sssd', 'analyze')
+
+# [CID#N] chain id prefix, "CID #N]" in REQ_TRACE messages and [RID#N]
+_ID_RE = re.compile(rb'\[([CR]ID)#([0-9]+)\]|(CID) #([0-9]+)\]')
+# Backend REQ_TRACE message linking a RID to a responder client ID
+_LINK_RE = re.compile(rb'\[RID#([0-9]+)\].*REQ_TRACE.*'
+                      rb'\[sssd\.(\w+) CID #([0-9]+)\]')
+# (YYYY-MM-DD HH:MM:SS[:usec]): [program] [function]
+_PREFIX_RE = re.compile(rb'\([^)]*\): \[.*?\] \[(\w+)\]')
+
+
+class LogIndex:
+    """
+    A persistent index of byte offsets in a single SSSD log file
+
+    The log file is split into line aligned blocks of roughly BLOCK_SIZE
+    bytes. For every CID/RID and function name the index stores the blocks
+    in which they appear, so that a query only needs to read those blocks
+    instead of the whole file. Time windows need no index, log files are
+    bisected by timestamp, see bisect_timestamp().
+
+    The index is stored in a cache directory and validated by inode, size
+    and mtime of the log file. If the log file only grew since the index
+    was written, just the appended tail is scanned.
+
+    Args:
+        path -- the path of the log file
+        cache_dir -- directory where the index is stored
+    """
+    VERSION = 2
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, path, cache_dir=None):
+        self.path = path
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.index_path = self.get_index_path()
+        self.reset()
+
+    def reset(self):
+        """ Drop all indexed data """
+        self.inode = None
+        self.size = 0
+        self.mtime = 0
+        self.head = ""
+        self.scanned = 0
+        self.blocks = []
+        self.ids = {}
+        self.functions = {}
+        self.links = {}
+
+    def get_index_path(self):
+        realpath = os.path.realpath(self.path)
+        digest = hashlib.sha1(realpath.encode()).hexdigest()[:16]
+        name = os.path.basename(realpath)
+        return os.path.join(self.cache_dir, f'{name}-{digest}.idx')
+
+    def get_head(self, file):
+        """ Fingerprint of the start of the file, detects truncation """
+        file.seek(0)
+        return hashlib.sha1(file.read(256)).hexdigest()
+
+    def load(self):
+        """
+        Read the stored index, if any
+
+        Returns:
+            True if a compatible index was loaded, otherwise False
+        """
+        try:
+            with open(self.index_path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return False
+
+        if data.get('version') != self.VERSION:
+            return False
+
+        self.inode = data['inode']
+        self.size = data['size']
+        self.mtime = data['mtime']
+        self.head = data['head']
+        self.scanned = data['scanned']
+        self.blocks = data['blocks']
+        self.ids = data['ids']
+        self.functions = data['functions']
+        self.links = data['links']
+        return True
+
+    def save(self):
+        """ Store the index atomically in the cache directory """
+        data = {
+            'version': self.VERSION,
+            'path': self.path,
+            'inode': self.inode,
+            'size': self.size,
+            'mtime': self.mtime,
+            'head': self.head,
+            'scanned': self.scanned,
+            'blocks': self.blocks,
+            'ids': self.ids,
+            'functions': self.functions,
+            'links': self.links,
+        }
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'w') as file:
+                json.dump(data, file, separators=(',', ':'))
+            os.replace(tmp_path, self.index_path)
+        except OSError as err:
+            logger.warning(f"Could not store log index {self.index_path}")
+            logger.warning(err)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def update(self):
+        """
+        Make the index up to date with the log file, scanning only the
+        parts of the file which were not indexed yet.
+
+        Raises:
+            FileNotFoundError: if the log file does not exist
+        """
+        with open(self.path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            if not self.load() or stat.st_ino != self.inode \
+               or stat.st_size < self.scanned \
+               or self.get_head(file) != self.head:
+                self.reset()
+                self.inode = stat.st_ino
+                self.head = self.get_head(file)
+            elif stat.st_size == self.size and stat.st_mtime == self.mtime:
+                return
+
+            self.scan(file)
+            self.size = stat.st_size
+            self.mtime = stat.st_mtime
+
+        self.save()
+
+    def _add(self, table, key, block):
+        blocks = table.get(key)
+        if blocks is None:
+            table[key] = [block]
+        elif blocks[-1] != block:
+            blocks.append(block)
+
+    def scan(self, file):
+        """ Index all complete lines after the already scanned offset """
+        offset = self.scanned
+        file.seek(offset)
+        if not self.blocks:
+            self.blocks.append(offset)
+        block = len(self.blocks) - 1
+
+        for line in file:
+            if not line.endswith(b'\n'):
+                # partially written line, index it on the next update
+                break
+
+            if offset - self.blocks[block] >= self.BLOCK_SIZE:
+                self.blocks.append(offset)
+                block += 1
+            offset += len(line)
+
+            prefix = _PREFIX_RE.match(line)
+            if prefix:
+                self._add(self.functions, prefix.group(1).decode(), block)
+
+            for match in _ID_RE.finditer(line):
+                kind = (match.group(1) or match.group(3)).decode()
+                num = (match.group(2) or match.group(4)).decode()
+                self._add(self.ids, f'{kind}#{num}', block)
+
+            if b'REQ_TRACE' in line:
+                link = _LINK_RE.search(line)
+                if link:
+                    resp, cid = link.group(2).decode(), link.group(3).decode()
+                    key = f'{resp} CID#{cid}'
+                    rid = f'RID#{link.group(1).decode()}'
+                    rids = self.links.setdefault(key, [])
+                    if rid not in rids:
+                        rids.append(rid)
+
+        self.scanned = offset
+
+    def linked_ids(self, responder, cid):
+        """
+        Retrieve backend RIDs linked to a responder client ID
+
+        Args:
+            responder (str): responder name, e.g. nss or pam
+            cid (int): client ID
+
+        Returns:
+            List of linked ids, e.g. ['RID#3']
+        """
+        return list(self.links.get(f'{responder} CID#{cid}', []))
+
+    def lookup(self, ids=None, functions=None):
+        """
+        Retrieve byte ranges of the blocks containing any of the ids or
+        functions
+
+        Args:
+            ids (list of str): ids in the form 'CID#N' or 'RID#N'
+            functions (list of str): function names
+
+        Returns:
+            Sorted list of non-overlapping (start, end) byte offset tuples
+        """
+        found = set()
+        for key in ids or []:
+            found.update(self.ids.get(key, []))
+        for key in functions or []:
+            found.update(self.functions.get(key, []))
+
+        ranges = []
+        for block in sorted(found):
+            start = self.blocks[block]
+            end = self.blocks[block + 1] if block + 1 < len(self.blocks) \
+                else self.scanned
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
@@ -0,0 +1,209 @@
+import re
+import calendar
+
+from functools import lru_cache
+
+# Debug line prefix written by sss_vdebug_fn() in util/debug.c:
+# (YYYY-MM-DD HH:MM:SS[:usec]): [program] [function] (level): [CID#N] msg
+# The chain ID is present only if it is set, the program name may contain
+# brackets itself, e.g. be[LDAP] or krb5_child[1234].
+_LINE_RE = re.compile(r'\((?P<stamp>\d{4}-\d\d-\d\d [ \d]\d:\d\d:\d\d'
+                      r'(?::\d+)?)\): '
+                      r'\[(?P<component>.*?)\] \[(?P<function>[^\]]+)\] '
+                      r'\((?P<level>0x[0-9a-fA-F]+)\): '
+                      r'(?:\[(?P<chain>[CR])ID#(?P<chain_id>[0-9]+)\] )?'
+                      r'(?P<message>.*)', re.DOTALL)
+
+# Journald reader lines: YYYY-MM-DD HH:MM:SS[.usec]: msg
+_JOURNAL_RE = re.compile(r'(?P<stamp>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d'
+                         r'(?:\.\d+)?): (?P<message>.*)', re.DOTALL)
+
+BACKTRACE_PREFIX = '   *  '
+
+
+@lru_cache(maxsize=4096)
+def _epoch_seconds(stamp):
+    """ Seconds since the epoch of 'YYYY-MM-DD HH:MM:SS' """
+    if stamp[4] != '-' or stamp[13] != ':' or stamp[16] != ':':
+        raise ValueError(stamp)
+    return calendar.timegm((int(stamp[0:4]), int(stamp[5:7]),
+                            int(stamp[8:10]), int(stamp[11:13]),
+                            int(stamp[14:16]), int(stamp[17:19])))
+
+
+def parse_timestamp(line):
+    """
+    Parse the timestamp at the start of a log line without tokenizing
+    the rest of it.
+
+    Timestamps are returned as microseconds since the epoch, taken as
+    written by the logging host, i.e. in its local time. They are
+    suitable for ordering and for computing durations.
+
+    Args:
+        line (str): log line, files or journald format
+
+    Returns:
+        int timestamp, None if the line does not start with a timestamp
+    """
+    off = 1 if line.startswith('(') else 0
+    try:
+        seconds = _epoch_seconds(line[off:off + 19])
+    except (ValueError, IndexError):
+        return None
+    usec = 0
+    if line[off + 19:off + 20] in (':', '.'):
+        frac = line[off + 20:off + 26]
+        if frac.isdigit():
+            usec = int(frac.ljust(6, '0'))
+    return seconds * 1000000 + usec
+
+
+def parse_time(text):
+    """
+    Parse a user provided time in the format of the log files.
+
+    Args:
+        text (str): 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM' or
+            'YYYY-MM-DD HH:MM:SS'
+
+    Returns:
+        int timestamp comparable to parse_timestamp() results
+
+    Raises:
+        ValueError: if the text is not in any of the formats
+    """
+    text = text.strip().replace('T', ' ')
+    if len(text) == 10:
+        text += ' 00:00:00'
+    elif len(text) == 16:
+        text += ':00'
+    if len(text) != 19:
+        raise ValueError(text)
+    return _epoch_seconds(text) * 1000000
+
+
+class LogRecord:
+    """
+    A single SSSD debug log line, tokenized lazily on first access of
+    any of its fields. Create records only for lines which passed the
+    prefilter, the remaining lines are never tokenized.
+
+    Attributes:
+        line (str): the original line
+        timestamp (int): microseconds since the epoch, see
+            parse_timestamp(), None if the line has no timestamp
+        stamp (str): the timestamp as written in the line
+        component (str): program name, e.g. nss, be[LDAP], tagged with
+            the host name by the archives reader, e.g. nss@client1
+        host (str): host name of a tagged program name, or None
+        function (str): name of the logging function
+        level (int): debug level
+        cid (int): client ID of the responder chain ID, or None
+        rid (int): request ID of the backend chain ID, or None
+        message (str): the message without the chain ID, stripped of
+            the trailing newline
+    """
+    __slots__ = ('line', '_parsed', '_timestamp', '_stamp', '_component',
+                 '_function', '_level', '_cid', '_rid', '_message')
+
+    def __init__(self, line):
+        self.line = line
+        self._parsed = False
+
+    def _parse(self):
+        self._parsed = True
+        self._timestamp = None
+        self._stamp = None
+        self._component = None
+        self._function = None
+        self._level = None
+        self._cid = None
+        self._rid = None
+        self._message = None
+
+        match = _LINE_RE.match(self.line)
+        if match:
+            self._component = match.group('component')
+            self._function = match.group('function')
+            self._level = int(match.group('level'), 16)
+            if match.group('chain') == 'C':
+                self._cid = int(match.group('chain_id'))
+            elif match.group('chain') == 'R':
+                self._rid = int(match.group('chain_id'))
+        else:
+            match = _JOURNAL_RE.match(self.line)
+            if not match:
+                self._message = self.line.rstrip('\n')
+                return
+
+        self._stamp = match.group('stamp')
+        self._timestamp = parse_timestamp(self._stamp)
+        self._message = match.group('message').rstrip('\n')
+
+    @property
+    def valid(self):
+        """ True if the line starts with a debug prefix """
+        if not self._parsed:
+            self._parse()
+        return self._timestamp is not None
+
+    @property
+    def backtrace(self):
+        """ True if the line is part of a debug backtrace dump """
+        return self.line.startswith(BACKTRACE_PREFIX)
+
+    @property
+    def timestamp(self):
+        if not self._parsed:
+            self._parse()
+        return self._timestamp
+
+    @property
+    def stamp(self):
+        if not self._parsed:
+            self._parse()
+        return self._stamp
+
+    @property
+    def component(self):
+        if not self._parsed:
+            self._parse()
+        return self._component
+
+    @property
+    def host(self):
+        component = self.component
+        if component is None or '@' not in component:
+            return None
+        return component.rsplit('@', 1)[1]
+
+    @property
+    def function(self):
+        if not self._parsed:
+            self._parse()
+        return self._function
+
+    @property
+    def level(self):
+        if not self._parsed:
+            self._parse()
+        return self._level
+
+    @property
+    def cid(self):
+        if not self._parsed:
+            self._parse()
+        return self._cid
+
+    @property
+    def rid(self):
+        if not self._parsed:
+            self._parse()
+        return self._rid
+
+    @property
+    def message(self):
+        if not self._parsed:
+            self._parse()
+        return self._message
@@ -0,0 +1,107 @@
+import re
+
+
+class Matcher:
+    """
+    A compiled multi-pattern line matcher
+
+    All patterns are merged into a single regular expression alternation
+    which is compiled only once. A line matches if any of the patterns
+    matches (OR). Optional literals provide a cheap substring prefilter,
+    the regular expression only runs on lines containing at least one of
+    them.
+
+    The same patterns are also compiled for raw bytes, so that sources
+    can search memory mapped files with scan() and decode only the
+    matching lines.
+
+    Args:
+        patterns (list of str): Regular expression patterns
+        literals (list of str): Plain substrings, at least one of them
+            must be present in a matching line
+    """
+    def __init__(self, patterns, literals=None):
+        self.patterns = list(patterns)
+        self.literals = tuple(literals) if literals else ()
+        self.regex = None
+        self.bregex = None
+        self.bliteral_regex = None
+        if self.literals:
+            self.bliteral_regex = re.compile(b'|'.join(
+                re.escape(literal.encode()) for literal in self.literals))
+        if self.patterns:
+            joined = '|'.join(f'(?:{p})' for p in self.patterns)
+            self.regex = re.compile(joined)
+            self.bregex = re.compile(joined.encode())
+
+    def prefilter(self, line):
+        """
+        Cheap check whether line may match at all
+
+        Args:
+            line (str): line to check
+
+        Returns:
+            False if none of the literals is present in line, otherwise True
+        """
+        if not self.literals:
+            return True
+        for literal in self.literals:
+            if literal in line:
+                return True
+        return False
+
+    def search(self, line):
+        """
+        Search line for any of the patterns
+
+        Args:
+            line (str): line to search
+
+        Returns:
+            re.Match object of the first match, otherwise None
+        """
+        if self.regex is None or not self.prefilter(line):
+            return None
+        return self.regex.search(line)
+
+    def scan(self, buf, start=0, end=None):
+        """
+        Search raw bytes for matching lines
+
+        The buffer is searched for the literals (or for the patterns if
+        there are no literals) without splitting it into lines, only the
+        lines around the hits are extracted and checked.
+
+        Args:
+            buf (bytes-like): buffer to search, e.g. mmap object
+            start (int): offset of the first line to search
+            end (int): offset where the search ends, default end of buffer
+
+        Yields:
+            bytes: matching lines including the trailing newline
+        """
+        if self.bregex is None:
+            return
+        if end is None:
+            end = len(buf)
+
+        verify = self.bregex.search if self.literals else None
+        search = (self.bliteral_regex or self.bregex).search
+        rfind = buf.rfind
+        find = buf.find
+        pos = start
+        while pos < end:
+            hit = search(buf, pos, end)
+            if hit is None:
+                return
+
+            line_start = rfind(b'\n', pos, hit.start())
+            line_start = pos if line_start < 0 else line_start + 1
+            line_end = find(b'\n', hit.start(), end)
+            line_end = end if line_end < 0 else line_end + 1
+
+            line = buf[line_start:line_end]
+            if verify is None or verify(line):
+                yield line
+            pos = line_end
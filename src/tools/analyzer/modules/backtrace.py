@@ -0,0 +1,249 @@
+import re
+import hashlib
+import logging
+
+from sssd.parser import SubparsersAction
+from sssd.parser import Option
+from sssd.matcher import Matcher
+from sssd.source_reader import load_source
+from sssd.log_record import LogRecord, BACKTRACE_PREFIX
+
+logger = logging.getLogger()
+
+
+DEFAULT_TOP = 10
+
+# Start and end lines of backtrace dumps, see util/debug_backtrace.c
+_MARKER = '**********************'
+_END_MARKER = f'{_MARKER} BACKTRACE DUMP ENDS HERE'
+
+# Variable parts of messages, in the order they are replaced
+_TEMPLATE_RES = [
+    (re.compile(r'\[[^\[\]]*\]'), '[*]'),
+    (re.compile(r"'[^']*'"), "'*'"),
+    (re.compile(r'"[^"]*"'), '"*"'),
+    (re.compile(r'\S+@\S+'), '*'),
+    (re.compile(r'0x[0-9a-fA-F]+'), 'N'),
+    (re.compile(r'[0-9]+'), 'N'),
+]
+_CR_RE = re.compile(r'^CR #[0-9]+: ')
+# Program names with the PID of child helpers or the archives host tag
+_PROGRAM_RE = re.compile(r'^(.*?)(?:\[[0-9]+\])?(?:@.*)?$')
+
+
+def message_template(message):
+    """
+    Strip the variable parts of a message, numbers, names and bracketed
+    or quoted values, so that messages logged by the same code share the
+    same template.
+
+    Args:
+        message (str): log message
+
+    Returns:
+        The message template
+    """
+    for regex, replacement in _TEMPLATE_RES:
+        message = regex.sub(replacement, message)
+    return message
+
+
+class Hotspot:
+    """
+    Aggregate of all backtrace dumps of the same fingerprint
+    """
+    __slots__ = ('fingerprint', 'component', 'trigger', 'path', 'example',
+                 'count', 'first', 'last', 'time')
+
+    def __init__(self, fingerprint, component, path, example):
+        self.fingerprint = fingerprint
+        self.component = component
+        self.trigger = path[-1]
+        self.path = path
+        self.example = example
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.time = 0
+
+
+class BacktraceAnalyzer:
+    """
+    A backtrace analyzer module, groups the debug backtrace dumps written
+    on failures by the error path which led to them.
+    """
+    module_parser = None
+    report_opts = [
+        Option('--top', f'Number of error paths to print (default '
+               f'{DEFAULT_TOP})', int),
+        Option('--by-time', 'Sort by the time spent on the error paths',
+               bool),
+        Option('--verbose', 'Print the whole error path', bool, '-v'),
+    ]
+
+    def print_module_help(self, args):
+        """
+        Print the module parser help output
+
+        Args:
+            args (Namespace): argparse parsed arguments
+        """
+        self.module_parser.print_help()
+
+    def setup_args(self, parser_grp, cli):
+        """
+        Setup module parser, subcommands, and options
+
+        Args:
+            parser_grp (argparse.Action): Parser group to nest
+               module and subcommands under
+        """
+        desc = "Analyze debug backtrace dumps module"
+        self.module_parser = parser_grp.add_parser('backtrace',
+                                                   description=desc,
+                                                   help='Debug backtraces')
+
+        subparser = self.module_parser.add_subparsers(title=None,
+                                                      dest='subparser',
+                                                      action=SubparsersAction,
+                                                      metavar='COMMANDS')
+
+        subcmd_grp = subparser.add_parser_group('Operation Modes')
+        cli.add_subcommand(subcmd_grp, 'report',
+                           'Report the most frequent error paths',
+                           self.report, self.report_opts)
+
+        self.module_parser.set_defaults(func=self.print_module_help)
+
+        return self.module_parser
+
+    def blocks(self, source):
+        """
+        Group the lines of every backtrace dump
+
+        Args:
+            source (Reader): source Reader object
+
+        Yields:
+            list of LogRecord: lines of a single dump, oldest first
+        """
+        matcher = Matcher([f'^{re.escape(_MARKER)}',
+                           f'^{re.escape(BACKTRACE_PREFIX)}'],
+                          [_MARKER, BACKTRACE_PREFIX])
+        block = None
+        for line in source.search(matcher):
+            if line.startswith(_MARKER):
+                if block:
+                    yield block
+                block = None if line.startswith(_END_MARKER) else []
+                continue
+            if block is None:
+                continue
+            record = LogRecord(line[len(BACKTRACE_PREFIX):])
+            # '... skipping repetitive backtrace ...' lines are not valid
+            if record.valid:
+                block.append(record)
+        if block:
+            yield block
+
+    def error_path(self, block):
+        """
+        Select the lines of a dump which belong to the request of the
+        message which triggered it, the last one. The dump holds the
+        recent lines of all requests of the process.
+
+        Args:
+            block (list of LogRecord): lines of a single dump
+
+        Returns:
+            (path, duration) tuple, path is a tuple of (function, message
+            template) tuples, consecutive repeats are logged once
+        """
+        trigger = block[-1]
+        lines = [r for r in block if r.component == trigger.component]
+        if trigger.cid is not None or trigger.rid is not None:
+            lines = [r for r in lines
+                     if r.cid == trigger.cid and r.rid == trigger.rid]
+        # a client connection issues many cache_req requests in turn
+        match = _CR_RE.match(trigger.message)
+        if match:
+            lines = [r for r in lines
+                     if r.message.startswith(match.group(0))
+                     or not _CR_RE.match(r.message)]
+        path = []
+        for record in lines:
+            step = (record.function, message_template(record.message))
+            if not path or path[-1] != step:
+                path.append(step)
+        return tuple(path), lines[-1].timestamp - lines[0].timestamp
+
+    def collect(self, source, hotspots):
+        """
+        Fingerprint the backtrace dumps of the source
+
+        Args:
+            source (Reader): source Reader object, set to a component
+            hotspots (dict): Hotspot objects by fingerprint, updated
+        """
+        for block in self.blocks(source):
+            trigger = block[-1]
+            path, duration = self.error_path(block)
+            component = _PROGRAM_RE.match(trigger.component or '').group(1)
+            digest = hashlib.sha1(component.encode())
+            for function, template in path:
+                digest.update(f'\n{function} {template}'.encode())
+            fingerprint = digest.hexdigest()[:12]
+
+            hotspot = hotspots.get(fingerprint)
+            if hotspot is None:
+                hotspot = Hotspot(fingerprint, component, path,
+                                  trigger.message)
+                hotspot.first = trigger
+                hotspots[fingerprint] = hotspot
+            hotspot.count += 1
+            hotspot.time += duration
+            hotspot.last = trigger
+
+    def report(self, args):
+        """
+        Print the most frequent error paths leading to backtrace dumps
+
+        Args:
+            args (Namespace):  populated argparse namespace
+        """
+        source = load_source(args)
+        top = DEFAULT_TOP if args.top is None else args.top
+        hotspots = {}
+        for name, component, child in (
+                ('nss', source.Component.NSS, False),
+                ('pam', source.Component.PAM, False),
+                ('backend and child', source.Component.BE, True)):
+            logger.info(f"******** Reading {name} backtraces ********")
+            try:
+                source.set_component(component, child)
+            except IOError:
+                logger.warning(f"No {name} logs found, skipping")
+                continue
+            self.collect(source, hotspots)
+
+        if not hotspots:
+            logger.warning("No backtraces found in logs!")
+            return
+
+        order = 'time' if args.by_time else 'count'
+        total = sum(h.count for h in hotspots.values())
+        print(f"{total} backtraces, {len(hotspots)} error paths\n")
+        for hotspot in sorted(hotspots.values(),
+                              key=lambda h: getattr(h, order),
+                              reverse=True)[:top]:
+            function, template = hotspot.trigger
+            print(f"{hotspot.fingerprint}  count {hotspot.count}  "
+                  f"time {hotspot.time / 1000:.3f} ms")
+            print(f"    first {hotspot.first.stamp}  "
+                  f"last {hotspot.last.stamp}")
+            print(f"    [{hotspot.component}] [{function}] {template}")
+            print(f"    e.g. {hotspot.example}")
+            if args.verbose:
+                for function, template in hotspot.path:
+                    print(f"        [{function}] {template}")
+            print()
@@ -0,0 +1,220 @@
+import re
+import logging
+
+from datetime import datetime, timezone
+
+from sssd.parser import SubparsersAction
+from sssd.parser import Option
+from sssd.matcher import Matcher
+from sssd.source_reader import load_source
+from sssd.log_record import LogRecord
+
+logger = logging.getLogger()
+
+
+DEFAULT_INTERVAL = 60
+
+# Request classes, a request searching several domains is classified by
+# its most expensive lookup
+NEGATIVE = 0
+CACHE = 1
+MIDPOINT = 2
+DP = 3
+CLASS_NAMES = ('negative', 'cache', 'midpoint', 'dp')
+
+_CR_RE = re.compile(r'^CR #([0-9]+): ')
+_DOMAIN_RE = re.compile(r'Using domain \[(.*)\]')
+
+# Messages of cache_req_search.c, in class order
+_CLASS_MESSAGES = ('does not exist (negative cache)',
+                   'from cache',
+                   'Performing midpoint cache update',
+                   'in data provider')
+
+
+class CacheAnalyzer:
+    """
+    A cache efficiency analyzer module, classifies responder requests by
+    how they were answered.
+    """
+    module_parser = None
+    ratio_opts = [
+        Option('--pam', 'Report PAM requests', bool),
+        Option('--interval', f'Length of the time buckets in minutes '
+               f'(default {DEFAULT_INTERVAL})', int),
+    ]
+
+    def print_module_help(self, args):
+        """
+        Print the module parser help output
+
+        Args:
+            args (Namespace): argparse parsed arguments
+        """
+        self.module_parser.print_help()
+
+    def setup_args(self, parser_grp, cli):
+        """
+        Setup module parser, subcommands, and options
+
+        Args:
+            parser_grp (argparse.Action): Parser group to nest
+               module and subcommands under
+        """
+        desc = "Analyze responder cache efficiency module"
+        self.module_parser = parser_grp.add_parser('cache',
+                                                   description=desc,
+                                                   help='Cache efficiency')
+
+        subparser = self.module_parser.add_subparsers(title=None,
+                                                      dest='subparser',
+                                                      action=SubparsersAction,
+                                                      metavar='COMMANDS')
+
+        subcmd_grp = subparser.add_parser_group('Operation Modes')
+        cli.add_subcommand(subcmd_grp, 'ratio',
+                           'Report cache hit and miss ratios',
+                           self.ratio, self.ratio_opts)
+
+        self.module_parser.set_defaults(func=self.print_module_help)
+
+        return self.module_parser
+
+    def classify(self, source):
+        """
+        Classify responder requests as answered from the negative cache,
+        from the cache, from the cache with a midpoint refresh or after a
+        blocking data provider round trip.
+
+        Args:
+            source (Reader): source Reader object, set to the responder
+
+        Yields:
+            (timestamp, domain, class) tuple of every classified request,
+            the timestamp is the one of its last line
+        """
+        patterns = [r'CR #[0-9]+: Using domain \[',
+                    r'CR #[0-9]+: Finished: ',
+                    r'CR #[0-9]+: .*('
+                    + '|'.join(re.escape(m) for m in _CLASS_MESSAGES) + ')']
+        matcher = Matcher(patterns, ['Using domain', 'Finished: ',
+                                     'negative cache', 'from cache',
+                                     'midpoint', 'data provider'])
+        # (component, CR) -> [current domain, class, domain of class, time]
+        active = {}
+        for line in source.search(matcher):
+            record = LogRecord(line)
+            if record.backtrace or not record.valid:
+                continue
+            msg = record.message
+            match = _CR_RE.match(msg)
+            if not match:
+                continue
+            # CR numbers are unique within a single responder process
+            key = (record.component, match.group(1))
+            state = active.get(key)
+            if state is None:
+                state = [None, None, None, None]
+                active[key] = state
+            state[3] = record.timestamp
+
+            if 'Finished: ' in msg:
+                del active[key]
+                if state[1] is not None:
+                    yield state[3], state[2], state[1]
+                continue
+
+            match = _DOMAIN_RE.search(msg)
+            if match:
+                state[0] = match.group(1)
+                continue
+
+            for cls, message in enumerate(_CLASS_MESSAGES):
+                if message in msg:
+                    if state[1] is None or cls > state[1]:
+                        state[1] = cls
+                        state[2] = state[0]
+                    break
+
+        # requests still running at the end of the logs
+        for state in active.values():
+            if state[1] is not None:
+                yield state[3], state[2], state[1]
+
+    def format_bucket(self, bucket):
+        """ Format a bucket timestamp as written in the logs """
+        when = datetime.fromtimestamp(bucket / 1000000, timezone.utc)
+        return when.strftime('%Y-%m-%d %H:%M')
+
+    def print_row(self, name, counts):
+        """
+        Print the request count and ratio of every class
+
+        Args:
+            name (str): row name
+            counts (list of int): request counts by class
+        """
+        total = sum(counts)
+        line = f"{name:<16}  {total:>8}"
+        for count in counts:
+            line += f"  {100 * count / total:>8.1f}%"
+        print(line)
+
+    def ratio(self, args):
+        """
+        Print the ratios of the request classes per domain and time bucket
+
+        Args:
+            args (Namespace):  populated argparse namespace
+        """
+        source = load_source(args)
+        component = source.Component.NSS
+        resp = "nss"
+        if args.pam:
+            component = source.Component.PAM
+            resp = "pam"
+        interval = DEFAULT_INTERVAL if args.interval is None \
+            else args.interval
+        if interval <= 0:
+            logger.error("Interval must be a positive number of minutes")
+            return
+        interval *= 60 * 1000000
+
+        logger.info(f"******** Classifying {resp} client requests ********")
+        source.set_component(component, False)
+        source.set_filter(functions=['cache_req_set_domain',
+                                     'cache_req_search_ncache',
+                                     'cache_req_search_send',
+                                     'cache_req_search_dp',
+                                     'cache_req_process_result',
+                                     'cache_req_done'])
+
+        # domain -> bucket -> counts by class
+        domains = {}
+        for timestamp, domain, cls in self.classify(source):
+            buckets = domains.setdefault(domain or '-', {})
+            bucket = timestamp - timestamp % interval
+            counts = buckets.get(bucket)
+            if counts is None:
+                counts = [0] * len(CLASS_NAMES)
+                buckets[bucket] = counts
+            counts[cls] += 1
+
+        if not domains:
+            logger.warning("No classified requests found in logs!")
+            return
+
+        header = f"{'':<16}  {'requests':>8}"
+        for name in CLASS_NAMES:
+            header += f"  {name:>9}"
+        for domain in sorted(domains):
+            buckets = domains[domain]
+            print(f"Domain: {domain}")
+            print(header)
+            total = [0] * len(CLASS_NAMES)
+            for bucket in sorted(buckets):
+                counts = buckets[bucket]
+                self.print_row(self.format_bucket(bucket), counts)
+                total = [a + b for a, b in zip(total, counts)]
+            self.print_row('total', total)
+            print()
@@ -0,0 +1,431 @@
+import re
+import heapq
+import logging
+
+from collections import deque
+
+from sssd.parser import SubparsersAction
+from sssd.parser import Option
+from sssd.matcher import Matcher
+from sssd.source_reader import load_source
+from sssd.log_record import LogRecord
+from sssd.modules.request import timestamp_key
+
+logger = logging.getLogger()
+
+
+DEFAULT_TOP = 10
+DEFAULT_CAPACITY = 1000
+
+# Seconds after which clients, requests and backend requests not seen
+# again are dropped, e.g. when their last line is missing from the logs
+STALE = 600
+
+_CR_RE = re.compile(r'^CR #([0-9]+): ')
+_NEW_CR_RE = re.compile(r"New request \[CID #([0-9]+)\] '(.*)'")
+_CLIENT_RE = re.compile(r'\[cmd (.*)\]\[uid ([0-9]+)\]')
+_NEW_DP_RE = re.compile(r'REQ_TRACE: New request\. '
+                        r'\[sssd\.(\w+) CID #([0-9]+)\]')
+
+
+def tagged(lines, backend):
+    """ Pair every line with the backend flag """
+    for line in lines:
+        yield line, backend
+
+
+class HeavyHitter:
+    """
+    Counters of a single monitored key
+    """
+    __slots__ = ('key', 'count', 'error', 'misses', 'failed', 'backend')
+
+    def __init__(self, key, error):
+        self.key = key
+        self.count = error
+        self.error = error
+        self.misses = 0
+        self.failed = 0
+        self.backend = 0
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitter counting, see Metwally et al., "Efficient
+    Computation of Frequent and Top-k Elements in Data Streams".
+
+    At most capacity keys are monitored. A new key replaces the key with
+    the lowest count and inherits that count as its maximum error, so the
+    count of a monitored key is never underestimated and every key more
+    frequent than 1/capacity of the stream is monitored. The cache misses,
+    failures and backend time of a replaced key are lost, they are counted
+    only while a key is monitored.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counters = {}
+        # (count, sequence, key) entries, an entry may hold a count lower
+        # than the current count of its key
+        self.heap = []
+        self.sequence = 0
+        self.total = 0
+
+    def evict(self):
+        """
+        Stop monitoring the key with the lowest count
+
+        Returns:
+            The count of the evicted key
+        """
+        while True:
+            count, _, key = heapq.heappop(self.heap)
+            counter = self.counters[key]
+            if count == counter.count:
+                del self.counters[key]
+                return count
+            self.push(counter)
+
+    def push(self, counter):
+        """ Add the current count of a key to the heap """
+        self.sequence += 1
+        heapq.heappush(self.heap, (counter.count, self.sequence,
+                                   counter.key))
+
+    def add(self, key, miss=False, failed=False, backend=0):
+        """
+        Count a single request
+
+        Args:
+            key (hashable): key to count
+            miss (bool): the request was not answered from the cache
+            failed (bool): the request finished with an error
+            backend (int): backend time of the request in microseconds
+        """
+        self.total += 1
+        counter = self.counters.get(key)
+        if counter is None:
+            error = 0
+            if len(self.counters) >= self.capacity:
+                error = self.evict()
+            counter = HeavyHitter(key, error)
+            self.counters[key] = counter
+            self.push(counter)
+        counter.count += 1
+        if miss:
+            counter.misses += 1
+        if failed:
+            counter.failed += 1
+        counter.backend += backend
+
+    def top(self, count):
+        """
+        Returns:
+            List of the HeavyHitter objects with the highest counts
+        """
+        return heapq.nlargest(count, self.counters.values(),
+                              key=lambda c: c.count)
+
+
+class ClientsAnalyzer:
+    """
+    A responder clients analyzer module, finds the client processes,
+    users and lookup types issuing the most requests.
+    """
+    module_parser = None
+    top_opts = [
+        Option('--pam', 'Report PAM requests', bool),
+        Option('--top', f'Number of clients to print (default '
+               f'{DEFAULT_TOP})', int),
+        Option('--capacity', f'Number of clients to count per table, '
+               f'bounds the memory used (default {DEFAULT_CAPACITY})', int),
+        Option('--no-backend', 'Do not read the backend logs', bool),
+    ]
+
+    def print_module_help(self, args):
+        """
+        Print the module parser help output
+
+        Args:
+            args (Namespace): argparse parsed arguments
+        """
+        self.module_parser.print_help()
+
+    def setup_args(self, parser_grp, cli):
+        """
+        Setup module parser, subcommands, and options
+
+        Args:
+            parser_grp (argparse.Action): Parser group to nest
+               module and subcommands under
+        """
+        desc = "Analyze responder clients module"
+        self.module_parser = parser_grp.add_parser('clients',
+                                                   description=desc,
+                                                   help='Responder clients')
+
+        subparser = self.module_parser.add_subparsers(title=None,
+                                                      dest='subparser',
+                                                      action=SubparsersAction,
+                                                      metavar='COMMANDS')
+
+        subcmd_grp = subparser.add_parser_group('Operation Modes')
+        cli.add_subcommand(subcmd_grp, 'top',
+                           'Report the clients issuing the most requests',
+                           self.top, self.top_opts)
+
+        self.module_parser.set_defaults(func=self.print_module_help)
+
+        return self.module_parser
+
+    def add_backend(self, record, resp, active, linked):
+        """
+        Track the data provider requests linked to responder client IDs
+
+        Args:
+            record (LogRecord): backend log line
+            resp (str): responder name, e.g. nss or pam
+            active (dict): running requests by (component, RID), updated
+            linked (dict): deques of (start, duration) tuples of finished
+                requests by (host, CID), updated
+        """
+        if record.rid is None:
+            return
+        # RIDs are unique within a single backend process
+        key = (record.component, record.rid)
+        match = _NEW_DP_RE.search(record.message)
+        if match:
+            if match.group(1) == resp:
+                active[key] = ((record.host, int(match.group(2))),
+                               record.timestamp)
+            return
+        found = active.pop(key, None)
+        if found is not None:
+            cid, start = found
+            linked.setdefault(cid, deque()).append(
+                (start, record.timestamp - start))
+
+    def backend_time(self, spans, start, end):
+        """
+        Sum up the data provider requests started while a request of their
+        client ID was running, earlier requests are dropped.
+
+        Args:
+            spans (deque): (start, duration) tuples of the client ID
+            start (int): start timestamp of the responder request
+            end (int): end timestamp of the responder request
+
+        Returns:
+            Backend time in microseconds
+        """
+        spent = 0
+        while spans and spans[0][0] <= end:
+            span_start, duration = spans.popleft()
+            if span_start >= start:
+                spent += duration
+        return spent
+
+    def drop_stale(self, now, clients, requests, active, linked):
+        """ Drop the entries not seen for STALE seconds """
+        limit = now - STALE * 1000000
+        for entries, stamp in ((clients, lambda e: e[2]),
+                               (requests, lambda e: e[2]),
+                               (active, lambda e: e[1])):
+            for key in [k for k, e in entries.items() if stamp(e) < limit]:
+                del entries[key]
+        for cid in list(linked):
+            spans = linked[cid]
+            while spans and spans[0][0] < limit:
+                spans.popleft()
+            if not spans:
+                del linked[cid]
+
+    def count_requests(self, lines, resp, capacity):
+        """
+        Count the finished responder requests in a single pass over the
+        responder and backend lines merged by time. Only the requests still
+        running, the clients still connected and the backend requests not
+        claimed yet are kept.
+
+        Args:
+            lines (iterable): (line, backend) tuples in time order, backend
+                is True for backend lines
+            resp (str): responder name, e.g. nss or pam
+            capacity (int): number of keys monitored per table
+
+        Returns:
+            (tables, first, last) tuple, dictionary of SpaceSaving objects
+            by table title and the timestamps of the first and last request
+        """
+        tables = {title: SpaceSaving(capacity)
+                  for title in ('Command', 'UID', 'Lookup',
+                                'Command / UID / Lookup')}
+        # (host, cid) -> [cmd, uid, last request start]
+        clients = {}
+        # (component, CR) -> [(host, cid), plugin, start, miss]
+        requests = {}
+        # data provider requests, running and finished
+        active = {}
+        linked = {}
+        first = None
+        last = None
+        dropped = None
+        for line, backend in lines:
+            record = LogRecord(line)
+            if record.backtrace or not record.valid:
+                continue
+            now = record.timestamp
+            if dropped is None or now - dropped > STALE * 1000000:
+                self.drop_stale(now, clients, requests, active, linked)
+                dropped = now
+            if backend:
+                self.add_backend(record, resp, active, linked)
+                continue
+
+            msg = record.message
+            match = _CR_RE.match(msg)
+            if not match:
+                cid = (record.host, record.cid)
+                if record.cid is None:
+                    continue
+                match = _CLIENT_RE.search(msg)
+                if match:
+                    clients[cid] = [match.group(1), match.group(2), now]
+                elif 'Client disconnected' in msg:
+                    clients.pop(cid, None)
+                    linked.pop(cid, None)
+                continue
+
+            # CR numbers are unique within a single responder process
+            key = (record.component, match.group(1))
+            if 'New request' in msg:
+                match = _NEW_CR_RE.search(msg)
+                if match:
+                    cid = (record.host, int(match.group(1)))
+                    requests[key] = [cid, match.group(2), now, False]
+                    if cid in clients:
+                        clients[cid][2] = now
+                continue
+
+            request = requests.get(key)
+            if request is None:
+                continue
+            if 'Finished: ' not in msg:
+                request[3] = True
+                continue
+            del requests[key]
+
+            cid, plugin, start, miss = request
+            failed = 'Finished: Error' in msg
+            if first is None:
+                first = start
+            last = now
+            spent = 0
+            if cid in linked:
+                spent = self.backend_time(linked[cid], start, now)
+                if not linked[cid]:
+                    del linked[cid]
+            cmd, uid, _ = clients.get(cid, ('-', '-', None))
+            for title, counted in (('Command', cmd), ('UID', uid),
+                                   ('Lookup', plugin),
+                                   ('Command / UID / Lookup',
+                                    f'{cmd} / {uid} / {plugin}')):
+                tables[title].add(counted, miss, failed, spent)
+            # logs of many hosts read by the archives reader
+            if cid[0] is not None:
+                if 'Host' not in tables:
+                    tables['Host'] = SpaceSaving(capacity)
+                tables['Host'].add(cid[0], miss, failed, spent)
+
+        return tables, first, last
+
+    def print_table(self, title, table, count, seconds):
+        """
+        Print the keys with the highest request counts
+
+        Args:
+            title (str): title of the key column
+            table (SpaceSaving): counted requests
+            count (int): number of keys to print
+            seconds (float): length of the counted time window
+        """
+        hitters = table.top(count)
+        width = max([len(title)] + [len(str(h.key)) for h in hitters])
+        print(f"{title:<{width}}  {'requests':>9}  {'share':>6}  "
+              f"{'req/s':>8}  {'misses':>7}  {'failed':>7}  "
+              f"{'backend':>10}  {'overcount':>9}")
+        for hitter in hitters:
+            rate = hitter.count / seconds if seconds else 0
+            print(f"{hitter.key:<{width}}  {hitter.count:>9}  "
+                  f"{100 * hitter.count / table.total:>5.1f}%  "
+                  f"{rate:>8.1f}  {hitter.misses:>7}  {hitter.failed:>7}  "
+                  f"{hitter.backend / 1000000:>9.3f}s  {hitter.error:>9}")
+        print()
+
+    def top(self, args):
+        """
+        Print the client commands, UIDs and lookup types issuing the most
+        responder requests
+
+        Args:
+            args (Namespace):  populated argparse namespace
+        """
+        source = load_source(args)
+        component = source.Component.NSS
+        resp = "nss"
+        if args.pam:
+            component = source.Component.PAM
+            resp = "pam"
+        count = DEFAULT_TOP if args.top is None else args.top
+        capacity = DEFAULT_CAPACITY if args.capacity is None \
+            else args.capacity
+        if count <= 0 or capacity <= 0:
+            logger.error("--top and --capacity must be positive numbers")
+            return
+        capacity = max(capacity, count)
+
+        # every log file is time ordered, the backend and responder files
+        # are read in step so that backend requests are kept only until
+        # the responder request claims them
+        streams = []
+        if not args.no_backend:
+            logger.info("******** Reading backend requests ********")
+            backend = load_source(args)
+            backend.set_component(backend.Component.BE, False)
+            backend.set_filter(functions=['dp_attach_req', 'dp_req_done'])
+            matcher = Matcher([r'REQ_TRACE: New request\. \[sssd\.',
+                               r'Request handler finished'],
+                              ['New request. [sssd.',
+                               'Request handler finished'])
+            # backend lines first on equal timestamps
+            streams.extend(tagged(partition.search(matcher), True)
+                           for partition in backend.partitions())
+
+        logger.info(f"******** Counting {resp} client requests ********")
+        source.set_component(component, False)
+        source.set_filter(functions=['accept_fd_handler', 'client_recv',
+                                     'cache_req_send',
+                                     'cache_req_search_dp',
+                                     'cache_req_process_result',
+                                     'cache_req_done'])
+        matcher = Matcher([r'\[cmd .*connected',
+                           r'Client disconnected!',
+                           r'REQ_TRACE: New request \[CID #',
+                           r'CR #[0-9]+: .*in data provider',
+                           r'CR #[0-9]+: Finished: '],
+                          ['[cmd', 'Client disconnected', 'New request [CID',
+                           'in data provider', 'Finished: '])
+        streams.extend(tagged(partition.search(matcher), False)
+                       for partition in source.partitions())
+        lines = heapq.merge(*streams, key=lambda item: timestamp_key(item[0]))
+        tables, first, last = self.count_requests(lines, resp, capacity)
+        if first is None:
+            logger.warning("No finished requests found in logs!")
+            return
+
+        seconds = (last - first) / 1000000
+        total = tables['Command'].total
+        print(f"{total} requests in {seconds:.1f} seconds, misses are "
+              f"requests sent to the data provider,\novercount is how much "
+              f"a request count may be too high, see --capacity\n")
+        for title, table in tables.items():
+            self.print_table(title, table, count, seconds)
@@ -0,0 +1,371 @@
+import os
+import logging
+import sqlite3
+import itertools
+
+from sssd.parser import SubparsersAction
+from sssd.parser import Option
+from sssd.source_reader import load_source
+from sssd.log_record import LogRecord, BACKTRACE_PREFIX
+from sssd.log_index import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger()
+
+
+DEFAULT_DB = os.path.join(DEFAULT_CACHE_DIR, 'logs.db')
+
+# Rows inserted per executemany() call
+BATCH_SIZE = 10000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS lines (
+    timestamp INTEGER,
+    host TEXT,
+    component TEXT,
+    function TEXT,
+    level INTEGER,
+    cid INTEGER,
+    rid INTEGER,
+    backtrace INTEGER,
+    message TEXT
+)
+'''
+
+# Created after the first bulk load, maintained by later ones
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS lines_timestamp ON lines (timestamp)',
+    'CREATE INDEX IF NOT EXISTS lines_cid ON lines (cid)',
+    'CREATE INDEX IF NOT EXISTS lines_rid ON lines (rid)',
+    'CREATE INDEX IF NOT EXISTS lines_function ON lines (function)',
+]
+
+# Start and end lines of backtrace dumps, see util/debug_backtrace.c
+_BACKTRACE_MARKER = '**********'
+
+_TIME = "strftime('%Y-%m-%d %H:%M:%S', {} / 1000000, 'unixepoch')"
+
+# Canned reports of 'db query --report'
+REPORTS = {
+    'summary': ('Lines and time range per host and program',
+                f'SELECT host, component, count(*) AS lines, '
+                f'{_TIME.format("min(timestamp)")} AS first, '
+                f'{_TIME.format("max(timestamp)")} AS last '
+                f'FROM lines GROUP BY host, component '
+                f'ORDER BY host, component'),
+    'errors': ('Most frequent messages of failure levels (0x0040 and '
+               'lower)',
+               'SELECT component, function, printf(\'%#.4x\', level) AS '
+               'level, count(*) AS count, min(message) AS message '
+               'FROM lines WHERE level <= 0x0040 AND NOT backtrace '
+               'GROUP BY component, function, level '
+               'ORDER BY count DESC LIMIT 20'),
+    'functions': ('Functions logging the most lines',
+                  'SELECT component, function, count(*) AS lines '
+                  'FROM lines GROUP BY component, function '
+                  'ORDER BY lines DESC LIMIT 20'),
+    'chains': ('Chain IDs logging the most lines, long running or '
+               'looping requests',
+               f'SELECT host, component, cid, rid, count(*) AS lines, '
+               f'{_TIME.format("min(timestamp)")} AS first, '
+               f'(max(timestamp) - min(timestamp)) / 1000 AS ms '
+               f'FROM lines WHERE cid IS NOT NULL OR rid IS NOT NULL '
+               f'GROUP BY host, component, cid, rid '
+               f'ORDER BY lines DESC LIMIT 20'),
+}
+
+
+def line_rows(lines):
+    """
+    Turn log lines into rows of the lines table. Lines without debug
+    prefix, e.g. continuation lines of multi-line messages, are appended
+    to the message of the row before.
+
+    Args:
+        lines (iterable of str): log lines
+
+    Yields:
+        tuple: (timestamp, host, component, function, level, cid, rid,
+            backtrace, message) row
+    """
+    row = None
+    for line in lines:
+        # start and end markers of backtrace dumps
+        if line.startswith(_BACKTRACE_MARKER):
+            continue
+        backtrace = line.startswith(BACKTRACE_PREFIX)
+        record = LogRecord(line[len(BACKTRACE_PREFIX):] if backtrace
+                           else line)
+        if not record.valid:
+            if row is not None:
+                row[8] += '\n' + line.rstrip('\n')
+            continue
+        if row is not None:
+            yield tuple(row)
+        component = record.component
+        if component is not None and record.host is not None:
+            component = component.rsplit('@', 1)[0]
+        row = [record.timestamp, record.host, component, record.function,
+               record.level, record.cid, record.rid, int(backtrace),
+               record.message]
+    if row is not None:
+        yield tuple(row)
+
+
+class DatabaseAnalyzer:
+    """
+    A log database module, loads parsed log lines into a SQLite database
+    to run many queries without reading the logs again.
+    """
+    module_parser = None
+    ingest_opts = [
+        Option('--db', f'Database file (default {DEFAULT_DB})', str),
+        Option('--replace', 'Drop all lines loaded before', bool),
+    ]
+    query_opts = [
+        Option('--db', f'Database file (default {DEFAULT_DB})', str),
+        Option('--sql', 'SQL statement to run', str),
+        Option('--report', 'Canned report to run, see the list printed '
+               'without --sql and --report', str),
+    ]
+
+    def print_module_help(self, args):
+        """
+        Print the module parser help output
+
+        Args:
+            args (Namespace): argparse parsed arguments
+        """
+        self.module_parser.print_help()
+
+    def setup_args(self, parser_grp, cli):
+        """
+        Setup module parser, subcommands, and options
+
+        Args:
+            parser_grp (argparse.Action): Parser group to nest
+               module and subcommands under
+        """
+        desc = "Log database module"
+        self.module_parser = parser_grp.add_parser('db',
+                                                   description=desc,
+                                                   help='Log database')
+
+        subparser = self.module_parser.add_subparsers(title=None,
+                                                      dest='subparser',
+                                                      action=SubparsersAction,
+                                                      metavar='COMMANDS')
+
+        subcmd_grp = subparser.add_parser_group('Operation Modes')
+        cli.add_subcommand(subcmd_grp, 'ingest',
+                           'Load the logs into the database',
+                           self.ingest, self.ingest_opts)
+        cli.add_subcommand(subcmd_grp, 'query',
+                           'Query the database',
+                           self.query, self.query_opts)
+
+        self.module_parser.set_defaults(func=self.print_module_help)
+
+        return self.module_parser
+
+    def connect(self, path):
+        """
+        Open the database, the directory is created if needed
+
+        Returns:
+            sqlite3.Connection object, None on failure
+        """
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            return sqlite3.connect(path)
+        except (OSError, sqlite3.Error) as err:
+            logger.error(f"Could not open database {path}")
+            logger.error(err)
+            return None
+
+    def newest(self, conn):
+        """
+        Find where loading the logs of each program stopped the last time
+
+        Args:
+            conn (sqlite3.Connection): database connection
+
+        Returns:
+            Dictionary of (timestamp, count) tuples by (host, component),
+            the newest timestamp stored and the number of rows stored with
+            that timestamp
+        """
+        cursor = conn.execute(
+            'SELECT lines.host, lines.component, lines.timestamp, count(*) '
+            'FROM lines JOIN (SELECT host, component, max(timestamp) AS '
+            'newest FROM lines GROUP BY host, component) AS last '
+            'ON lines.host IS last.host '
+            'AND lines.component IS last.component '
+            'AND lines.timestamp = last.newest '
+            'GROUP BY lines.host, lines.component')
+        return {(host, component): (timestamp, count)
+                for host, component, timestamp, count in cursor}
+
+    def new_rows(self, rows, newest):
+        """
+        Skip the rows already stored. Timestamps have a resolution of one
+        second unless debug_microseconds is enabled, so of the rows logged
+        at the newest stored timestamp only as many as stored are skipped.
+
+        Args:
+            rows (iterable of tuple): rows of the logs, in file order
+            newest (dict): result of newest()
+
+        Yields:
+            tuple: rows not stored yet
+        """
+        skipped = {}
+        for row in rows:
+            key = (row[1], row[2])
+            stored = newest.get(key)
+            if stored is not None:
+                timestamp, count = stored
+                if row[0] < timestamp:
+                    continue
+                if row[0] == timestamp and skipped.get(key, 0) < count:
+                    skipped[key] = skipped.get(key, 0) + 1
+                    continue
+            yield row
+
+    def insert(self, conn, rows, newest):
+        """
+        Insert rows in batches within a single transaction. Rows already
+        stored are skipped, see new_rows(), so growing log files can be
+        loaded again.
+
+        Args:
+            conn (sqlite3.Connection): database connection
+            rows (iterable of tuple): rows to insert
+            newest (dict): result of newest()
+
+        Returns:
+            Number of rows inserted
+        """
+        rows = self.new_rows(rows, newest)
+        count = 0
+        with conn:
+            while True:
+                batch = list(itertools.islice(rows, BATCH_SIZE))
+                if not batch:
+                    break
+                conn.executemany('INSERT INTO lines VALUES '
+                                 '(?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+                count += len(batch)
+        return count
+
+    def ingest(self, args):
+        """
+        Load the lines of all components into the database
+
+        Args:
+            args (Namespace):  populated argparse namespace
+        """
+        path = args.db or DEFAULT_DB
+        conn = self.connect(path)
+        if conn is None:
+            return
+        source = load_source(args)
+        try:
+            # the database can be rebuilt from the logs at any time
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+            if args.replace:
+                conn.execute('DROP TABLE IF EXISTS lines')
+            conn.execute(SCHEMA)
+            newest = self.newest(conn)
+
+            total = 0
+            for name, component, child in (
+                    ('nss', source.Component.NSS, False),
+                    ('pam', source.Component.PAM, False),
+                    ('backend', source.Component.BE, False),
+                    ('child', source.Component.CHILD, False)):
+                logger.info(f"******** Loading {name} logs ********")
+                try:
+                    source.set_component(component, child)
+                except IOError:
+                    logger.warning(f"No {name} logs found, skipping")
+                    continue
+                count = self.insert(conn, line_rows(source), newest)
+                logger.info(f"Loaded {count} lines")
+                total += count
+
+            logger.info("******** Indexing ********")
+            with conn:
+                for index in INDEXES:
+                    conn.execute(index)
+        except sqlite3.Error as err:
+            logger.error(f"Could not load logs into {path}")
+            logger.error(err)
+            return
+        finally:
+            conn.close()
+        print(f"Loaded {total} lines into {path}")
+
+    def print_rows(self, cursor):
+        """
+        Print the result rows of a query as a table
+
+        Args:
+            cursor (sqlite3.Cursor): executed query
+        """
+        if cursor.description is None:
+            return
+        header = [column[0] for column in cursor.description]
+        rows = [['' if value is None else str(value) for value in row]
+                for row in cursor]
+        widths = [max([len(header[i])] + [len(row[i].split('\n')[0])
+                                          for row in rows])
+                  for i in range(len(header))]
+        # the last column, usually a message, is not padded
+        widths[-1] = 0
+        print('  '.join(f'{name:<{width}}'
+                        for name, width in zip(header, widths)).rstrip())
+        for row in rows:
+            print('  '.join(f'{value:<{width}}'
+                            for value, width in zip(row, widths)).rstrip())
+
+    def query(self, args):
+        """
+        Run an SQL statement or a canned report
+
+        Args:
+            args (Namespace):  populated argparse namespace
+        """
+        if args.sql is None and args.report is None:
+            print("Canned reports, run with --report NAME\n")
+            for name, (help_msg, _) in REPORTS.items():
+                print(f"{name:<12}{help_msg}")
+            print("\nColumns of the lines table: timestamp (microseconds "
+                  "since the epoch), host,\ncomponent, function, level, "
+                  "cid, rid, backtrace, message")
+            return
+        sql = args.sql
+        if args.report is not None:
+            if args.report not in REPORTS:
+                logger.error(f"Unknown report {args.report}, known reports:"
+                             f" {', '.join(REPORTS)}")
+                return
+            sql = REPORTS[args.report][1]
+
+        path = args.db or DEFAULT_DB
+        if not os.path.exists(path):
+            logger.error(f"Database {path} not found, run 'db ingest' "
+                         f"first")
+            return
+        conn = self.connect(path)
+        if conn is None:
+            return
+        try:
+            self.print_rows(conn.execute(sql))
+        except sqlite3.Error as err:
+            logger.error("Query failed")
+            logger.error(err)
+        finally:
+            conn.close()
@@ -0,0 +1,333 @@
+import re
+import math
+import logging
+import argparse
+
+from sssd.parser import SubparsersAction
+from sssd.parser import Option
+from sssd.matcher import Matcher
+from sssd.source_reader import load_source
+from sssd.log_record import LogRecord, parse_time
+from sssd.modules.latency import LatencyAnalyzer, RunningRequests
+from sssd.modules.latency import percentile, PERCENTILES
+
+logger = logging.getLogger()
+
+
+# Significance level of the rank test flagging slowdowns
+ALPHA = 0.01
+DEFAULT_MIN_CHANGE = 10
+
+# Arguments summarize() needs, the rest of the namespace, e.g. the bound
+# subcommand function, is not passed to the worker processes
+_SOURCE_ARGS = ['source', 'logdir', 'host', 'rotated', 'jobs', 'index',
+                'index_dir', 'since', 'until', 'pam']
+
+_NEW_DP_RE = re.compile(r'REQ_TRACE: New request\. '
+                        r'\[sssd\.(\w+) CID #([0-9]+)\]')
+
+
+def mann_whitney(before, after):
+    """
+    Two-sided Mann-Whitney U test with the normal approximation and tie
+    correction, whether two samples come from the same distribution.
+
+    Args:
+        before (list of int): first sample
+        after (list of int): second sample
+
+    Returns:
+        p-value, None if a sample is empty
+    """
+    n1 = len(before)
+    n2 = len(after)
+    if not n1 or not n2:
+        return None
+    values = sorted([(v, 0) for v in before] + [(v, 1) for v in after])
+    n = n1 + n2
+    rank_sum = 0.0
+    ties = 0
+    i = 0
+    while i < n:
+        j = i
+        while j < n and values[j][0] == values[i][0]:
+            j += 1
+        # average rank of the tied values i .. j - 1, ranks start at 1
+        rank = (i + j + 1) / 2
+        rank_sum += rank * sum(1 for k in range(i, j) if values[k][1] == 0)
+        ties += (j - i) ** 3 - (j - i)
+        i = j
+
+    u = rank_sum - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))) if n > 1 \
+        else 0
+    if variance <= 0:
+        return 1.0
+    z = max(abs(u - mean) - 0.5, 0) / math.sqrt(variance)
+    return math.erfc(z / math.sqrt(2))
+
+
+class LookupStats:
+    """
+    Requests of a single lookup type of one side of the comparison
+    """
+    __slots__ = ('latencies', 'round_trips', 'searches')
+
+    def __init__(self):
+        self.latencies = []
+        self.round_trips = 0
+        self.searches = 0
+
+
+def summarize(args):
+    """
+    Collect the statistics of the responder requests of one source per
+    lookup type, executed in a worker process if allowed.
+
+    Args:
+        args (Namespace): argparse parsed arguments of the source
+
+    Returns:
+        Dictionary of LookupStats objects by cache_req plugin
+    """
+    source = load_source(args)
+    latency = LatencyAnalyzer()
+    component = source.Component.NSS
+    resp = "nss"
+    if args.pam:
+        component = source.Component.PAM
+        resp = "pam"
+
+    source.set_component(component, False)
+    source.set_filter(functions=['accept_fd_handler', 'cache_req_send',
+                                 'cache_req_set_domain',
+                                 'cache_req_process_result',
+                                 'cache_req_done'])
+    requests, _ = latency.responder_requests(source)
+
+    stats = {}
+    for request in requests:
+        lookup = stats.get(request.plugin)
+        if lookup is None:
+            lookup = LookupStats()
+            stats[request.plugin] = lookup
+        lookup.latencies.append(request.end - request.start)
+    running = RunningRequests(requests)
+
+    source.set_component(source.Component.BE, False)
+    source.set_filter(functions=['dp_attach_req',
+                                 'sdap_get_generic_ext_step'])
+    matcher = Matcher([r'REQ_TRACE: New request\. \[sssd\.',
+                       r'calling ldap_search_ext with'],
+                      ['New request. [sssd.', 'calling ldap_search_ext'])
+    # (component, RID) -> LookupStats of the responder request
+    owners = {}
+    for line in source.search(matcher):
+        record = LogRecord(line)
+        if record.backtrace or not record.valid or record.rid is None:
+            continue
+        # RIDs are unique within a single backend process
+        key = (record.component, record.rid)
+        match = _NEW_DP_RE.search(record.message)
+        if match is None:
+            lookup = owners.get(key)
+            if lookup is not None:
+                lookup.searches += 1
+            continue
+        owners.pop(key, None)
+        if match.group(1) != resp:
+            continue
+        # a data provider request belongs to the request of its client ID
+        # which was running when it started
+        request = running.find((record.host, int(match.group(2))),
+                               record.timestamp)
+        if request is not None:
+            lookup = stats[request.plugin]
+            lookup.round_trips += 1
+            owners[key] = lookup
+    return stats
+
+
+class DiffAnalyzer:
+    """
+    A regression analyzer module, compares the responder requests of two
+    sources or two time windows of the same source.
+    """
+    module_parser = None
+    report_opts = [
+        Option('--after-logdir', 'Log directory of the second source, '
+               'default the same as the first', str),
+        Option('--after-since', 'Start of the time window of the second '
+               'source, YYYY-MM-DD [HH:MM[:SS]]', str),
+        Option('--after-until', 'End of the time window of the second '
+               'source, YYYY-MM-DD [HH:MM[:SS]]', str),
+        Option('--pam', 'Compare PAM requests', bool),
+        Option('--min-change', f'Minimal median slowdown in percent to '
+               f'flag (default {DEFAULT_MIN_CHANGE})', int),
+    ]
+
+    def print_module_help(self, args):
+        """
+        Print the module parser help output
+
+        Args:
+            args (Namespace): argparse parsed arguments
+        """
+        self.module_parser.print_help()
+
+    def setup_args(self, parser_grp, cli):
+        """
+        Setup module parser, subcommands, and options
+
+        Args:
+            parser_grp (argparse.Action): Parser group to nest
+               module and subcommands under
+        """
+        desc = "Compare two log sources or time windows module"
+        self.module_parser = parser_grp.add_parser('diff',
+                                                   description=desc,
+                                                   help='Regression diff')
+
+        subparser = self.module_parser.add_subparsers(title=None,
+                                                      dest='subparser',
+                                                      action=SubparsersAction,
+                                                      metavar='COMMANDS')
+
+        subcmd_grp = subparser.add_parser_group('Operation Modes')
+        cli.add_subcommand(subcmd_grp, 'report',
+                           'Compare request latency and backend load per '
+                           'lookup type',
+                           self.report, self.report_opts)
+
+        self.module_parser.set_defaults(func=self.print_module_help)
+
+        return self.module_parser
+
+    def source_args(self, args):
+        """
+        Build the arguments of both sources. The second one differs by the
+        log directory, the time window or both. A window boundary not set
+        for the second source is the one of the first.
+
+        Returns:
+            (before, after) tuple of argparse Namespace objects, None on
+            invalid arguments
+        """
+        before = argparse.Namespace(**{name: getattr(args, name, None)
+                                       for name in _SOURCE_ARGS})
+        # a journal cursor would make the second read start after the first
+        before.journal_cursor = None
+        after = argparse.Namespace(**vars(before))
+        if args.after_logdir is not None:
+            after.logdir = args.after_logdir
+        if args.after_since is None and args.after_until is None:
+            return before, after
+        try:
+            if args.after_since is not None:
+                after.since = parse_time(args.after_since)
+            if args.after_until is not None:
+                after.until = parse_time(args.after_until)
+        except ValueError as err:
+            logger.error(f"Invalid time '{err}', use 'YYYY-MM-DD "
+                         f"[HH:MM[:SS]]'")
+            return None
+        if after.since is not None and after.until is not None \
+           and after.since >= after.until:
+            logger.error("The time window of the second source is empty, "
+                         "the end is inherited from --until unless "
+                         "--after-until is set")
+            return None
+        return before, after
+
+    def collect(self, before, after):
+        """
+        Summarize both sources, in parallel if more jobs are allowed
+
+        Returns:
+            (before, after) tuple of the summaries
+        """
+        if before.jobs <= 1:
+            return summarize(before), summarize(after)
+
+        # multiprocessing is slow to import, only do so when needed
+        from concurrent.futures import ProcessPoolExecutor
+
+        # the sources are read in parallel instead of their files
+        before.jobs = 1
+        after.jobs = 1
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(summarize, before),
+                       executor.submit(summarize, after)]
+            return futures[0].result(), futures[1].result()
+
+    def report(self, args):
+        """
+        Print the latency percentiles, data provider round trips and LDAP
+        searches per request of both sources by lookup type, and flag
+        significant slowdowns
+
+        Args:
+            args (Namespace):  populated argparse namespace
+        """
+        if args.after_logdir is None and args.after_since is None \
+           and args.after_until is None:
+            logger.error("Nothing to compare, set the second source with "
+                         "--after-logdir, --after-since or --after-until")
+            return
+        sources = self.source_args(args)
+        if sources is None:
+            return
+        min_change = DEFAULT_MIN_CHANGE if args.min_change is None \
+            else args.min_change
+
+        logger.info("******** Reading both sources ********")
+        try:
+            stats = self.collect(*sources)
+        except IOError:
+            logger.error("No backend logs found")
+            return
+
+        plugins = sorted(set(stats[0]) | set(stats[1]))
+        if not plugins:
+            logger.warning("No finished requests found in logs!")
+            return
+
+        width = max(len('Lookup'), max(len(p) for p in plugins))
+        header = f"{'Lookup':<{width}}  {'count':>15}"
+        for pct in PERCENTILES:
+            header += f"  {'p' + str(pct) + ' ms':>19}"
+        header += f"  {'DP/req':>11}  {'LDAP/req':>11}  {'p-value':>8}"
+        print("Before -> after\n")
+        print(header)
+        flagged = 0
+        for plugin in plugins:
+            sides = [side.get(plugin, LookupStats()) for side in stats]
+            values = [sorted(side.latencies) for side in sides]
+            line = f"{plugin:<{width}}  " \
+                   f"{len(values[0]):>7}>{len(values[1]):<7}"
+            for pct in PERCENTILES:
+                pair = [percentile(v, pct) for v in values]
+                line += "  " + ">".join(
+                    f"{'-' if p is None else f'{p / 1000:.3f}':>9}"
+                    for p in pair)
+            for attr in ('round_trips', 'searches'):
+                pair = [getattr(side, attr) / len(v) if v else 0
+                        for side, v in zip(sides, values)]
+                line += f"  {pair[0]:>5.2f}>{pair[1]:<5.2f}"
+
+            pvalue = mann_whitney(values[0], values[1])
+            line += f"  {'-' if pvalue is None else f'{pvalue:.2g}':>8}"
+            medians = [percentile(v, 50) for v in values]
+            if pvalue is not None and pvalue < ALPHA and medians[0] \
+               and medians[1] > medians[0] * (1 + min_change / 100):
+                line += "  SLOWER"
+                flagged += 1
+            print(line)
+
+        print()
+        if flagged:
+            print(f"{flagged} lookup types significantly slower "
+                  f"(p < {ALPHA}, median +{min_change}% or more)")
+        else:
+            print("No significant slowdowns")
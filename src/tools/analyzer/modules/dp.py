@@ -0,0 +1,330 @@
+import re
+import logging
+
+from datetime import datetime, timezone
+
+from sssd.parser import SubparsersAction
+from sssd.parser import Option
+from sssd.matcher import Matcher
+from sssd.source_reader import load_source
+from sssd.log_record import LogRecord
+from sssd.modules.latency import percentile, PERCENTILES
+
+logger = logging.getLogger()
+
+
+DEFAULT_INTERVAL = 60
+DEFAULT_TOP = 10
+
+# DP_REQ_DEBUG() of providers/data_provider/dp_request.c, the request name
+# is the method name followed by the request number
+_DP_REQ_RE = re.compile(r'^DP Request \[(.*) #([0-9]+)\]: ')
+_NEW_RE = re.compile(r'REQ_TRACE: New request\.(?: \[(.*) CID #([0-9]+)\])?')
+_DONE_RE = re.compile(r'Request handler finished \[(-?[0-9]+)\]: (.*)')
+_ACTIVE_RE = re.compile(r'^Number of active DP request: ([0-9]+)')
+
+
+class DpRequest:
+    """
+    Lifetime of a single data provider request
+    """
+    __slots__ = ('backend', 'method', 'num', 'client', 'start', 'end',
+                 'ret', 'result')
+
+    def __init__(self, backend, method, num, client, start):
+        self.backend = backend
+        self.method = method
+        self.num = num
+        self.client = client
+        self.start = start
+        self.end = None
+        self.ret = None
+        self.result = None
+
+
+class DataProviderAnalyzer:
+    """
+    A data provider analyzer module, pairs the start and the end of
+    backend data provider requests and reports their durations and
+    concurrency.
+    """
+    module_parser = None
+    report_opts = [
+        Option('--interval', f'Length of the time buckets in minutes '
+               f'(default {DEFAULT_INTERVAL})', int),
+        Option('--top', f'Number of slowest requests to print (default '
+               f'{DEFAULT_TOP})', int),
+    ]
+
+    def print_module_help(self, args):
+        """
+        Print the module parser help output
+
+        Args:
+            args (Namespace): argparse parsed arguments
+        """
+        self.module_parser.print_help()
+
+    def setup_args(self, parser_grp, cli):
+        """
+        Setup module parser, subcommands, and options
+
+        Args:
+            parser_grp (argparse.Action): Parser group to nest
+               module and subcommands under
+        """
+        desc = "Analyze data provider requests module"
+        self.module_parser = parser_grp.add_parser('dp',
+                                                   description=desc,
+                                                   help='Data provider '
+                                                   'requests')
+
+        subparser = self.module_parser.add_subparsers(title=None,
+                                                      dest='subparser',
+                                                      action=SubparsersAction,
+                                                      metavar='COMMANDS')
+
+        subcmd_grp = subparser.add_parser_group('Operation Modes')
+        cli.add_subcommand(subcmd_grp, 'report',
+                           'Report request durations and concurrency',
+                           self.report, self.report_opts)
+
+        self.module_parser.set_defaults(func=self.print_module_help)
+
+        return self.module_parser
+
+    def dp_requests(self, source):
+        """
+        Pair the 'New request' and the 'Request handler finished' lines of
+        every data provider request.
+
+        Args:
+            source (Reader): source Reader object, set to the backend
+
+        Returns:
+            (requests, active) tuple, list of DpRequest objects, requests
+            which never finished have no end, and dictionary of lists of
+            (timestamp, count) tuples of the active requests logged by
+            every backend
+        """
+        patterns = [r'DP Request \[.*\]: REQ_TRACE: New request\.',
+                    r'DP Request \[.*\]: Request handler finished',
+                    r'Number of active DP request']
+        matcher = Matcher(patterns, ['New request.', 'handler finished',
+                                     'active DP request'])
+        running = {}
+        requests = []
+        active = {}
+        for line in source.search(matcher):
+            record = LogRecord(line)
+            if record.backtrace or not record.valid:
+                continue
+            msg = record.message
+            backend = record.component
+            match = _ACTIVE_RE.match(msg)
+            if match:
+                active.setdefault(backend, []).append(
+                    (record.timestamp, int(match.group(1))))
+                continue
+
+            match = _DP_REQ_RE.match(msg)
+            if not match:
+                continue
+            # request numbers are unique within a single backend process
+            key = (backend, match.group(2))
+            found = _NEW_RE.search(msg)
+            if found:
+                client = None
+                if found.group(1):
+                    client = f'{found.group(1)} CID #{found.group(2)}'
+                request = DpRequest(backend, match.group(1),
+                                    int(match.group(2)), client,
+                                    record.timestamp)
+                running[key] = request
+                requests.append(request)
+                continue
+
+            request = running.pop(key, None)
+            found = _DONE_RE.search(msg)
+            if request is not None and found:
+                request.end = record.timestamp
+                request.ret = int(found.group(1))
+                request.result = found.group(2)
+
+        return requests, active
+
+    def format_time(self, timestamp, fmt='%Y-%m-%d %H:%M'):
+        """ Format a timestamp as written in the logs """
+        when = datetime.fromtimestamp(timestamp / 1000000, timezone.utc)
+        return when.strftime(fmt)
+
+    def print_methods(self, requests):
+        """
+        Print duration percentiles of the finished requests per backend
+        and method in milliseconds
+        """
+        groups = {}
+        for request in requests:
+            groups.setdefault((request.backend, request.method),
+                              []).append(request)
+        width = max(len(f'{b} {m}') for b, m in groups)
+        header = f"{'Method':<{width}}  {'count':>7}  {'errors':>6}  " \
+                 f"{'open':>5}"
+        for pct in PERCENTILES:
+            header += f"  {'p' + str(pct):>9}"
+        header += f"  {'max':>9}"
+        print("Request duration in milliseconds\n")
+        print(header)
+
+        for (backend, method), group in sorted(groups.items()):
+            values = sorted(r.end - r.start for r in group
+                            if r.end is not None)
+            errors = sum(1 for r in group if r.ret not in (None, 0))
+            line = f"{backend + ' ' + method:<{width}}  {len(group):>7}  " \
+                   f"{errors:>6}  {len(group) - len(values):>5}"
+            for pct in PERCENTILES + (100,):
+                value = percentile(values, pct)
+                if value is None:
+                    line += f"  {'-':>9}"
+                else:
+                    line += f"  {value / 1000:>9.3f}"
+            print(line)
+        print()
+
+    def concurrency(self, requests, active, interval, last):
+        """
+        Sweep the start and end events of the requests of a single backend
+
+        Args:
+            requests (list of DpRequest): requests of the backend
+            active (list): (timestamp, count) tuples of the active requests
+                logged by the backend
+            interval (int): length of the time buckets in microseconds
+            last (int): timestamp where the requests which never finished
+                stop counting
+
+        Returns:
+            Dictionary of [started, finished, in-flight time, peak, peak
+            of the logged active requests, time covered by the requests]
+            lists by bucket start
+        """
+        events = []
+        for request in requests:
+            events.append((request.start, 1))
+            events.append((request.end if request.end is not None else last,
+                           -1))
+        # ends first, back to back requests are not concurrent
+        events.sort()
+
+        buckets = {}
+
+        def bucket(timestamp):
+            start = timestamp - timestamp % interval
+            counts = buckets.get(start)
+            if counts is None:
+                counts = [0, 0, 0, 0, 0, 0]
+                buckets[start] = counts
+            return start, counts
+
+        inflight = 0
+        previous = None
+        for timestamp, delta in events:
+            # spread the in-flight time over the buckets passed
+            while previous is not None and previous < timestamp:
+                start, counts = bucket(previous)
+                until = min(timestamp, start + interval)
+                counts[2] += inflight * (until - previous)
+                counts[5] += until - previous
+                previous = until
+            previous = timestamp
+            start, counts = bucket(timestamp)
+            inflight += delta
+            if delta > 0:
+                counts[0] += 1
+                counts[3] = max(counts[3], inflight)
+            else:
+                counts[1] += 1
+
+        for timestamp, count in active:
+            start, counts = bucket(timestamp)
+            counts[4] = max(counts[4], count)
+        return buckets
+
+    def print_concurrency(self, backend, buckets):
+        """ Print the concurrency of a single backend per time bucket """
+        print(f"Backend: {backend}")
+        print(f"{'':<16}  {'started':>8}  {'finished':>8}  "
+              f"{'avg':>6}  {'peak':>5}  {'active':>6}")
+        for start in sorted(buckets):
+            started, finished, area, peak, logged, covered = buckets[start]
+            average = area / covered if covered else 0
+            print(f"{self.format_time(start):<16}  {started:>8}  "
+                  f"{finished:>8}  {average:>6.2f}  {peak:>5}  "
+                  f"{logged if logged else '-':>6}")
+        print()
+
+    def print_request(self, request):
+        """ Print a single request """
+        start = self.format_time(request.start, '%Y-%m-%d %H:%M:%S')
+        line = f"{start}  {request.backend} [{request.method} " \
+               f"#{request.num}]"
+        if request.client:
+            line += f" [{request.client}]"
+        if request.end is not None:
+            line = f"{(request.end - request.start) / 1000:>10.3f} ms  " \
+                   f"{line}: {request.result}"
+        print(line)
+
+    def report(self, args):
+        """
+        Print the durations of data provider requests per method, their
+        concurrency over time and the requests which never finished
+
+        Args:
+            args (Namespace):  populated argparse namespace
+        """
+        source = load_source(args)
+        interval = DEFAULT_INTERVAL if args.interval is None \
+            else args.interval
+        top = DEFAULT_TOP if args.top is None else args.top
+        if interval <= 0:
+            logger.error("Interval must be a positive number of minutes")
+            return
+        interval *= 60 * 1000000
+
+        logger.info("******** Reading data provider requests ********")
+        source.set_component(source.Component.BE, False)
+        source.set_filter(functions=['dp_attach_req', 'dp_req_done'])
+        requests, active = self.dp_requests(source)
+        if not requests:
+            logger.warning("No data provider requests found in logs!")
+            return
+
+        self.print_methods(requests)
+
+        last = max(r.end if r.end is not None else r.start
+                   for r in requests)
+        backends = {}
+        for request in requests:
+            backends.setdefault(request.backend, []).append(request)
+        print("Concurrency, average and peak number of requests in flight,"
+              " active requests logged by the backend\n")
+        for backend in sorted(backends):
+            buckets = self.concurrency(backends[backend],
+                                       active.get(backend, ()), interval,
+                                       last)
+            self.print_concurrency(backend, buckets)
+
+        finished = [r for r in requests if r.end is not None]
+        if top > 0 and finished:
+            print("Slowest requests\n")
+            finished.sort(key=lambda r: r.start - r.end)
+            for request in finished[:top]:
+                self.print_request(request)
+            print()
+
+        unfinished = [r for r in requests if r.end is None]
+        if unfinished:
+            print(f"Requests which never finished: {len(unfinished)}\n")
+            for request in unfinished:
+                self.print_request(request)
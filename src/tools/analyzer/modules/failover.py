@@ -0,0 +1,453 @@
+import re
+import bisect
+import logging
+
+from sssd.parser import SubparsersAction
+from sssd.parser import Option
+from sssd.matcher import Matcher
+from sssd.source_reader import load_source
+from sssd.log_record import LogRecord
+from sssd.modules.latency import LatencyAnalyzer, percentile
+
+logger = logging.getLogger()
+
+
+# Backend program names, be[domain] or be[domain]@host
+_BE_RE = re.compile(r'^be\[(.*)\](?:@.*)?$')
+
+_PORT_RE = re.compile(r"Marking port ([0-9]+) of server '(.*)' as '(.*)'")
+_SERVER_RE = re.compile(r"Marking server '(.*)' as '(.*)'")
+_SRV_RE = re.compile(r"Marking SRV lookup of service '(.*)' as '(.*)'")
+_RESOLVE_RE = re.compile(r"Failed to resolve server '(.*?)'")
+_SUBDOM_OFFLINE_RE = re.compile(r'Marking subdomain (\S+) offline')
+_SUBDOM_RESET_RE = re.compile(r'Resetting subdomain (\S+)')
+_TASK_RE = re.compile(r'Task \[(.*)\]: (scheduling task [0-9]+ seconds|'
+                      r'timed out)')
+
+# Functions logging the lines read, see fail_over.c, data_provider_be.c,
+# be_ptask.c and sdap_async.c
+_FUNCTIONS = ['set_server_common_status', 'fo_set_port_status',
+              'set_srv_data_status', 'fo_resolve_service_done',
+              'fo_resolve_service_timeout', 'sdap_op_timeout',
+              'be_mark_offline', 'be_check_online_done',
+              'be_mark_dom_offline', 'be_subdom_reset_status',
+              'reactivate_subdoms', 'be_ptask_schedule', 'be_ptask_timeout']
+
+# Options worth tuning when a cause dominates the degraded periods
+TUNING = {
+    'resolve': 'dns_resolver_timeout',
+    'connect': 'failover list',
+    'ldap timeout': 'ldap_opt_timeout',
+    'offline': 'offline_timeout',
+    'subdomain': 'offline_timeout',
+}
+
+
+class Event:
+    """
+    A single failover or online status change of a backend
+
+    Args:
+        record -- LogRecord of the line
+        domain -- domain the event applies to
+        cause -- resolve, connect, ldap timeout, offline, subdomain or
+           task
+        change -- 'down' if servers of the domain fail, 'up' if a server
+           works, 'offline' and 'online' on offline transitions, None
+           otherwise
+    """
+    __slots__ = ('record', 'domain', 'cause', 'change')
+
+    def __init__(self, record, domain, cause, change=None):
+        self.record = record
+        self.domain = domain
+        self.cause = cause
+        self.change = change
+
+
+def parse_event(record):
+    """
+    Turn a backend log line into an event
+
+    Args:
+        record (LogRecord): backend log line
+
+    Returns:
+        Event object, None if the line is not a status change
+    """
+    match = _BE_RE.match(record.component or '')
+    if match is None:
+        return None
+    domain = match.group(1)
+    msg = record.message
+
+    match = _PORT_RE.search(msg) or _SERVER_RE.search(msg)
+    if match:
+        status = match.group(match.lastindex)
+        change = {'not working': 'down', 'working': 'up'}.get(status)
+        return Event(record, domain, 'connect', change)
+    match = _SRV_RE.search(msg)
+    if match:
+        change = 'down' if match.group(2) == 'not resolved' else None
+        return Event(record, domain, 'resolve', change)
+    if _RESOLVE_RE.search(msg) or 'Service resolving timeout' in msg:
+        return Event(record, domain, 'resolve', 'down')
+    if 'Issuing timeout [ldap_opt_timeout]' in msg:
+        return Event(record, domain, 'ldap timeout')
+    if 'Going offline!' in msg:
+        return Event(record, domain, 'offline', 'offline')
+    if 'Backend is online' in msg:
+        return Event(record, domain, 'offline', 'online')
+    if 'Backend is offline' in msg:
+        return Event(record, domain, 'offline')
+    match = _SUBDOM_OFFLINE_RE.search(msg)
+    if match:
+        return Event(record, match.group(1), 'subdomain', 'offline')
+    match = _SUBDOM_RESET_RE.search(msg)
+    if match:
+        return Event(record, match.group(1), 'subdomain', 'online')
+    if 'Resetting all subdomains' in msg:
+        return Event(record, None, 'subdomain', 'online')
+    match = _TASK_RE.search(msg)
+    if match:
+        # only the backoff of the online check is of interest
+        if match.group(2) != 'timed out' \
+           and not match.group(1).startswith('Check if online'):
+            return None
+        return Event(record, domain, 'task')
+    return None
+
+
+class DegradedPeriod:
+    """
+    Time a domain spent with failing servers or offline
+    """
+    __slots__ = ('host', 'domain', 'kind', 'start', 'stamp', 'end',
+                 'causes', 'requests', 'overlap', 'latencies')
+
+    def __init__(self, host, domain, kind, record):
+        self.host = host
+        self.domain = domain
+        self.kind = kind
+        self.start = record.timestamp
+        self.stamp = record.stamp
+        self.end = None
+        self.causes = {}
+        self.requests = 0
+        self.overlap = 0
+        self.latencies = []
+
+    def add_cause(self, cause):
+        self.causes[cause] = self.causes.get(cause, 0) + 1
+
+    def hint(self):
+        """
+        Option to look at first, by the most frequent cause. Going offline
+        is the consequence of the other causes, if there are any.
+        """
+        causes = {c: n for c, n in self.causes.items()
+                  if c in TUNING and c not in ('offline', 'subdomain')}
+        if not causes:
+            causes = {c: n for c, n in self.causes.items() if c in TUNING}
+        if not causes:
+            return '-'
+        return TUNING[max(causes, key=lambda c: (causes[c], c))]
+
+
+class FailoverAnalyzer:
+    """
+    A failover analyzer module, builds a timeline of server status changes
+    and offline transitions per domain and the request latency spent in
+    the degraded periods.
+    """
+    module_parser = None
+    timeline_opts = [
+        Option('--domain', 'Report only this domain', str),
+        Option('--verbose', 'Print also intermediate server states',
+               bool, '-v'),
+    ]
+
+    def print_module_help(self, args):
+        """
+        Print the module parser help output
+
+        Args:
+            args (Namespace): argparse parsed arguments
+        """
+        self.module_parser.print_help()
+
+    def setup_args(self, parser_grp, cli):
+        """
+        Setup module parser, subcommands, and options
+
+        Args:
+            parser_grp (argparse.Action): Parser group to nest
+               module and subcommands under
+        """
+        desc = "Analyze failover and offline transitions module"
+        self.module_parser = parser_grp.add_parser('failover',
+                                                   description=desc,
+                                                   help='Failover and '
+                                                   'offline status')
+
+        subparser = self.module_parser.add_subparsers(title=None,
+                                                      dest='subparser',
+                                                      action=SubparsersAction,
+                                                      metavar='COMMANDS')
+
+        subcmd_grp = subparser.add_parser_group('Operation Modes')
+        cli.add_subcommand(subcmd_grp, 'timeline',
+                           'Print the status changes per domain and the '
+                           'request latency overlapping degraded periods',
+                           self.timeline, self.timeline_opts)
+
+        self.module_parser.set_defaults(func=self.print_module_help)
+
+        return self.module_parser
+
+    def events(self, source):
+        """
+        Read the status changes of the backends
+
+        Args:
+            source (Reader): source Reader object, set to the backend
+
+        Returns:
+            (events, last) tuple, list of Event objects and the timestamp
+            of the last line read
+        """
+        matcher = Matcher([r'Marking (port|server|SRV lookup) ',
+                           r'Failed to resolve server ',
+                           r'Service resolving timeout reached',
+                           r'Issuing timeout \[ldap_opt_timeout\]',
+                           r'Going offline!', r'Backend is o',
+                           r'Marking subdomain .* offline',
+                           r'Resetting (subdomain|all subdomains)',
+                           r'Task \[.*\]: (scheduling task|timed out)'],
+                          ['Marking ', 'Failed to resolve', 'resolving',
+                           'ldap_opt_timeout', 'Going offline',
+                           'Backend is', 'Resetting ', 'Task ['])
+        events = []
+        last = None
+        for line in source.search(matcher):
+            record = LogRecord(line)
+            if record.backtrace or not record.valid:
+                continue
+            last = record.timestamp
+            event = parse_event(record)
+            if event is not None:
+                events.append(event)
+        return events, last
+
+    def periods(self, events, last):
+        """
+        Turn the events into degraded periods. A period starts with the
+        first failure of a domain and ends when a server works again. If
+        the backend goes offline meanwhile, it ends when it is online.
+
+        Args:
+            events (list of Event): events, oldest first
+            last (int): timestamp periods still open end at
+
+        Returns:
+            List of DegradedPeriod objects
+        """
+        active = {}
+        periods = []
+        for event in events:
+            record = event.record
+            host = record.host
+            if event.domain is None:
+                # all subdomains of the backend were reset
+                keys = [k for k, p in active.items()
+                        if k[0] == host and p.kind == 'subdomain offline']
+            else:
+                keys = [(host, event.domain)]
+
+            for key in keys:
+                period = active.get(key)
+                if event.change in ('down', 'offline'):
+                    kind = 'failover'
+                    if event.change == 'offline':
+                        kind = 'subdomain offline' \
+                            if event.cause == 'subdomain' else 'offline'
+                    if period is None:
+                        period = DegradedPeriod(host, event.domain, kind,
+                                                record)
+                        active[key] = period
+                    elif kind == 'offline':
+                        period.kind = kind
+                elif period is None:
+                    continue
+                elif event.change == 'online' \
+                        or (event.change == 'up'
+                            and period.kind == 'failover'):
+                    period.end = record.timestamp
+                    periods.append(active.pop(key))
+                    continue
+                if event.cause != 'task':
+                    period.add_cause(event.cause)
+
+        for period in active.values():
+            period.end = max(last or period.start, period.start)
+            periods.append(period)
+        return sorted(periods, key=lambda p: p.start)
+
+    def requests(self, source):
+        """
+        Read the finished requests of both responders
+
+        Returns:
+            List of CacheRequest objects
+        """
+        latency = LatencyAnalyzer()
+        requests = []
+        for name, component in (('nss', source.Component.NSS),
+                                ('pam', source.Component.PAM)):
+            logger.info(f"******** Reading {name} responder requests "
+                        f"********")
+            source.set_component(component, False)
+            source.set_filter(functions=['accept_fd_handler',
+                                         'cache_req_send',
+                                         'cache_req_set_domain',
+                                         'cache_req_process_result',
+                                         'cache_req_done'])
+            requests.extend(latency.responder_requests(source)[0])
+        return requests
+
+    def overlap(self, periods, requests):
+        """
+        Attribute the requests of a domain running during its degraded
+        periods to them
+
+        Args:
+            periods (list of DegradedPeriod): periods, updated
+            requests (list of CacheRequest): finished requests
+
+        Returns:
+            Dictionary of the total request latency by (host, domain)
+        """
+        by_domain = {}
+        totals = {}
+        for request in requests:
+            key = (request.host, request.domain)
+            by_domain.setdefault(key, []).append(request)
+            totals[key] = totals.get(key, 0) + request.end - request.start
+        starts = {}
+        longest = {}
+        for key, domain_requests in by_domain.items():
+            domain_requests.sort(key=lambda r: r.start)
+            starts[key] = [r.start for r in domain_requests]
+            longest[key] = max(r.end - r.start for r in domain_requests)
+
+        for period in periods:
+            key = (period.host, period.domain)
+            if key not in by_domain:
+                continue
+            # requests starting after the period are sorted out by bisect,
+            # the ones before it by the longest request of the domain
+            low = bisect.bisect_left(starts[key],
+                                     period.start - longest[key])
+            high = bisect.bisect_right(starts[key], period.end)
+            for request in by_domain[key][low:high]:
+                if request.end < period.start:
+                    continue
+                period.requests += 1
+                period.overlap += min(request.end, period.end) \
+                    - max(request.start, period.start)
+                period.latencies.append(request.end - request.start)
+        return totals
+
+    def print_timeline(self, events, verbose):
+        """ Print the events of every domain, oldest first """
+        by_domain = {}
+        for event in events:
+            by_domain.setdefault((event.record.host, event.domain),
+                                 []).append(event)
+        for (host, domain), domain_events in sorted(
+                by_domain.items(), key=lambda i: (i[0][0] or '',
+                                                  i[0][1] or '')):
+            if domain is None:
+                continue
+            title = domain if host is None else f'{domain} on {host}'
+            print(f"Domain {title}")
+            for event in domain_events:
+                if not verbose and event.change is None \
+                   and event.cause in ('connect', 'resolve'):
+                    continue
+                mark = event.change or ''
+                print(f"  {event.record.stamp}  {mark:<8}"
+                      f"{event.cause:<13}{event.record.message}")
+            print()
+
+    def timeline(self, args):
+        """
+        Print the failover and offline timeline of every domain and the
+        degraded periods with the request latency spent in them
+
+        Args:
+            args (Namespace):  populated argparse namespace
+        """
+        source = load_source(args)
+        logger.info("******** Reading backend status changes ********")
+        try:
+            source.set_component(source.Component.BE, False)
+        except IOError:
+            logger.error("No backend logs found")
+            return
+        source.set_filter(functions=_FUNCTIONS)
+        events, last = self.events(source)
+        if args.domain is not None:
+            events = [e for e in events
+                      if e.domain in (args.domain, None)]
+        if not any(e.domain is not None for e in events):
+            logger.warning("No failover or offline status changes found "
+                           "in logs!")
+            return
+
+        requests = self.requests(source)
+        if requests:
+            last = max(last, max(r.end for r in requests))
+        periods = self.periods(events, last)
+        totals = self.overlap(periods, requests)
+
+        self.print_timeline(events, args.verbose)
+        if not periods:
+            print("No degraded periods")
+            return
+
+        hosts = any(p.host is not None for p in periods)
+        print("Degraded periods, latency in milliseconds\n")
+        header = f"{'Start':<27}{'Duration':>10}  {'Domain':<16}"
+        if hosts:
+            header += f"{'Host':<16}"
+        header += f"{'Kind':<19}{'Requests':>8}{'Overlap':>11}" \
+                  f"{'p90':>10}  {'Tune':<22}Causes"
+        print(header)
+        overlapped = {}
+        for period in periods:
+            causes = ', '.join(f'{c} {n}' for c, n in sorted(
+                period.causes.items(), key=lambda i: (-i[1], i[0])))
+            p90 = percentile(sorted(period.latencies), 90)
+            line = f"{period.stamp:<27}" \
+                   f"{(period.end - period.start) / 1000000:>9.1f}s  " \
+                   f"{period.domain:<16}"
+            if hosts:
+                line += f"{period.host or '-':<16}"
+            line += f"{period.kind:<19}{period.requests:>8}" \
+                    f"{period.overlap / 1000:>11.1f}" \
+                    f"{'-' if p90 is None else f'{p90 / 1000:.1f}':>10}  " \
+                    f"{period.hint():<22}{causes or '-'}"
+            print(line)
+            key = (period.host, period.domain)
+            overlapped[key] = overlapped.get(key, 0) + period.overlap
+
+        print()
+        for (host, domain), overlap in sorted(
+                overlapped.items(), key=lambda i: (i[0][0] or '', i[0][1])):
+            total = totals.get((host, domain), 0)
+            title = domain if host is None else f'{domain} on {host}'
+            share = f" ({overlap / total * 100:.1f}% of " \
+                    f"{total / 1000:.1f} ms)" if total else ''
+            print(f"{title}: {overlap / 1000:.1f} ms of request latency "
+                  f"in degraded periods{share}")
@@ -0,0 +1,341 @@
+import re
+import math
+import bisect
+import logging
+
+from sssd.parser import SubparsersAction
+from sssd.parser import Option
+from sssd.matcher import Matcher
+from sssd.source_reader import load_source
+from sssd.log_record import LogRecord
+
+logger = logging.getLogger()
+
+
+PERCENTILES = (50, 90, 99)
+
+_CR_RE = re.compile(r'^CR #([0-9]+): ')
+_NEW_CR_RE = re.compile(r"New request \[CID #([0-9]+)\] '(.*)'")
+_DOMAIN_RE = re.compile(r'Using domain \[(.*)\]')
+_CLIENT_RE = re.compile(r'\[cmd (.*)\]\[uid ([0-9]+)\]')
+_NEW_DP_RE = re.compile(r'REQ_TRACE: New request\. '
+                        r'\[sssd\.(\w+) CID #([0-9]+)\]')
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile
+
+    Args:
+        values (list of int): sorted values
+        pct (int): percentile, 0 - 100
+
+    Returns:
+        The percentile value, None if there are no values
+    """
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+class CacheRequest:
+    """
+    Lifetime of a single responder cache_req request
+    """
+    __slots__ = ('host', 'cid', 'plugin', 'domain', 'start', 'end',
+                 'backend')
+
+    def __init__(self, host, cid, plugin, start):
+        self.host = host
+        self.cid = cid
+        self.plugin = plugin
+        self.domain = None
+        self.start = start
+        self.end = None
+        self.backend = 0
+
+
+class RunningRequests:
+    """
+    Finished responder requests by (host, CID), sorted by start to find
+    the request of a client running at a given time in O(log n) steps.
+
+    Args:
+        requests -- list of CacheRequest objects
+    """
+    def __init__(self, requests):
+        self.requests = {}
+        for request in requests:
+            self.requests.setdefault((request.host, request.cid),
+                                     []).append(request)
+        self.starts = {}
+        self.longest = {}
+        for key, cid_requests in self.requests.items():
+            cid_requests.sort(key=lambda r: r.start)
+            self.starts[key] = [r.start for r in cid_requests]
+            self.longest[key] = max(r.end - r.start for r in cid_requests)
+
+    def find(self, key, timestamp):
+        """
+        Find the request of a client running at a given time
+
+        Args:
+            key (tuple): (host, CID) of the client
+            timestamp (int): time, see parse_timestamp()
+
+        Returns:
+            The CacheRequest which started first of the ones running,
+            None if there is none
+        """
+        cid_requests = self.requests.get(key)
+        if cid_requests is None:
+            return None
+        starts = self.starts[key]
+        # requests starting later are sorted out by bisect, the ones ending
+        # before by the longest request of the client
+        low = bisect.bisect_left(starts, timestamp - self.longest[key])
+        high = bisect.bisect_right(starts, timestamp)
+        for i in range(low, high):
+            if cid_requests[i].end >= timestamp:
+                return cid_requests[i]
+        return None
+
+
+class LatencyAnalyzer:
+    """
+    A request latency analyzer module, rebuilds the lifetime of responder
+    requests from the logs and reports latency percentiles.
+    """
+    module_parser = None
+    report_opts = [
+        Option('--pam', 'Report PAM requests', bool),
+        Option('--no-backend', 'Do not read the backend logs', bool),
+    ]
+
+    def print_module_help(self, args):
+        """
+        Print the module parser help output
+
+        Args:
+            args (Namespace): argparse parsed arguments
+        """
+        self.module_parser.print_help()
+
+    def setup_args(self, parser_grp, cli):
+        """
+        Setup module parser, subcommands, and options
+
+        Args:
+            parser_grp (argparse.Action): Parser group to nest
+               module and subcommands under
+        """
+        desc = "Analyze request latency module"
+        self.module_parser = parser_grp.add_parser('latency',
+                                                   description=desc,
+                                                   help='Request latency')
+
+        subparser = self.module_parser.add_subparsers(title=None,
+                                                      dest='subparser',
+                                                      action=SubparsersAction,
+                                                      metavar='COMMANDS')
+
+        subcmd_grp = subparser.add_parser_group('Operation Modes')
+        cli.add_subcommand(subcmd_grp, 'report',
+                           'Report request latency percentiles',
+                           self.report, self.report_opts)
+
+        self.module_parser.set_defaults(func=self.print_module_help)
+
+        return self.module_parser
+
+    def responder_requests(self, source):
+        """
+        Rebuild the responder requests in a single pass over the lines
+        needed, from the 'New request' line to the 'Finished' line.
+
+        Args:
+            source (Reader): source Reader object, set to the responder
+
+        Returns:
+            (requests, commands) tuple, list of finished CacheRequest
+            objects and dictionary of client commands by (host, CID)
+        """
+        patterns = [r'\[cmd .*connected',
+                    r'REQ_TRACE: New request \[CID #',
+                    r'CR #[0-9]+: Using domain \[',
+                    r'CR #[0-9]+: Finished: ']
+        matcher = Matcher(patterns, ['[cmd', 'New request [CID',
+                                     'Using domain', 'Finished: '])
+        commands = {}
+        active = {}
+        requests = []
+        unfinished = 0
+        for line in source.search(matcher):
+            record = LogRecord(line)
+            if record.backtrace or not record.valid:
+                continue
+            msg = record.message
+            match = _CR_RE.match(msg)
+            if not match:
+                match = _CLIENT_RE.search(msg)
+                if match and record.cid is not None:
+                    commands[(record.host, record.cid)] = match.group(1)
+                continue
+
+            # CR numbers are unique within a single responder process
+            key = (record.component, match.group(1))
+            if 'New request' in msg:
+                match = _NEW_CR_RE.search(msg)
+                if match:
+                    if key in active:
+                        unfinished += 1
+                    active[key] = CacheRequest(record.host,
+                                               int(match.group(1)),
+                                               match.group(2),
+                                               record.timestamp)
+                continue
+
+            request = active.get(key)
+            if request is None:
+                continue
+            if 'Finished: ' in msg:
+                request.end = record.timestamp
+                requests.append(active.pop(key))
+            else:
+                match = _DOMAIN_RE.search(msg)
+                if match:
+                    request.domain = match.group(1)
+
+        unfinished += len(active)
+        if unfinished:
+            logger.info(f"Skipped {unfinished} requests without end")
+        return requests, commands
+
+    def backend_requests(self, source, resp):
+        """
+        Collect the data provider requests linked to responder client IDs
+
+        Args:
+            source (Reader): source Reader object, set to the backend
+            resp (str): responder name, e.g. nss or pam
+
+        Returns:
+            Dictionary of lists of (start, end) timestamp tuples by
+            (host, CID)
+        """
+        patterns = [r'REQ_TRACE: New request\. \[sssd\.',
+                    r'Request handler finished']
+        matcher = Matcher(patterns, ['New request. [sssd.',
+                                     'Request handler finished'])
+        active = {}
+        linked = {}
+        for line in source.search(matcher):
+            record = LogRecord(line)
+            if record.backtrace or not record.valid or record.rid is None:
+                continue
+            # RIDs are unique within a single backend process
+            key = (record.component, record.rid)
+            match = _NEW_DP_RE.search(record.message)
+            if match:
+                if match.group(1) == resp:
+                    active[key] = ((record.host, int(match.group(2))),
+                                   record.timestamp)
+                continue
+            found = active.pop(key, None)
+            if found is not None:
+                cid, start = found
+                linked.setdefault(cid, []).append((start, record.timestamp))
+        return linked
+
+    def link_backend(self, requests, linked):
+        """
+        Add the time spent in linked data provider requests to every
+        responder request. A data provider request belongs to the
+        request of its client ID which was running when it started.
+        """
+        running = RunningRequests(requests)
+        for cid, spans in linked.items():
+            for start, end in spans:
+                request = running.find(cid, start)
+                if request is not None:
+                    request.backend += end - start
+
+    def print_table(self, title, groups, backend):
+        """
+        Print latency percentiles of grouped requests in milliseconds
+
+        Args:
+            title (str): title of the group column
+            groups (dict): lists of CacheRequest objects by group name
+            backend (bool): print the share of time spent in the backend
+        """
+        width = max([len(title)] + [len(name) for name in groups])
+        header = f"{title:<{width}}  {'count':>7}"
+        for pct in PERCENTILES:
+            header += f"  {'p' + str(pct):>9}"
+        header += f"  {'max':>9}"
+        if backend:
+            header += f"  {'backend':>7}"
+        print(header)
+
+        rows = sorted(groups.items(), key=lambda item: -len(item[1]))
+        for name, requests in rows:
+            values = sorted(r.end - r.start for r in requests)
+            line = f"{name:<{width}}  {len(values):>7}"
+            for pct in PERCENTILES:
+                line += f"  {percentile(values, pct) / 1000:>9.3f}"
+            line += f"  {values[-1] / 1000:>9.3f}"
+            if backend:
+                total = sum(values)
+                spent = sum(r.backend for r in requests)
+                share = 100 * spent / total if total else 0
+                line += f"  {share:>6.1f}%"
+            print(line)
+        print()
+
+    def report(self, args):
+        """
+        Print latency percentiles of responder requests by cache_req
+        plugin, domain and client command
+
+        Args:
+            args (Namespace):  populated argparse namespace
+        """
+        source = load_source(args)
+        component = source.Component.NSS
+        resp = "nss"
+        if args.pam:
+            component = source.Component.PAM
+            resp = "pam"
+
+        logger.info(f"******** Reading {resp} responder requests ********")
+        source.set_component(component, False)
+        source.set_filter(functions=['accept_fd_handler', 'cache_req_send',
+                                     'cache_req_set_domain',
+                                     'cache_req_process_result',
+                                     'cache_req_done'])
+        requests, commands = self.responder_requests(source)
+        if not requests:
+            logger.warning("No finished requests found in logs!")
+            return
+
+        backend = not args.no_backend
+        if backend:
+            logger.info("******** Reading backend requests ********")
+            source.set_component(source.Component.BE, False)
+            source.set_filter(functions=['dp_attach_req', 'dp_req_done'])
+            self.link_backend(requests, self.backend_requests(source, resp))
+
+        print("Latency in milliseconds\n")
+        tables = [('Plugin', lambda r: r.plugin),
+                  ('Domain', lambda r: r.domain or '-'),
+                  ('Command', lambda r: commands.get((r.host, r.cid), '-'))]
+        # logs of many hosts read by the archives reader
+        if any(r.host is not None for r in requests):
+            tables.append(('Host', lambda r: r.host or '-'))
+        for title, key in tables:
+            groups = {}
+            for request in requests:
+                groups.setdefault(key(request), []).append(request)
+            self.print_table(title, groups, backend)
@@ -0,0 +1,232 @@
+import re
+import heapq
+import logging
+
+from collections import deque
+
+from sssd.parser import SubparsersAction
+from sssd.parser import Option
+from sssd.matcher import Matcher
+from sssd.source_reader import load_source
+from sssd.log_record import LogRecord
+
+logger = logging.getLogger()
+
+
+DEFAULT_TOP = 10
+
+# Upper bounds of the histogram buckets in milliseconds, the last bucket
+# is open ended
+HISTOGRAM_BUCKETS = (1, 10, 100, 1000, 10000)
+
+# sdap_get_generic_ext_step(): calling ldap_search_ext with [filter][base].
+_SEARCH_RE = re.compile(r'calling ldap_search_ext with \[(.*)\]\[(.*)\]\.$')
+# sdap_get_generic_op_finished(): Search result: Success(0), errmsg
+_RESULT_RE = re.compile(r'Search result: (.*)\((-?[0-9]+)\)')
+# Assertion values of a search filter, (uid=foo) -> (uid=*)
+_VALUE_RE = re.compile(r'([<>~]?=)[^()]*\)')
+
+
+def filter_template(ldap_filter):
+    """
+    Strip the assertion values of an LDAP search filter, so that searches
+    for different users or groups share the same template.
+
+    Args:
+        ldap_filter (str): search filter
+
+    Returns:
+        The filter with every value replaced by '*'
+    """
+    return _VALUE_RE.sub(r'\1*)', ldap_filter)
+
+
+class LdapSearch:
+    """
+    A single LDAP search operation issued by the backend
+    """
+    __slots__ = ('stamp', 'component', 'rid', 'base', 'ldap_filter',
+                 'start', 'end', 'result')
+
+    def __init__(self, record, ldap_filter, base):
+        self.stamp = record.stamp
+        self.component = record.component
+        self.rid = record.rid
+        self.base = base
+        self.ldap_filter = ldap_filter
+        self.start = record.timestamp
+        self.end = None
+        self.result = None
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class LdapAnalyzer:
+    """
+    An LDAP performance analyzer module, measures the duration of the
+    LDAP searches logged by the backend.
+    """
+    module_parser = None
+    slow_opts = [
+        Option('--top', f'Number of slowest searches to print '
+               f'(default {DEFAULT_TOP})', int),
+        Option('--child', 'Include child process logs', bool),
+    ]
+
+    def print_module_help(self, args):
+        """
+        Print the module parser help output
+
+        Args:
+            args (Namespace): argparse parsed arguments
+        """
+        self.module_parser.print_help()
+
+    def setup_args(self, parser_grp, cli):
+        """
+        Setup module parser, subcommands, and options
+
+        Args:
+            parser_grp (argparse.Action): Parser group to nest
+               module and subcommands under
+        """
+        desc = "Analyze LDAP operations module"
+        self.module_parser = parser_grp.add_parser('ldap',
+                                                   description=desc,
+                                                   help='LDAP operations')
+
+        subparser = self.module_parser.add_subparsers(title=None,
+                                                      dest='subparser',
+                                                      action=SubparsersAction,
+                                                      metavar='COMMANDS')
+
+        subcmd_grp = subparser.add_parser_group('Operation Modes')
+        cli.add_subcommand(subcmd_grp, 'slow', 'Report slowest LDAP searches',
+                           self.slow_searches, self.slow_opts)
+
+        self.module_parser.set_defaults(func=self.print_module_help)
+
+        return self.module_parser
+
+    def searches(self, source):
+        """
+        Pair the start and the result of LDAP searches per backend request
+
+        The result message does not name the search it belongs to. Searches
+        running concurrently within the same request are paired in the
+        order they were issued.
+
+        Args:
+            source (Reader): source Reader object, set to the backend
+
+        Yields:
+            LdapSearch: The next finished search
+        """
+        patterns = [r'calling ldap_search_ext with',
+                    r'Search result: ']
+        matcher = Matcher(patterns, ['calling ldap_search_ext with',
+                                     'Search result: '])
+        pending = {}
+        for line in source.search(matcher):
+            record = LogRecord(line)
+            if record.backtrace or not record.valid:
+                continue
+            # RIDs are unique within a single backend process
+            key = (record.component, record.rid)
+            match = _SEARCH_RE.search(record.message)
+            if match:
+                search = LdapSearch(record, *match.groups())
+                pending.setdefault(key, deque()).append(search)
+                continue
+
+            match = _RESULT_RE.search(record.message)
+            queue = pending.get(key)
+            if not match or not queue:
+                continue
+            search = queue.popleft()
+            if not queue:
+                del pending[key]
+            search.end = record.timestamp
+            search.result = match.group(1)
+            yield search
+
+        unfinished = sum(len(queue) for queue in pending.values())
+        if unfinished:
+            logger.info(f"Skipped {unfinished} searches without result")
+
+    def print_histogram(self, histogram):
+        """
+        Print search duration histograms by filter template
+
+        Args:
+            histogram (dict): lists of bucket counts by filter template
+        """
+        header = ""
+        for bound in HISTOGRAM_BUCKETS:
+            header += f"  {'<' + str(bound) + 'ms':>9}"
+        header += f"  {'>=' + str(HISTOGRAM_BUCKETS[-1]) + 'ms':>9}"
+        print(f"{'count':>7}{header}  filter")
+
+        rows = sorted(histogram.items(), key=lambda item: -sum(item[1]))
+        for template, buckets in rows:
+            line = f"{sum(buckets):>7}"
+            for count in buckets:
+                line += f"  {count:>9}"
+            print(f"{line}  {template}")
+
+    def slow_searches(self, args):
+        """
+        Print the slowest LDAP searches and a histogram of the search
+        durations per filter
+
+        Args:
+            args (Namespace):  populated argparse namespace
+        """
+        source = load_source(args)
+        top = DEFAULT_TOP if args.top is None else args.top
+
+        logger.info("******** Checking Backend for LDAP searches ********")
+        source.set_component(source.Component.BE, args.child)
+        source.set_filter(functions=['sdap_get_generic_ext_step',
+                                     'sdap_get_generic_op_finished'])
+
+        slowest = []
+        histogram = {}
+        count = 0
+        for search in self.searches(source):
+            count += 1
+            # the index breaks ties without comparing the searches
+            item = (search.duration, count, search)
+            if len(slowest) < top:
+                heapq.heappush(slowest, item)
+            elif top > 0 and item > slowest[0]:
+                heapq.heapreplace(slowest, item)
+
+            template = filter_template(search.ldap_filter)
+            buckets = histogram.get(template)
+            if buckets is None:
+                buckets = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+                histogram[template] = buckets
+            duration = search.duration / 1000
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if duration < bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+
+        if not count:
+            logger.warning("No LDAP searches found in logs!")
+            return
+
+        print(f"Slowest {len(slowest)} of {count} LDAP searches\n")
+        for duration, _, search in sorted(slowest, reverse=True):
+            print(f"{duration / 1000:>10.3f} ms  {search.stamp} "
+                  f"[{search.component}] [RID#{search.rid}] "
+                  f"{search.result}")
+            print(f"               base:   {search.base}")
+            print(f"               filter: {search.ldap_filter}")
+        print()
+        self.print_histogram(histogram)
@@ -1,23 +1,68 @@
 import re
+import sys
+import heapq
 import logging
 
+from collections import deque, OrderedDict
+
 from sssd.parser import SubparsersAction
 from sssd.parser import Option
+from sssd.matcher import Matcher
+from sssd.source_reader import load_source
+from sssd.log_record import LogRecord, parse_timestamp
+from sssd.child_processes import ChildProcesses, child_partition
 
 logger = logging.getLogger()
 
 
+# Bounds of the correlation buffer holding backend lines whose RID was not
+# yet linked to the tracked request
+CORRELATION_MAX_RIDS = 1024
+CORRELATION_MAX_LINES = 256
+
+# Seconds after which clients, requests and backend requests of --follow
+# not seen finishing are dropped
+FOLLOW_STALE = 600
+
+_CR_RE = re.compile(r'^CR #([0-9]+): ')
+_CLIENT_RE = re.compile(r'\[cmd (.*)\]\[uid ([0-9]+)\]')
+_NEW_CR_RE = re.compile(r"New request \[CID #([0-9]+)\] '(.*)'")
+_INPUT_RE = re.compile(r'Parsing input name \[(.*)\]')
+_FINISHED_RE = re.compile(r'Finished: (.*)')
+_NEW_DP_RE = re.compile(r'REQ_TRACE: New request\. '
+                        r'\[sssd\.(\w+) CID #([0-9]+)\]')
+
+
+def timestamp_key(line):
+    """ Sort key of a log line, lines without timestamp sort first """
+    timestamp = parse_timestamp(line)
+    return 0 if timestamp is None else timestamp
+
+
+def correlate_partition(partition, matcher):
+    """
+    Correlate backend lines of a single reader partition, executed in a
+    worker process.
+
+    Returns:
+        List of lines of RIDs linked to the tracked request
+    """
+    return list(RequestAnalyzer().correlated_lines(partition, matcher))
+
+
 class RequestAnalyzer:
     """
     A request analyzer module, handles request tracking logic
     and analysis. Parses input generated from a source Reader.
     """
     module_parser = None
-    consumed_logs = []
     done = ""
+    trace = None
     list_opts = [
         Option('--verbose', 'Verbose output', bool, '-v'),
         Option('--pam', 'Filter only PAM requests', bool),
+        Option('--follow', 'Follow the logs and print requests as they '
+               'finish, with their latency', bool, '-f'),
     ]
 
     show_opts = [
@@ -25,6 +70,15 @@ class RequestAnalyzer:
         Option('--child', 'Include child process logs', bool),
         Option('--merge', 'Merge logs together sorted by timestamp', bool),
         Option('--pam', 'Track only PAM requests', bool),
+        Option('--format', 'Output format, text (default) or trace for '
+               'Chrome trace-event JSON', str, choices=['text', 'trace']),
+    ]
+
+    export_opts = [
+        Option('--output', 'Write the trace to this file instead of '
+               'standard output', str),
+        Option('--child', 'Include child process logs', bool),
+        Option('--pam', 'Export only PAM requests', bool),
     ]
 
     def print_module_help(self, args):
@@ -59,6 +113,9 @@ class RequestAnalyzer:
                            self.list_requests, self.list_opts)
         cli.add_subcommand(subcmd_grp, 'show', 'Track individual request ID',
                            self.track_request, self.show_opts)
+        cli.add_subcommand(subcmd_grp, 'export',
+                           'Export request timelines as Chrome trace-event '
+                           'JSON', self.export_requests, self.export_opts)
 
         self.module_parser.set_defaults(func=self.print_module_help)
 
@@ -74,79 +131,107 @@ class RequestAnalyzer:
         Returns:
             Instantiated source object
         """
-        if args.source == "journald":
-            from sssd.source_journald import Journald
-            source = Journald()
-        else:
-            from sssd.source_files import Files
-            source = Files(args.logdir)
-        return source
+        return load_source(args)
 
-    def matched_line(self, source, patterns):
+    def matched_line(self, source, matcher):
         """
         Yield lines which match any number of patterns (OR) in
-        provided patterns list.
+        provided matcher.
 
         Args:
             source (Reader): source Reader object
+            matcher (Matcher): compiled matcher built once per query
         Yields:
             lines matching the provided pattern(s)
         """
-        for line in source:
-            for pattern in patterns:
-                re_obj = re.compile(pattern)
-                if re_obj.search(line):
-                    if line.startswith('   *  '):
-                        continue
-                    yield line
+        for line in source.search(matcher):
+            if line.startswith('   *  '):
+                continue
+            yield line
 
-    def get_linked_ids(self, source, pattern, regex):
+    def correlated_lines(self, source, matcher):
         """
-        Retrieve list of associated REQ_TRACE ids. Filter
-        only source lines by pattern, then parse out the
-        linked id with the provided regex.
+        Yield backend lines belonging to the request in a single pass.
+
+        Lines carrying a RID which is not yet known to be linked are kept
+        in a bounded buffer keyed by RID. Once a line matching the provided
+        matcher links its RID to the tracked request, the buffered lines
+        of that RID are released and all further lines of that RID are
+        yielded immediately.
 
         Args:
             source (Reader): source Reader object
-            pattern (list of str): regex pattern(s) used for finding
-                 linked ids
-            regex (str): regular expression used to extract linked id
+            matcher (Matcher): matcher for the linking REQ_TRACE lines
+
+        Yields:
+            lines of RIDs linked to the tracked request
+        """
+        rid_re = re.compile(r'\[RID#[0-9]+\]')
+        linked = set()
+        pending = OrderedDict()
+        # nearly every backend line carries a RID, iterating the lines is
+        # cheaper than searching for them
+        for line in source:
+            if 'RID#' not in line or line.startswith('   *  '):
+                continue
+            match = rid_re.search(line)
+            if not match:
+                continue
+            rid = match.group(0)
+            if rid in linked:
+                yield line
+                continue
+            if matcher.search(line):
+                linked.add(rid)
+                yield from pending.pop(rid, ())
+                yield line
+                continue
+            buf = pending.get(rid)
+            if buf is None:
+                buf = deque(maxlen=CORRELATION_MAX_LINES)
+                pending[rid] = buf
+                if len(pending) > CORRELATION_MAX_RIDS:
+                    pending.popitem(last=False)
+            else:
+                pending.move_to_end(rid)
+            buf.append(line)
+
+    def add_parents(self, lines, children):
+        """
+        Register the child processes forked by the requests of the lines
+
+        Args:
+            lines (list of str): lines of the tracked request
+            children (ChildProcesses): child process map, or None
 
         Returns:
-            List of linked ids discovered
+            The lines
         """
-        linked_ids = []
-        for match in self.matched_line(source, pattern):
-            id_re = re.compile(regex)
-            match = id_re.search(match)
-            if match:
-                found = match.group(0)
-                linked_ids.append(found)
-        return linked_ids
-
-    def consume_line(self, line, source, consume):
+        if children is not None:
+            for line in lines:
+                children.add_parent(line)
+        return lines
+
+    def consume_line(self, line, source):
         """
-        Print or consume a line, if merge cli option is provided then consume
-        boolean is set to True
+        Print a line
 
         Args:
             line (str): line to process
             source (Reader): source Reader object
-            consume (bool): If True, line is added to consume_logs
-               list, otherwise print line
 
         Returns:
             True if line was processed, otherwise False
         """
         found_results = True
-        if consume:
-            self.consumed_logs.append(line.rstrip(line[-1]))
+        if self.trace is not None:
+            self.trace.add(line)
+            return found_results
+        # files and archives sources include newline
+        if type(source).__name__ in ('Files', 'Archives'):
+            print(line, end='')
         else:
-            # files source includes newline
-            if type(source).__name__ == 'Files':
-                print(line, end='')
-            else:
-                print(line)
+            print(line)
         return found_results
 
     def print_formatted(self, line, verbose):
@@ -161,44 +246,44 @@ class RequestAnalyzer:
         name = ""
         id = ""
 
+        record = LogRecord(line)
         # exclude backtrace logs
-        if line.startswith('   *  '):
+        if record.backtrace or not record.valid:
             return
-        fields = line.split("[")
-        cr_field = fields[3][7:]
-        cr = cr_field.split(":")[0][4:]
-        if "refreshed" in line:
+        msg = record.message
+        match = _CR_RE.match(msg)
+        cr = match.group(1) if match else ""
+        if "refreshed" in msg:
             return
         # CR Plugin name
-        if re.search("cache_req_send", line):
-            plugin = line.split('\'')[1]
+        if record.function == "cache_req_send":
+            plugin = msg.split('\'')[1]
         # CR Input name
-        elif re.search("cache_req_process_input", line):
-            name = line.rsplit('[')[-1]
+        elif record.function == "cache_req_process_input":
+            name = msg.rsplit('[')[-1][:-1]
         # CR Input id
-        elif re.search("cache_req_search_send", line):
-            id = line.rsplit()[-1]
+        elif record.function == "cache_req_search_send":
+            id = msg.rsplit()[-1]
         # CID and client process name
         else:
-            ts = line.split(")")[0]
-            ts = ts[1:]
-            fields = line.split("[")
-            cid = fields[3][4:-9]
-            cmd = fields[4][4:-1]
-            uid = fields[5][4:-1]
-            if not uid.isnumeric():
-                uid = fields[6][4:-1]
-            print(f'{ts}: [uid {uid}] CID #{cid}: {cmd}')
+            match = _CLIENT_RE.search(msg)
+            if not match:
+                return
+            cmd, uid = match.groups()
+            # logs of many hosts read by the archives reader
+            host = '' if record.host is None else f'[{record.host}] '
+            print(f'{record.stamp}: {host}[uid {uid}] CID #{record.cid}: '
+                  f'{cmd}')
 
         if verbose:
             if plugin:
                 print("   - " + plugin)
             if name:
-                if cr not in self.done:
-                    print("       - " + name[:-2])
+                if cr != self.done:
+                    print("       - " + name)
                     self.done = cr
             if id:
-                if cr not in self.done:
+                if cr != self.done:
                     print("       - " + id)
                     self.done = cr
 
@@ -210,6 +295,9 @@ class RequestAnalyzer:
             args (Namespace):  populated argparse namespace
         """
         source = self.load(args)
+        if args.follow:
+            self.follow_requests(source, args)
+            return
         component = source.Component.NSS
         resp = "nss"
         # Log messages matching the following regex patterns contain
@@ -217,19 +305,178 @@ class RequestAnalyzer:
         patterns = [r'\[cmd']
         patterns.append("(cache_req_send|cache_req_process_input|"
                         "cache_req_search_send)")
+        matcher = Matcher(patterns, ['[cmd', 'cache_req_'])
         if args.pam:
             component = source.Component.PAM
             resp = "pam"
 
         logger.info(f"******** Listing {resp} client requests ********")
         source.set_component(component, False)
+        source.set_filter(functions=['accept_fd_handler', 'cache_req_send',
+                                     'cache_req_process_input',
+                                     'cache_req_search_send'])
         self.done = ""
-        for line in self.matched_line(source, patterns):
+        for line in self.matched_line(source, matcher):
             if type(source).__name__ == 'Journald':
                 print(line)
             else:
                 self.print_formatted(line, args.verbose)
 
+    def follow_requests(self, source, args):
+        """
+        Follow the responder and backend log files and print every
+        responder request as it finishes, with its latency and the time
+        spent in the data provider requests it started.
+
+        Args:
+            source (Reader): source Reader object
+            args (Namespace):  populated argparse namespace
+        """
+        from sssd.log_follow import LogFollower
+
+        if type(source).__name__ != 'Files':
+            logger.error("--follow is supported only with the files source")
+            return
+        resp = "pam" if args.pam else "nss"
+        # backend lines of every round are read first, a data provider
+        # request finishes before the responder request waiting for it
+        paths = sorted(source.domains) + [f'{source.path}sssd_{resp}.log']
+        patterns = [r'\[cmd .*connected',
+                    r'Client disconnected!',
+                    r'REQ_TRACE: New request \[CID #',
+                    r'CR #[0-9]+: Parsing input name',
+                    r'CR #[0-9]+: Finished: ',
+                    r'REQ_TRACE: New request\. \[sssd\.',
+                    r'Request handler finished']
+        matcher = Matcher(patterns, ['[cmd', 'Client disconnected',
+                                     'New request', 'Parsing input',
+                                     'Finished: ', 'handler finished'])
+
+        logger.info(f"******** Following {resp} client requests ********")
+        # cid -> [cmd, uid, last request start]
+        clients = {}
+        # (component, CR) -> [cid, plugin, name, start]
+        active = {}
+        # (component, RID) -> (cid, start) of running backend requests
+        backend = {}
+        # cid -> deque of (start, end) of finished backend requests
+        linked = {}
+        dropped = None
+        follower = LogFollower(paths)
+        try:
+            for path, line in follower:
+                if not matcher.search(line):
+                    continue
+                record = LogRecord(line)
+                if record.backtrace or not record.valid:
+                    continue
+                now = record.timestamp
+                if dropped is None or now - dropped > FOLLOW_STALE * 1000000:
+                    self.drop_stale(now, clients, active, backend, linked)
+                    dropped = now
+                msg = record.message
+                if not path.endswith(f'sssd_{resp}.log'):
+                    key = (record.component, record.rid)
+                    match = _NEW_DP_RE.search(msg)
+                    if match:
+                        if match.group(1) == resp:
+                            backend[key] = (int(match.group(2)),
+                                            record.timestamp)
+                    elif key in backend:
+                        cid, start = backend.pop(key)
+                        linked.setdefault(cid, deque()).append(
+                            (start, record.timestamp))
+                    continue
+
+                match = _CR_RE.match(msg)
+                if not match:
+                    if record.cid is None:
+                        continue
+                    match = _CLIENT_RE.search(msg)
+                    if match:
+                        clients[record.cid] = [match.group(1),
+                                               match.group(2), now]
+                    elif 'Client disconnected' in msg:
+                        clients.pop(record.cid, None)
+                        linked.pop(record.cid, None)
+                    continue
+                key = (record.component, match.group(1))
+                found = _NEW_CR_RE.search(msg)
+                if found:
+                    cid = int(found.group(1))
+                    active[key] = [cid, found.group(2), '', now]
+                    if cid in clients:
+                        clients[cid][2] = now
+                    continue
+                request = active.get(key)
+                if request is None:
+                    continue
+                found = _INPUT_RE.search(msg)
+                if found:
+                    request[2] = found.group(1)
+                    continue
+                found = _FINISHED_RE.search(msg)
+                if found:
+                    del active[key]
+                    self.print_finished(record, request, found.group(1),
+                                        clients, linked)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            follower.close()
+
+    def print_finished(self, record, request, result, clients, linked):
+        """
+        Print a finished responder request followed by --follow
+
+        Args:
+            record (LogRecord): the 'Finished' line of the request
+            request (list): [cid, plugin, name, start] of the request
+            result (str): result of the request
+            clients (dict): [command, uid, last] lists by CID
+            linked (dict): deques of (start, end) tuples of finished
+                backend requests by CID, the ones started before the end
+                of the request are consumed
+        """
+        cid, plugin, name, start = request
+        end = record.timestamp
+        spent = 0
+        spans = linked.get(cid)
+        while spans and spans[0][0] <= end:
+            span_start, span_end = spans.popleft()
+            if span_start >= start:
+                spent += span_end - span_start
+        if spans is not None and not spans:
+            del linked[cid]
+
+        cmd, uid, _ = clients.get(cid, ('-', '-', None))
+        line = f'{record.stamp}: [uid {uid}] CID #{cid}: {cmd}: {plugin}'
+        if name:
+            line += f' [{name}]'
+        line += f' {(end - start) / 1000:.3f} ms'
+        if spent:
+            line += f' (backend {spent / 1000:.3f} ms)'
+        print(f'{line}: {result}', flush=True)
+
+    def drop_stale(self, now, clients, active, backend, linked):
+        """
+        Drop the clients without requests, the requests not seen finishing
+        and the backend requests no responder request claimed for
+        FOLLOW_STALE seconds
+        """
+        limit = now - FOLLOW_STALE * 1000000
+        for entries, stamp in ((clients, lambda e: e[2]),
+                               (active, lambda e: e[3]),
+                               (backend, lambda e: e[1])):
+            for key in [k for k, e in entries.items() if stamp(e) < limit]:
+                del entries[key]
+        for cid in list(linked):
+            spans = linked[cid]
+            while spans and spans[0][1] < limit:
+                spans.popleft()
+            if not spans:
+                del linked[cid]
+
     def track_request(self, args):
         """
         Print Logs pertaining to individual SSSD client request
@@ -239,12 +486,23 @@ class RequestAnalyzer:
         """
         source = self.load(args)
         cid = args.cid
+        if type(source).__name__ == 'Archives' and len(source.readers) > 1:
+            # client IDs are counted by every responder process separately
+            logger.error(f"CID #{cid} is ambiguous with the logs of many "
+                         f"hosts, select one with --host: "
+                         f"{', '.join(sorted(source.readers))}")
+            return
+        self.trace = None
+        if args.format == 'trace':
+            from sssd.trace_export import TraceExporter
+            self.trace = TraceExporter()
         resp_results = False
         be_results = False
         component = source.Component.NSS
         resp = "nss"
-        pattern = [rf'REQ_TRACE.*\[CID #{cid}\\]']
-        pattern.append(rf"\[CID#{cid}\\]")
+        pattern = [rf'REQ_TRACE.*\[CID #{cid}\]']
+        pattern.append(rf"\[CID#{cid}\]")
+        matcher = Matcher(pattern, [f'CID #{cid}]', f'CID#{cid}]'])
 
         if args.pam:
             component = source.Component.PAM
@@ -252,28 +510,114 @@ class RequestAnalyzer:
 
         logger.info(f"******** Checking {resp} responder for Client ID"
                     f" {cid} *******")
+        # child processes forked by the request, e.g. p11_child by the PAM
+        # responder or krb5_child by the backend
+        children = ChildProcesses() if args.child else None
         source.set_component(component, args.child)
-        for match in self.matched_line(source, pattern):
-            resp_results = self.consume_line(match, source, args.merge)
+        source.set_filter(ids=[f'CID#{cid}'])
+        streams = []
+        if args.merge:
+            # every log file is time ordered, keep one lazy stream per file
+            for partition in source.partitions():
+                lines = self.matched_line(partition, matcher)
+                # readers which cannot be split are switched to the
+                # backend below, read the responder lines now
+                if partition is source or children is not None:
+                    lines = self.add_parents(list(lines), children)
+                streams.append(lines)
+        else:
+            for match in self.matched_line(source, matcher):
+                resp_results = self.consume_line(match, source)
+                if children is not None:
+                    children.add_parent(match)
 
         logger.info(f"********* Checking Backend for Client ID {cid} ********")
         pattern = [rf'REQ_TRACE.*\[sssd.{resp} CID #{cid}\]']
-        source.set_component(source.Component.BE, args.child)
-
-        be_id_regex = r'\[RID#[0-9]+\]'
-        be_ids = self.get_linked_ids(source, pattern, be_id_regex)
-
-        pattern.clear()
-        [pattern.append(f'\\{id}') for id in be_ids]
-
-        for match in self.matched_line(source, pattern):
-            be_results = self.consume_line(match, source, args.merge)
+        matcher = Matcher(pattern, [f'CID #{cid}]'])
+        # child logs are correlated by PID below, not by RID
+        source.set_component(source.Component.BE, False)
+        source.set_filter(ids=[f'CID#{cid}'], linked=(resp, cid))
 
         if args.merge:
-            # sort by date/timestamp
-            sorted_list = sorted(self.consumed_logs,
-                                 key=lambda s: s.split(')')[0])
-            for entry in sorted_list:
-                print(entry)
+            for partition in source.partitions():
+                lines = self.correlated_lines(partition, matcher)
+                if children is not None:
+                    # the PIDs of the children must be known before the
+                    # child logs are read
+                    lines = self.add_parents(list(lines), children)
+                streams.append(lines)
+            if children:
+                logger.info(f"******** Checking child processes for Client ID"
+                            f" {cid} ********")
+                source.set_component(source.Component.CHILD, False)
+                for partition in source.partitions():
+                    streams.append(children.lines(partition))
+            # streaming k-way merge by timestamp, constant memory per file
+            for match in heapq.merge(*streams, key=timestamp_key):
+                be_results = self.consume_line(match, source)
+        else:
+            # RIDs are assigned by each backend process independently,
+            # correlate every log file on its own
+            for lines in source.map_partitions(correlate_partition, matcher):
+                for match in lines:
+                    be_results = self.consume_line(match, source)
+                    if children is not None:
+                        children.add_parent(match)
+            if children:
+                logger.info(f"******** Checking child processes for Client ID"
+                            f" {cid} ********")
+                source.set_component(source.Component.CHILD, False)
+                for lines in source.map_partitions(child_partition,
+                                                   children):
+                    for match in lines:
+                        be_results = self.consume_line(match, source)
+
         if not resp_results and not be_results:
             logger.warn(f"ID {cid} not found in logs!")
+        elif self.trace is not None:
+            self.trace.write(sys.stdout)
+
+    def export_requests(self, args):
+        """
+        Export the timelines of all requests as Chrome trace-event JSON
+
+        Args:
+            args (Namespace):  populated argparse namespace
+        """
+        from sssd.trace_export import TraceExporter
+
+        source = self.load(args)
+        component = source.Component.NSS
+        resp = "nss"
+        if args.pam:
+            component = source.Component.PAM
+            resp = "pam"
+        trace = TraceExporter()
+        matcher = TraceExporter.matcher()
+
+        logger.info(f"******** Reading {resp} client requests ********")
+        source.set_component(component, False)
+        for line in self.matched_line(source, matcher):
+            trace.add(line)
+
+        logger.info("******** Reading backend requests ********")
+        source.set_component(source.Component.BE, False)
+        for line in self.matched_line(source, matcher):
+            trace.add(line)
+
+        # every child line extends the run of its process
+        if args.child and trace.children:
+            logger.info("******** Reading child processes ********")
+            source.set_component(source.Component.CHILD, False)
+            for line in source:
+                trace.add(line)
+
+        if args.output is None:
+            trace.write(sys.stdout)
+            return
+        try:
+            with open(args.output, 'w') as file:
+                trace.write(file)
+        except OSError as err:
+            logger.error(f"Could not write trace to {args.output}")
+            logger.error(err)
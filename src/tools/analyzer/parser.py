@@ -53,8 +53,10 @@ class Option:
     """
     Group option attributes for command/subcommand options
     """
-    def __init__(self, name, help_msg, opt_type, short_opt=None):
+    def __init__(self, name, help_msg, opt_type, short_opt=None,
+                 choices=None):
         self.name = name
         self.short_opt = short_opt
         self.help_msg = help_msg
         self.opt_type = opt_type
+        self.choices = choices
@@ -0,0 +1,352 @@
+import os
+import re
+import copy
+import fnmatch
+import logging
+import tarfile
+import posixpath
+
+from sssd.source_reader import Reader, search_partition
+from sssd.source_files import (Files, RESPONDERS, open_log, filter_window,
+                               search_stream, rotated_logfiles)
+
+logger = logging.getLogger()
+
+# Archive formats read by the tarfile module
+_ARCHIVE_RE = re.compile(r'\.(?:tar|tar\.gz|tgz|tar\.bz2|tbz2?|tar\.xz|txz)$')
+
+# sssd_nss.log, krb5_child.log, sssd_nss.log.1, sssd_nss.log-20220708.gz
+_LOG_RE = re.compile(r'\.log(?:\.[0-9]+|-[0-9]{8,10})?'
+                     r'(?:\.gz|\.bz2|\.xz|\.zst)?$')
+
+
+def is_archive(path):
+    """ True if the path is an archive in a format read by tarfile """
+    return _ARCHIVE_RE.search(path) is not None
+
+
+def tag_host(line, host):
+    """
+    Append the host name to the program name of a log line, e.g. [nss]
+    becomes [nss@client1]. Lines without debug prefix are left alone.
+
+    Args:
+        line (str): log line
+        host (str): host name
+
+    Returns:
+        The tagged line
+    """
+    start = line.find('): [')
+    if start < 0:
+        return line
+    end = line.find('] [', start + 4)
+    if end < 0:
+        return line
+    return f'{line[:end]}@{host}{line[end:]}'
+
+
+def select_logfiles(names, component, child, rotated):
+    """
+    Select the log files of a component by their names, the same way the
+    files reader does in the log directory
+
+    Args:
+        names (iterable of str): names of all log files of a host
+        component (Reader.Component): component to select
+        child (bool): include child log files in the backend logs
+        rotated (bool): include rotated and compressed log files
+
+    Returns:
+        List of names, rotated log files before the current one
+    """
+    names = list(names)
+    current = [name for name in names if name.endswith('.log')]
+    if component == Reader.Component.NSS:
+        logs = [name for name in current if name == 'sssd_nss.log']
+    elif component == Reader.Component.PAM:
+        logs = [name for name in current if name == 'sssd_pam.log']
+    elif component == Reader.Component.BE:
+        pattern = '*.log' if child else 'sssd_*.log'
+        logs = [name for name in current
+                if fnmatch.fnmatch(name, pattern)
+                and not any(s in name for s in RESPONDERS)]
+    elif component == Reader.Component.CHILD:
+        logs = [name for name in current
+                if fnmatch.fnmatch(name, '*_child.log')]
+    else:
+        logs = []
+
+    selected = []
+    for log in sorted(logs):
+        if rotated:
+            selected.extend(rotated_logfiles(log, names))
+        selected.append(log)
+    return selected
+
+
+def open_host(path, rotated):
+    """
+    Open the logs of a single host, executed in a worker process.
+
+    Args:
+        path (str): archive or sosreport tree path
+        rotated (bool): include rotated and compressed log files
+
+    Returns:
+        (host, reader) tuple, None if the path holds no SSSD logs
+    """
+    if os.path.isdir(path):
+        logdir = os.path.join(path, 'var', 'log', 'sssd')
+        if not os.path.isdir(logdir):
+            logdir = path
+        if not any(_LOG_RE.search(name) for name in os.listdir(logdir)):
+            return None
+        host = os.path.basename(os.path.normpath(path))
+        try:
+            with open(os.path.join(path, 'hostname')) as file:
+                host = file.read().strip() or host
+        except OSError:
+            pass
+        return host, Files(logdir, rotated=rotated)
+
+    try:
+        reader = Tarball(path, rotated)
+    except (OSError, tarfile.TarError) as err:
+        logger.warning(f"Could not read archive {path}, skipping")
+        logger.warning(err)
+        return None
+    if not reader.members:
+        return None
+    return reader.host, reader
+
+
+class Tarball(Reader):
+    """
+    A class used to represent a reader of the SSSD log files in a tar
+    archive, e.g. a tarball of /var/log/sssd or a sosreport. Members are
+    read straight from the archive, nothing is extracted to disk.
+
+    Args:
+        path -- the archive path
+        rotated -- read also rotated and compressed log files
+    """
+
+    def __init__(self, path, rotated=False):
+        super().__init__()
+        self.path = path
+        self.rotated = rotated
+        self.log_files = []
+        self.members = {}
+        name = os.path.basename(path)
+        self.host = name[:_ARCHIVE_RE.search(name).start()]
+        self.scan()
+
+    def scan(self):
+        """
+        List the log files of the archive. Log files are looked up in
+        var/log/sssd, in a top level sssd directory or at the top level.
+        The host name is taken from the hostname file of sosreports.
+        """
+        logdirs = {}
+        hostname = None
+        with tarfile.open(self.path, 'r:*') as tar:
+            for info in tar.getmembers():
+                path = posixpath.normpath(info.name)
+                dirname, name = posixpath.split(path)
+                if name == 'hostname' and dirname.count('/') == 0:
+                    hostname = info
+                    continue
+                if not info.isfile() or not _LOG_RE.search(name):
+                    continue
+                if dirname and posixpath.basename(dirname) != 'sssd':
+                    continue
+                logdirs.setdefault(dirname, {})[name] = info
+
+            if hostname is not None:
+                try:
+                    file = tar.extractfile(hostname)
+                    if file is not None:
+                        host = file.read().decode(errors='replace').strip()
+                        self.host = host or self.host
+                except (KeyError, tarfile.TarError):
+                    pass
+
+        for dirname in sorted(logdirs):
+            if dirname.endswith('var/log/sssd'):
+                self.members = logdirs[dirname]
+                return
+        if logdirs:
+            self.members = logdirs[sorted(logdirs)[0]]
+
+    def __iter__(self):
+        """
+        Yields:
+            str: The next line in the log files
+        """
+        with tarfile.open(self.path, 'r:*') as tar:
+            for name in self.log_files:
+                member = tar.extractfile(self.members[name])
+                with open_log(name, 'r', member) as file:
+                    yield from filter_window(file, self.since, self.until)
+
+    def search(self, matcher):
+        """
+        Search the log files chunk by chunk as they are decompressed
+        from the archive.
+
+        Yields:
+            str: The next matching line in the log files
+        """
+        with tarfile.open(self.path, 'r:*') as tar:
+            for name in self.log_files:
+                member = tar.extractfile(self.members[name])
+                with open_log(name, 'rb', member) as file:
+                    yield from search_stream(file, matcher, self.since,
+                                             self.until)
+
+    def set_component(self, component, child):
+        """
+        Switch the reader to interact with a certain SSSD component
+        NSS, PAM, BE, CHILD
+        """
+        self.log_files = select_logfiles(self.members, component, child,
+                                         self.rotated)
+        if component == self.Component.BE and not self.log_files:
+            raise IOError
+
+
+class Archives(Reader):
+    """
+    A class used to represent a reader of the logs of many hosts, e.g. a
+    directory of /var/log/sssd tarballs and sosreports collected from the
+    clients. Every host is read by a reader of its own and the program
+    name of every line is tagged with the host name, see tag_host().
+
+    Args:
+        path -- directory of archives and sosreport trees, a single
+           archive or a single sosreport tree
+        hosts -- read only the logs of these hosts
+        rotated -- read also rotated and compressed log files
+        jobs -- number of worker processes, hosts are opened and searched
+           in parallel
+    """
+
+    def __init__(self, path, hosts=None, rotated=False, jobs=1):
+        super().__init__(jobs)
+        self.readers = {}
+        self.selected = []
+        self.open(self.find_hosts(path), rotated)
+
+        if hosts:
+            for host in hosts:
+                if host not in self.readers:
+                    logger.warning(f"Host {host} not found in {path}")
+            self.readers = {host: reader
+                            for host, reader in self.readers.items()
+                            if host in hosts}
+        if not self.readers:
+            logger.warning(f"No SSSD logs found in {path}")
+
+    def find_hosts(self, path):
+        """
+        Returns:
+            List of the archive and tree paths holding the logs of a
+            single host each
+        """
+        if not os.path.isdir(path):
+            return [path]
+        if os.path.isdir(os.path.join(path, 'var', 'log', 'sssd')):
+            return [path]
+        paths = []
+        for name in sorted(os.listdir(path)):
+            entry = os.path.join(path, name)
+            if is_archive(name) or os.path.isdir(entry):
+                paths.append(entry)
+        return paths
+
+    def open(self, paths, rotated):
+        """ Open the logs of every host, in parallel if allowed """
+        if self.jobs > 1 and len(paths) > 1:
+            # multiprocessing is slow to import, only do so when needed
+            from concurrent.futures import ProcessPoolExecutor
+
+            workers = min(self.jobs, len(paths))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                opened = list(executor.map(open_host, paths,
+                                           [rotated] * len(paths)))
+        else:
+            opened = [open_host(path, rotated) for path in paths]
+
+        for path, found in zip(paths, opened):
+            if found is None:
+                continue
+            host, reader = found
+            if host in self.readers:
+                logger.warning(f"Host {host} found twice, naming the logs "
+                               f"of {path} {host}-{len(self.readers)}")
+                host = f'{host}-{len(self.readers)}'
+            self.readers[host] = reader
+
+    def __iter__(self):
+        """
+        Yields:
+            str: The next line of the selected hosts, host by host
+        """
+        for host in self.selected:
+            for line in self.readers[host]:
+                yield tag_host(line, host)
+
+    def search(self, matcher):
+        """
+        Search the logs of the selected hosts. If more jobs are allowed,
+        hosts are searched in parallel worker processes.
+
+        Yields:
+            str: The next matching line, host by host
+        """
+        if self.jobs > 1 and len(self.selected) > 1:
+            for lines in self.map_partitions(search_partition, matcher):
+                yield from lines
+            return
+
+        for host in self.selected:
+            for line in self.readers[host].search(matcher):
+                yield tag_host(line, host)
+
+    def partitions(self):
+        """
+        Split the reader into one partition per host
+
+        Returns:
+            List of Archives objects reading a single host each
+        """
+        partitions = []
+        for host in self.selected:
+            partition = copy.copy(self)
+            partition.readers = {host: self.readers[host]}
+            partition.selected = [host]
+            partitions.append(partition)
+        return partitions
+
+    def set_window(self, since=None, until=None):
+        super().set_window(since, until)
+        for reader in self.readers.values():
+            reader.set_window(since, until)
+
+    def set_component(self, component, child):
+        """
+        Switch the reader to interact with a certain SSSD component
+        NSS, PAM, BE, CHILD, hosts without logs of the component are
+        skipped
+        """
+        self.selected = []
+        for host, reader in self.readers.items():
+            try:
+                reader.set_component(component, child)
+            except IOError:
+                continue
+            if reader.log_files:
+                self.selected.append(host)
+        if component == self.Component.BE and not self.selected:
+            raise IOError
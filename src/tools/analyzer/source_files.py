@@ -1,10 +1,258 @@
+import io
+import os
+import re
+import bz2
+import copy
 import glob
+import gzip
+import lzma
+import mmap
 import logging
 
-from sssd.source_reader import Reader
+from sssd.source_reader import Reader, search_partition
+from sssd.log_index import LogIndex
+from sssd.log_record import parse_timestamp
 
 logger = logging.getLogger()
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+if zstandard is not None:
+    _OPENERS['.zst'] = zstandard.open
+
+# sssd_nss.log, sssd_nss.log.1, sssd_nss.log.2.gz, sssd_nss.log-20220708.xz
+_ROTATED_RE = re.compile(r'^(?P<base>.+?\.log)'
+                         r'(?:\.(?P<num>[0-9]+)|-(?P<date>[0-9]{8,10}))?'
+                         r'(?P<ext>\.gz|\.bz2|\.xz|\.zst)?$')
+
+# Size of the decompressed chunks searched at once
+_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Log files of the responders, all other sssd_*.log files are backends
+RESPONDERS = ["ifp", "nss", "pam", "sudo", "autofs", "ssh", "pac", "kcm"]
+
+
+def is_compressed(path):
+    """ True if the log file is compressed by logrotate """
+    return os.path.splitext(path)[1] in ('.gz', '.bz2', '.xz', '.zst')
+
+
+def open_log(path, mode='r', fileobj=None):
+    """
+    Open plain or compressed log file, compressed files are decompressed
+    on the fly while reading.
+
+    Args:
+        path (str): log file path, only its extension is used if fileobj
+            is provided
+        mode (str): 'r' for text or 'rb' for binary mode
+        fileobj (file object): binary file object to read instead of the
+            path, e.g. a member of an archive
+
+    Returns:
+        file object
+    """
+    ext = os.path.splitext(path)[1]
+    opener = _OPENERS.get(ext)
+    if opener is None:
+        if is_compressed(path):
+            raise OSError(f"Missing python module to decompress {path}")
+        if fileobj is None:
+            return open(path, mode)
+        if mode == 'r':
+            return io.TextIOWrapper(fileobj, errors='replace')
+        return fileobj
+    source = path if fileobj is None else fileobj
+    if mode == 'r':
+        return opener(source, 'rt', errors='replace')
+    return opener(source, mode)
+
+
+def filter_window(lines, since=None, until=None):
+    """
+    Filter time ordered lines by a time window. Lines without timestamp,
+    e.g. continuation lines of multi-line messages, belong to the last
+    line with a timestamp.
+
+    Args:
+        lines (iterable of str): lines to filter
+        since (int): start of the window, see parse_timestamp()
+        until (int): end of the window (exclusive)
+
+    Yields:
+        str: lines within the time window
+    """
+    inside = since is None
+    for line in lines:
+        if line.startswith('('):
+            timestamp = parse_timestamp(line)
+            if timestamp is not None:
+                if until is not None and timestamp >= until:
+                    return
+                inside = since is None or timestamp >= since
+        if inside:
+            yield line
+
+
+def _line_start(buf, pos, end):
+    """ Offset of the first line starting at or after pos """
+    if pos == 0 or buf[pos - 1:pos] == b'\n':
+        return pos
+    nl = buf.find(b'\n', pos, end)
+    return end if nl < 0 else nl + 1
+
+
+def _line_timestamp(buf, pos, end):
+    """ Timestamp of the line at pos ending at end, None if it has none """
+    if buf[pos:pos + 1] != b'(':
+        return None
+    head = bytes(buf[pos:min(pos + 32, end)])
+    return parse_timestamp(head.decode(errors='replace'))
+
+
+def bisect_timestamp(buf, target, end=None):
+    """
+    Find the first line logged at or after target in a time ordered log
+    buffer in O(log n) steps, looking only at the timestamps of the
+    lines next to the probed offsets.
+
+    Args:
+        buf (bytes-like): buffer to search, e.g. mmap object
+        target (int): timestamp, see parse_timestamp()
+        end (int): size of the buffer
+
+    Returns:
+        Offset of the line start, end if there is no such line
+    """
+    if end is None:
+        end = len(buf)
+    lo = 0
+    hi = end
+    while lo < hi:
+        mid = (lo + hi) // 2
+        pos = _line_start(buf, mid, end)
+        timestamp = None
+        # lines without timestamp take the one of the next line
+        while pos < end:
+            nl = buf.find(b'\n', pos, end)
+            next_pos = end if nl < 0 else nl + 1
+            timestamp = _line_timestamp(buf, pos, next_pos)
+            if timestamp is not None:
+                break
+            pos = next_pos
+
+        if timestamp is None or timestamp >= target:
+            hi = mid
+        else:
+            lo = next_pos
+
+    # lines without timestamp belong to the line before, as in
+    # filter_window(), skip them to start at a line with timestamp
+    pos = _line_start(buf, lo, end)
+    while pos < end:
+        nl = buf.find(b'\n', pos, end)
+        next_pos = end if nl < 0 else nl + 1
+        if _line_timestamp(buf, pos, next_pos) is not None:
+            break
+        pos = next_pos
+    return pos
+
+
+def search_stream(file, matcher, since=None, until=None):
+    """
+    Search a binary stream chunk by chunk, e.g. a decompressed log file.
+
+    Args:
+        file (file object): binary file object to read from
+        matcher (Matcher): compiled matcher
+        since (int): skip lines logged before
+        until (int): stop at the first line logged at or after
+
+    Returns:
+        List of matching lines
+    """
+    lines = []
+    rest = b''
+    while True:
+        data = file.read(_CHUNK_SIZE)
+        if not data:
+            break
+        data = rest + data
+        end = data.rfind(b'\n') + 1
+        rest = data[end:]
+        for line in matcher.scan(data, 0, end):
+            lines.append(line.decode(errors='replace'))
+        if until is not None and lines \
+           and (parse_timestamp(lines[-1]) or 0) >= until:
+            break
+    else:
+        for line in matcher.scan(rest):
+            lines.append(line.decode(errors='replace'))
+
+    if since is None and until is None:
+        return lines
+    return list(filter_window(lines, since, until))
+
+
+def search_compressed(path, matcher, since=None, until=None):
+    """
+    Stream decompress a rotated log file and search it chunk by chunk.
+
+    Args:
+        path (str): compressed log file path
+        matcher (Matcher): compiled matcher
+        since (int): skip lines logged before
+        until (int): stop at the first line logged at or after
+
+    Returns:
+        List of matching lines
+    """
+    with open_log(path, 'rb') as file:
+        return search_stream(file, matcher, since, until)
+
+
+def rotated_logfiles(logfile, names):
+    """
+    Select the rotated versions of a log file, including compressed ones,
+    in chronological order.
+
+    Args:
+        logfile (str): name of the current log file
+        names (iterable of str): names to select from, in the same
+            directory as the log file
+
+    Returns:
+        List of the rotated log file names, oldest first, without the log
+        file itself
+    """
+    rotated = []
+    for name in names:
+        match = _ROTATED_RE.match(name)
+        if match is None or match.group('base') != logfile:
+            continue
+        if not (match.group('num') or match.group('date')
+                or match.group('ext')):
+            continue
+        if is_compressed(name) and match.group('ext') not in _OPENERS:
+            logger.warning(f"Cannot decompress {name}, skipping")
+            continue
+        if match.group('date'):
+            key = (0, int(match.group('date')))
+        elif match.group('num'):
+            key = (1, -int(match.group('num')))
+        else:
+            key = (2, 0)
+        rotated.append((key, name))
+    return [name for _, name in sorted(rotated)]
+
 
 class Files(Reader):
     """
@@ -13,13 +261,22 @@ class Files(Reader):
     Args:
         path -- the path where SSSD logs are to
            be read (default /var/log/sssd/)
+        index -- maintain and use on-disk offset indexes of the log files
+        index_dir -- directory where the indexes are stored
+        rotated -- read also rotated and compressed log files
+        jobs -- number of worker processes used to search log files
     """
 
-    def __init__(self, path):
-        super().__init__()
+    def __init__(self, path, index=False, index_dir=None, rotated=False,
+                 jobs=1):
+        super().__init__(jobs)
         self.log_files = []
         self.path = self.resolve_path(path)
         self.domains = self.get_domain_logfiles()
+        self.index = index
+        self.index_dir = index_dir
+        self.rotated = rotated
+        self.set_filter()
 
     def __iter__(self):
         """
@@ -28,14 +285,166 @@ class Files(Reader):
         """
         for files in self.log_files:
             try:
-                with open(files) as file:
-                    for line in file:
-                        yield line
+                ranges = self.get_ranges(files)
+                if ranges is None:
+                    with open_log(files) as file:
+                        yield from filter_window(file, self.since,
+                                                 self.until)
+                    continue
+
+                with open(files, 'rb') as file:
+                    for start, end in ranges:
+                        file.seek(start)
+                        offset = start
+                        while offset < end:
+                            line = file.readline()
+                            if not line:
+                                break
+                            offset += len(line)
+                            yield line.decode(errors='replace')
             except FileNotFoundError as err:
                 logger.warning("Could not find domain log file, skipping")
                 logger.warning(err)
                 continue
 
+    def search(self, matcher):
+        """
+        Search memory mapped log files for lines matching the provided
+        matcher. Only the raw bytes are searched, just the matching lines
+        are decoded. Compressed log files are decompressed on the fly.
+        If more jobs are allowed, the log files are searched in parallel
+        worker processes, one file per process at a time.
+
+        Yields:
+            str: The next matching line in the log file
+        """
+        if self.jobs > 1 and len(self.log_files) > 1:
+            for lines in self.map_partitions(search_partition, matcher):
+                yield from lines
+            return
+
+        for files in self.log_files:
+            try:
+                if is_compressed(files):
+                    yield from search_compressed(files, matcher, self.since,
+                                                 self.until)
+                else:
+                    yield from self.search_mapped(files, matcher)
+            except FileNotFoundError as err:
+                logger.warning("Could not find domain log file, skipping")
+                logger.warning(err)
+                continue
+
+    def partitions(self):
+        """
+        Split the reader into one partition per log file
+
+        Returns:
+            List of Files objects reading a single log file each
+        """
+        partitions = []
+        for files in self.log_files:
+            partition = copy.copy(self)
+            partition.log_files = [files]
+            partitions.append(partition)
+        return partitions
+
+    def search_mapped(self, path, matcher):
+        """
+        Search a single memory mapped log file
+
+        Args:
+            path (str): log file path
+            matcher (Matcher): compiled matcher
+
+        Yields:
+            str: The next matching line in the log file
+        """
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                ranges = self.get_ranges(path, mm)
+                if ranges is None:
+                    ranges = [(0, size)]
+                for start, end in ranges:
+                    for line in matcher.scan(mm, start, min(end, size)):
+                        yield line.decode(errors='replace')
+
+    def set_filter(self, ids=None, functions=None, linked=None):
+        """
+        Restrict reading to the index blocks containing the given ids,
+        functions or RIDs linked to a responder client ID. Only effective
+        if indexing is enabled.
+        """
+        self.filter_ids = list(ids or [])
+        self.filter_functions = list(functions or [])
+        self.filter_linked = linked
+
+    def get_ranges(self, path, buf=None):
+        """
+        Look up the byte ranges of interest in the log file index and
+        the byte range of the time window
+
+        Args:
+            path (str): log file path
+            buf (bytes-like): the mapped log file, if already mapped
+
+        Returns:
+            List of (start, end) byte offset tuples, None if the whole
+            file needs to be read
+        """
+        if is_compressed(path):
+            return None
+
+        ranges = None
+        if self.index and (self.filter_ids or self.filter_functions
+                           or self.filter_linked):
+            index = LogIndex(path, self.index_dir)
+            index.update()
+            ids = list(self.filter_ids)
+            if self.filter_linked:
+                ids.extend(index.linked_ids(*self.filter_linked))
+            ranges = index.lookup(ids, self.filter_functions)
+
+        if self.since is None and self.until is None:
+            return ranges
+
+        window = self.get_window(path, buf)
+        if ranges is None:
+            return [window]
+        return [(max(start, window[0]), min(end, window[1]))
+                for start, end in ranges
+                if start < window[1] and end > window[0]]
+
+    def get_window(self, path, buf=None):
+        """
+        Bisect the log file for the byte range of the time window
+
+        Args:
+            path (str): log file path
+            buf (bytes-like): the mapped log file, if already mapped
+
+        Returns:
+            (start, end) byte offset tuple
+        """
+        if buf is None:
+            with open(path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    return (0, 0)
+                with mmap.mmap(file.fileno(), 0,
+                               access=mmap.ACCESS_READ) as mm:
+                    return self.get_window(path, mm)
+
+        start = 0
+        end = len(buf)
+        if self.since is not None:
+            start = bisect_timestamp(buf, self.since)
+        if self.until is not None:
+            end = bisect_timestamp(buf, self.until)
+        return (start, max(start, end))
+
     def resolve_path(self, path):
         if path.endswith("/"):
             return path
@@ -43,34 +452,61 @@ class Files(Reader):
             return path + "/"
 
     def get_domain_logfiles(self, child=False):
-        """ Retrieve list of SSSD log files, exclude rotated (.gz) files """
+        """ Retrieve list of SSSD log files, exclude rotated files """
         domain_files = []
-        exclude_list = ["ifp", "nss", "pam", "sudo", "autofs",
-                        "ssh", "pac", "kcm", ".gz"]
+        exclude_list = RESPONDERS
         if child:
             file_list = glob.glob(self.path + "*.log")
         else:
-            file_list = glob.glob(self.path + "sssd_*")
+            file_list = glob.glob(self.path + "sssd_*.log")
         for file in file_list:
             if not any(s in file for s in exclude_list):
                 domain_files.append(file)
 
         return domain_files
 
+    def get_child_logfiles(self):
+        """ Retrieve list of child helper log files, e.g. krb5_child.log """
+        return glob.glob(self.path + "*_child.log")
+
+    def get_rotated_logfiles(self, logfile):
+        """
+        Retrieve rotated versions of a log file, including compressed
+        ones, in chronological order. The log file itself is the last one.
+
+        Args:
+            logfile (str): path of the current log file
+
+        Returns:
+            List of log file paths, oldest first
+        """
+        rotated = glob.glob(glob.escape(logfile) + "?*")
+        return rotated_logfiles(logfile, rotated) + [logfile]
+
     def set_component(self, component, child):
         """
         Switch the reader to interact with a certain SSSD component
-        NSS, PAM, BE
+        NSS, PAM, BE, CHILD
         """
         self.log_files = []
+        self.set_filter()
+        logs = []
         if component == self.Component.NSS:
-            self.log_files.append(self.path + "sssd_nss.log")
+            logs.append(self.path + "sssd_nss.log")
         elif component == self.Component.PAM:
-            self.log_files.append(self.path + "sssd_pam.log")
+            logs.append(self.path + "sssd_pam.log")
         elif component == self.Component.BE:
             domains = self.get_domain_logfiles(child)
             if not domains:
                 raise IOError
             # error: No domains found?
             for dom in domains:
-                self.log_files.append(dom)
+                logs.append(dom)
+        elif component == self.Component.CHILD:
+            logs.extend(self.get_child_logfiles())
+
+        for log in logs:
+            if self.rotated:
+                self.log_files.extend(self.get_rotated_logfiles(log))
+            else:
+                self.log_files.append(log)
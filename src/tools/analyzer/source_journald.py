@@ -1,46 +1,180 @@
+import json
+import logging
+
+from datetime import datetime, timezone
+
 from systemd import journal
 
 from sssd.source_reader import Reader
 
+logger = logging.getLogger()
+
 _EXE_PREFIX = "/usr/libexec/sssd/"
 _NSS_MATCH = _EXE_PREFIX + "sssd_nss"
 _PAM_MATCH = _EXE_PREFIX + "sssd_pam"
 _BE_MATCH = _EXE_PREFIX + "sssd_be"
+_CHILD_MATCHES = [_EXE_PREFIX + child for child in
+                  ("krb5_child", "ldap_child", "p11_child", "gpo_child",
+                   "selinux_child")]
 
 
 class Journald(Reader):
     """
     A class used to represent a Journald Reader
+
+    Args:
+        cursor_file -- file to persist the position of the last read
+           entry of each component in, the next run continues after it
     """
-    def __init__(self):
+    def __init__(self, cursor_file=None):
         super().__init__()
         self.reader = journal.Reader()
         self.reader.this_boot()
-        self.reader.seek_head()
+        self.cursor_file = cursor_file
+        self.component = None
+        self.functions = []
 
     def __iter__(self):
         """
         Yields:
             str: The next journal entry message, with timestamp if found
         """
-        self.reader.seek_head()
-        for entry in self.reader:
-            ts = entry['__REALTIME_TIMESTAMP']
-            msg = entry['MESSAGE']
-            if ts:
-                yield f'{ts}: {msg}'
+        for entry in self.entries():
+            yield self.format_entry(entry)
+
+    def search(self, matcher):
+        """
+        Match the raw entry messages, only matching entries are formatted
+
+        Yields:
+            str: The next matching journal entry message
+        """
+        for entry in self.entries():
+            if matcher.search(entry.get('MESSAGE', '')):
+                yield self.format_entry(entry)
+
+    def entries(self):
+        """
+        Position the reader and yield the journal entries of the time
+        window. The cursor of the last entry is persisted afterwards.
+
+        Yields:
+            dict: The next journal entry
+        """
+        until = None
+        if not self.seek_cursor():
+            if self.since is not None:
+                self.reader.seek_realtime(self.to_datetime(self.since))
             else:
-                yield msg
+                self.reader.seek_head()
+        if self.until is not None:
+            until = self.to_datetime(self.until)
 
-    def set_component(self, component, child):
+        cursor = None
+        try:
+            for entry in self.reader:
+                ts = entry.get('__REALTIME_TIMESTAMP')
+                if ts and until is not None and ts >= until:
+                    break
+                cursor = entry.get('__CURSOR', cursor)
+                yield entry
+        finally:
+            if cursor is not None:
+                self.save_cursor(cursor)
+
+    def format_entry(self, entry):
+        ts = entry.get('__REALTIME_TIMESTAMP')
+        msg = entry.get('MESSAGE', '')
+        if ts:
+            return f'{ts}: {msg}'
+        return msg
+
+    def load_cursors(self):
+        if self.cursor_file is None:
+            return {}
+        try:
+            with open(self.cursor_file) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def seek_cursor(self):
         """
-        Switch the reader to interact with a certain SSSD component
-        NSS, PAM, BE
+        Seek after the entry read last by the previous run
+
+        Returns:
+            True if the reader was positioned, otherwise False
+        """
+        if self.component is None:
+            return False
+        cursor = self.load_cursors().get(self.component.name)
+        if cursor is None:
+            return False
+        try:
+            self.reader.seek_cursor(cursor)
+            # the cursor entry itself was already read
+            self.reader.get_next()
+        except (OSError, ValueError) as err:
+            logger.warning(f"Could not seek to journal cursor {cursor}")
+            logger.warning(err)
+            return False
+        return True
+
+    def save_cursor(self, cursor):
+        if self.cursor_file is None or self.component is None:
+            return
+        cursors = self.load_cursors()
+        cursors[self.component.name] = cursor
+        try:
+            with open(self.cursor_file, 'w') as file:
+                json.dump(cursors, file)
+        except OSError as err:
+            logger.warning(f"Could not store journal cursor in "
+                           f"{self.cursor_file}")
+            logger.warning(err)
+
+    def to_datetime(self, timestamp):
+        """
+        Convert timestamp to a naive local datetime, as used by the
+        journal reader
+        """
+        utc = datetime.fromtimestamp(timestamp / 1000000, timezone.utc)
+        return utc.replace(tzinfo=None)
+
+    def add_matches(self):
+        """
+        Install the journal field matches of the current component and
+        filter. Matches of different fields are combined with AND,
+        matches of the same field with OR.
         """
         self.reader.flush_matches()
-        if component == self.Component.NSS:
+        self.reader.this_boot()
+        if self.component == self.Component.NSS:
             self.reader.add_match(_EXE=_NSS_MATCH)
-        elif component == self.Component.PAM:
+        elif self.component == self.Component.PAM:
             self.reader.add_match(_EXE=_PAM_MATCH)
-        elif component == self.Component.BE:
+        elif self.component == self.Component.BE:
             self.reader.add_match(_EXE=_BE_MATCH)
+        elif self.component == self.Component.CHILD:
+            for match in _CHILD_MATCHES:
+                self.reader.add_match(_EXE=match)
+        for function in self.functions:
+            self.reader.add_match(CODE_FUNC=function)
+
+    def set_filter(self, ids=None, functions=None, linked=None):
+        """
+        Push function filters down to CODE_FUNC journal field matches.
+        SSSD does not log the chain IDs as journal fields, ids are
+        matched against the message by search().
+        """
+        self.functions = list(functions or [])
+        self.add_matches()
+
+    def set_component(self, component, child):
+        """
+        Switch the reader to interact with a certain SSSD component
+        NSS, PAM, BE, CHILD
+        """
+        self.component = component
+        self.functions = []
+        self.add_matches()
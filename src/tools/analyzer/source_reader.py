@@ -3,6 +3,40 @@ from enum import Enum
 from abc import ABC, abstractmethod
 
 
+def search_partition(partition, matcher):
+    """
+    Search a single reader partition, executed in a worker process.
+
+    Returns:
+        List of matching lines
+    """
+    return list(partition.search(matcher))
+
+
+def load_source(args):
+    """
+    Load the source reader selected by the top-level options.
+
+    Args:
+        args (Namespace): argparse parsed arguments
+
+    Returns:
+        Instantiated source object
+    """
+    if args.source == "journald":
+        from sssd.source_journald import Journald
+        source = Journald(args.journal_cursor)
+    elif args.source == "archives":
+        from sssd.source_archives import Archives
+        source = Archives(args.logdir, args.host, args.rotated, args.jobs)
+    else:
+        from sssd.source_files import Files
+        source = Files(args.logdir, args.index, args.index_dir,
+                       args.rotated, args.jobs)
+    source.set_window(args.since, args.until)
+    return source
+
+
 class Reader(ABC):
     """
     An abstract class used to represent a source Reader
@@ -13,10 +47,13 @@ class Reader(ABC):
         NSS = 1   # NSS Responder
         PAM = 2   # PAM Responder
         BE = 3    # Backend
+        CHILD = 4  # Child helper processes, e.g. krb5_child
 
     @abstractmethod
-    def __init__(self):
-        pass
+    def __init__(self, jobs=1):
+        self.jobs = jobs
+        self.since = None
+        self.until = None
 
     @abstractmethod
     def __iter__(self):
@@ -25,3 +62,84 @@ class Reader(ABC):
     @abstractmethod
     def set_component(self):
         pass
+
+    def search(self, matcher):
+        """
+        Yield lines matching the provided matcher. Readers may override
+        this with a faster implementation than matching every line.
+
+        Args:
+            matcher (Matcher): compiled matcher
+
+        Yields:
+            str: matching lines
+        """
+        for line in self:
+            if matcher.search(line):
+                yield line
+
+    def set_filter(self, ids=None, functions=None, linked=None):
+        """
+        Hint the reader which lines are of interest. Readers which are able
+        to look lines up in an index may skip all other lines, the others
+        ignore the hint. The hint is reset by set_component().
+
+        Args:
+            ids (list of str): ids in the form 'CID#N' or 'RID#N'
+            functions (list of str): function names
+            linked (tuple): (responder, cid) tuple, include backend RIDs
+                linked to this responder client ID
+        """
+        pass
+
+    def set_window(self, since=None, until=None):
+        """
+        Restrict reading to lines logged in the time window, lines logged
+        before since or at or after until are skipped.
+
+        Args:
+            since (int): start of the window, see parse_timestamp()
+            until (int): end of the window (exclusive)
+        """
+        self.since = since
+        self.until = until
+
+    def partitions(self):
+        """
+        Split the reader into partitions which can be read independently,
+        e.g. one per log file. Every partition is a picklable Reader.
+
+        Returns:
+            List of Reader objects
+        """
+        return [self]
+
+    def map_partitions(self, func, *args):
+        """
+        Call func(partition, *args) for every partition. If the reader
+        has more than one partition and more than one job is allowed, the
+        calls are spread across a process pool, func must then be a
+        picklable module level function.
+
+        Yields:
+            Results of func in partition order
+        """
+        partitions = self.partitions()
+        if self.jobs <= 1 or len(partitions) <= 1:
+            for partition in partitions:
+                yield func(partition, *args)
+            return
+
+        # multiprocessing is slow to import, only do so when needed
+        from concurrent.futures import ProcessPoolExecutor
+
+        workers = min(self.jobs, len(partitions))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(func, partition, *args)
+                       for partition in partitions]
+            try:
+                for future in futures:
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
@@ -1,7 +1,41 @@
+import os
+import sys
 import argparse
+import importlib
 
-from sssd.modules import request
 from sssd.parser import SubparsersAction
+from sssd.log_record import parse_time
+
+# Analyzer modules: command, python module, class and help message. The
+# python module is imported only if the command is requested, the other
+# commands are listed in the help output only.
+MODULES = [
+    ('request', 'sssd.modules.request', 'RequestAnalyzer',
+     'Request tracking'),
+    ('latency', 'sssd.modules.latency', 'LatencyAnalyzer',
+     'Request latency'),
+    ('ldap', 'sssd.modules.ldap', 'LdapAnalyzer', 'LDAP operations'),
+    ('cache', 'sssd.modules.cache', 'CacheAnalyzer', 'Cache efficiency'),
+    ('clients', 'sssd.modules.clients', 'ClientsAnalyzer',
+     'Responder clients'),
+    ('dp', 'sssd.modules.dp', 'DataProviderAnalyzer',
+     'Data provider requests'),
+    ('db', 'sssd.modules.db', 'DatabaseAnalyzer', 'Log database'),
+    ('backtrace', 'sssd.modules.backtrace', 'BacktraceAnalyzer',
+     'Debug backtraces'),
+    ('diff', 'sssd.modules.diff', 'DiffAnalyzer', 'Regression diff'),
+    ('failover', 'sssd.modules.failover', 'FailoverAnalyzer',
+     'Failover and offline status'),
+]
+
+
+def time_arg(value):
+    """ argparse type of --since and --until """
+    try:
+        return parse_time(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time '{value}', use "
+                                         "'YYYY-MM-DD [HH:MM[:SS]]'")
 
 
 class Analyzer:
@@ -42,28 +76,48 @@ class Analyzer:
                                         help=opt.help_msg, action='store_true')
             if opt.opt_type is int:
                 parser.add_argument(opt.name, help=opt.help_msg,
-                                    type=int)
+                                    type=int, choices=opt.choices)
+            if opt.opt_type is str:
+                parser.add_argument(opt.name, help=opt.help_msg,
+                                    type=str, choices=opt.choices)
 
-    def load_modules(self, parser, parser_grp):
+    def load_modules(self, parser, parser_grp, argv=None):
         """
         Initialize analyzer modules from modules/*
 
+        Only the modules whose command is present on the command line are
+        imported and set up, the other commands get a placeholder parser
+        to be listed in the help output.
+
         Args:
             parser (ArgumentParser): Base parser object
             parser_grp (argparse.Action): Parser group that can have
                 additional parsers attached.
+            argv (list of str): command line arguments, sys.argv[1:] if
+                not provided
         """
-        # Currently only the 'request' module exists
-        req = request.RequestAnalyzer()
+        if argv is None:
+            argv = sys.argv[1:]
+        requested = set(argv)
         cli = Analyzer()
 
-        req.setup_args(parser_grp, cli)
+        for command, module_name, class_name, help_msg in MODULES:
+            if command not in requested:
+                parser_grp.add_parser(command, help=help_msg)
+                continue
+            module = importlib.import_module(module_name)
+            analyzer = getattr(module, class_name)()
+            analyzer.setup_args(parser_grp, cli)
 
-    def setup_args(self):
+    def setup_args(self, argv=None):
         """
         Top-level argument setup function.
         Setup analyzer argument parsers and subcommand parser/options.
 
+        Args:
+            argv (list of str): command line arguments, sys.argv[1:] if
+                not provided
+
         Returns:
             parser (ArgumentParser): Base parser object
         """
@@ -73,9 +127,36 @@ class Analyzer:
                                          'with SSSD log parsing',
                                          formatter_class=formatter)
         parser.add_argument('--source', default='files', choices=['files',
-                            'journald'])
+                            'journald', 'archives'])
         parser.add_argument('--logdir', default='/var/log/sssd/',
-                            help='SSSD Log directory to parse log files from')
+                            help='SSSD Log directory to parse log files from'
+                            '\nArchives source: directory of log archives '
+                            'and sosreports\nof many hosts, or a single one')
+        parser.add_argument('--host', action='append', default=None,
+                            help='Archives source: only read the logs of '
+                            'this host, may be\nrepeated')
+        parser.add_argument('--journal-cursor', default=None,
+                            help='Journald source: file to persist the last '
+                            'read position in, later runs only read newer '
+                            'entries')
+        parser.add_argument('--since', type=time_arg, default=None,
+                            help='Only read logs written at or after this '
+                            'time, YYYY-MM-DD [HH:MM[:SS]]')
+        parser.add_argument('--until', type=time_arg, default=None,
+                            help='Only read logs written before this time, '
+                            'YYYY-MM-DD [HH:MM[:SS]]')
+        parser.add_argument('--rotated', action='store_true',
+                            help='Include rotated and compressed log files')
+        parser.add_argument('--jobs', '-j', type=int,
+                            default=os.cpu_count() or 1,
+                            help='Number of worker processes used to search '
+                            'log files (default: number of CPUs)')
+        parser.add_argument('--index', action='store_true',
+                            help='Maintain and use on-disk offset indexes '
+                            'of the log files')
+        parser.add_argument('--index-dir', default=None,
+                            help='Directory to store log file indexes in '
+                            '(default ~/.cache/sssd/analyze)')
 
         # Modules parser group
         subparser = parser.add_subparsers(title=None,
@@ -84,7 +165,7 @@ class Analyzer:
         parser_grp = subparser.add_parser_group('Modules')
 
         # Load modules, subcommands are added in module.setup_args()
-        self.load_modules(parser, parser_grp)
+        self.load_modules(parser, parser_grp, argv)
 
         return parser
 
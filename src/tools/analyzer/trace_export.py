@@ -0,0 +1,264 @@
+import re
+import json
+
+from collections import deque
+
+from sssd.matcher import Matcher
+from sssd.log_record import LogRecord
+from sssd.child_processes import ChildProcesses, child_program
+
+_CR_RE = re.compile(r'^CR #([0-9]+): ')
+_NEW_CR_RE = re.compile(r"New request \[CID #([0-9]+)\] '(.*)'")
+_FINISHED_RE = re.compile(r'Finished: (.*)')
+_CLIENT_RE = re.compile(r'\[cmd (.*)\]\[uid ([0-9]+)\]')
+_NEW_DP_RE = re.compile(r'^(DP Request \[.*\]): REQ_TRACE: New request\.'
+                        r'(?: \[(.* CID #[0-9]+)\])?')
+_DONE_DP_RE = re.compile(r'Request handler finished \[-?[0-9]+\]: (.*)')
+_SEARCH_RE = re.compile(r'calling ldap_search_ext with \[(.*)\]\[(.*)\]\.$')
+_RESULT_RE = re.compile(r'Search result: (.*)\((-?[0-9]+)\)')
+# logged by ldb itself through ldb_debug_messages()
+_LDB_RE = re.compile(r'^(start|commit|cancel) ldb transaction '
+                     r'\(nesting: ([0-9]+)\)')
+
+
+class Span:
+    """
+    A time span of a single process, exported as a complete event
+    """
+    __slots__ = ('process', 'name', 'cat', 'start', 'end', 'args')
+
+    def __init__(self, process, name, cat, start, args=None):
+        self.process = process
+        self.name = name
+        self.cat = cat
+        self.start = start
+        self.end = None
+        self.args = args or {}
+
+
+class TraceExporter:
+    """
+    Build Chrome trace-event JSON, as loaded by Perfetto or
+    chrome://tracing, from SSSD debug log lines.
+
+    Responder cache_req requests and backend data provider requests are
+    exported as spans, LDAP searches, sysdb transactions and the runs of
+    child helper processes as sub-spans. Child runs are placed on the track
+    of the process which forked them, if its fork line was added.
+    Every process gets its own track. Spans overlapping without nesting,
+    e.g. concurrent requests, are laid out in separate rows of the track.
+
+    Lines can be added in any order of processes, but the lines of every
+    process must be in the order they were logged.
+    """
+    # Lines needed to build the spans, to search sources with
+    PATTERNS = [r'\[cmd .*connected',
+                r'CR #[0-9]+: REQ_TRACE: New request \[CID #',
+                r'CR #[0-9]+: Finished: ',
+                r'REQ_TRACE: New request\.',
+                r'Request handler finished',
+                r'calling ldap_search_ext with',
+                r'Search result: ',
+                r'ldb transaction \(nesting',
+                r'for pid \[']
+    LITERALS = ['[cmd', 'New request', 'Finished: ', 'handler finished',
+                'calling ldap_search_ext', 'Search result: ',
+                'ldb transaction', 'for pid [']
+
+    def __init__(self):
+        self.spans = []
+        # (host, cid) -> command of the client
+        self.commands = {}
+        self.active = {}
+        self.searches = {}
+        self.children = ChildProcesses()
+        self.child_spans = {}
+
+    @classmethod
+    def matcher(cls):
+        """ Matcher of the lines needed by the exporter """
+        return Matcher(cls.PATTERNS, cls.LITERALS)
+
+    def begin(self, key, span):
+        """ Start a span, a still running span of the key is dropped """
+        self.active[key] = span
+
+    def end(self, key, timestamp, **args):
+        """ End the running span of the key, if any """
+        span = self.active.pop(key, None)
+        if span is None:
+            return None
+        span.end = timestamp
+        span.args.update(args)
+        self.spans.append(span)
+        return span
+
+    def add(self, line):
+        """
+        Process a single log line
+
+        Args:
+            line (str): log line, lines not describing spans are ignored
+        """
+        record = LogRecord(line)
+        if record.backtrace or not record.valid:
+            return
+        process = record.component or 'journal'
+        msg = record.message
+        timestamp = record.timestamp
+
+        program = child_program(process)
+        if program is not None:
+            self.add_child(record, program)
+            return
+        self.children.add_parent(line)
+
+        match = _CR_RE.match(msg)
+        if match:
+            key = (process, 'CR', match.group(1))
+            if 'New request' in msg:
+                found = _NEW_CR_RE.search(msg)
+                if found:
+                    cid = int(found.group(1))
+                    args = {'cid': cid, 'cr': int(match.group(1))}
+                    command = self.commands.get((record.host, cid))
+                    if command is not None:
+                        args['command'] = command
+                    self.begin(key, Span(process, found.group(2),
+                                         'cache_req', timestamp, args))
+                return
+            found = _FINISHED_RE.search(msg)
+            if found:
+                self.end(key, timestamp, result=found.group(1))
+            return
+
+        match = _LDB_RE.match(msg)
+        if match:
+            key = (process, 'ldb', match.group(2))
+            if match.group(1) == 'start':
+                self.begin(key, Span(process, 'sysdb transaction', 'sysdb',
+                                     timestamp))
+            else:
+                self.end(key, timestamp, result=match.group(1))
+            return
+
+        match = _CLIENT_RE.search(msg)
+        if match:
+            if record.cid is not None:
+                self.commands[(record.host, record.cid)] = match.group(1)
+            return
+
+        key = (process, 'RID', record.rid)
+        if 'REQ_TRACE: New request.' in msg:
+            match = _NEW_DP_RE.search(msg)
+            if match:
+                args = {'rid': record.rid}
+                if match.group(2):
+                    args['client'] = match.group(2)
+                self.begin(key, Span(process, match.group(1), 'dp',
+                                     timestamp, args))
+            return
+
+        match = _DONE_DP_RE.search(msg)
+        if match:
+            self.end(key, timestamp, result=match.group(1))
+            return
+
+        # concurrent searches of a request are paired in issue order
+        match = _SEARCH_RE.search(msg)
+        if match:
+            span = Span(process, 'ldap search', 'ldap', timestamp,
+                        {'rid': record.rid, 'filter': match.group(1),
+                         'base': match.group(2)})
+            self.searches.setdefault(key, deque()).append(span)
+            return
+
+        match = _RESULT_RE.search(msg)
+        if match:
+            queue = self.searches.get(key)
+            if queue:
+                span = queue.popleft()
+                span.end = timestamp
+                span.args['result'] = match.group(1)
+                self.spans.append(span)
+
+    def add_child(self, record, program):
+        """ Extend the span of a child process run by a child line """
+        parent = self.children.parent(record)
+        key = (record.component, parent)
+        span = self.child_spans.get(key)
+        if span is None:
+            args = {'pid': program[1]}
+            process = record.component
+            if parent is not None:
+                process, args['chain'] = parent
+            span = Span(process, record.component, 'child',
+                        record.timestamp, args)
+            self.child_spans[key] = span
+        span.end = record.timestamp
+
+    def layout(self, spans):
+        """
+        Assign the spans of a single process to rows, so that spans of a
+        row are either disjoint or nested.
+
+        Args:
+            spans (list of Span): spans of a single process
+
+        Returns:
+            List of (row, span) tuples
+        """
+        # outer spans first if several start at the same time
+        spans = sorted(spans, key=lambda s: (s.start, s.start - s.end))
+        rows = []
+        placed = []
+        for span in spans:
+            for row, stack in enumerate(rows):
+                while stack and stack[-1] <= span.start:
+                    stack.pop()
+                if not stack or stack[-1] >= span.end:
+                    break
+            else:
+                row = len(rows)
+                rows.append([])
+            rows[row].append(span.end)
+            placed.append((row, span))
+        return placed
+
+    def events(self):
+        """
+        Returns:
+            List of trace events of the finished spans
+        """
+        processes = {}
+        for span in self.spans + list(self.child_spans.values()):
+            processes.setdefault(span.process, []).append(span)
+
+        events = []
+        for pid, process in enumerate(sorted(processes), 1):
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                           'args': {'name': process}})
+            rows = set()
+            for row, span in self.layout(processes[process]):
+                rows.add(row)
+                events.append({'name': span.name, 'cat': span.cat,
+                               'ph': 'X', 'ts': span.start,
+                               'dur': span.end - span.start,
+                               'pid': pid, 'tid': row + 1,
+                               'args': span.args})
+            for row in sorted(rows):
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                               'tid': row + 1,
+                               'args': {'name': f'{process} #{row + 1}'}})
+        return events
+
+    def write(self, file):
+        """
+        Write the trace in JSON object format
+
+        Args:
+            file (file object): text file to write to
+        """
+        json.dump({'traceEvents': self.events(), 'displayTimeUnit': 'ms'},
+                  file)
+        file.write('\n')